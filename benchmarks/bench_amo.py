@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+import pycryptosat
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+from sat_encoding import AMO_ENCODINGS, VariableMap
+from run import PACKAGE_TYPE
+from bench_cnf import synthetic_graph
+
+
+def encode_and_solve(graph):
+    variables = VariableMap(graph.node_dict)
+    clauses = [[variables.var(-1)]]
+
+    stime = time.time()
+    graph._get_cnf_clauses(variables, clauses, -1)
+    encode_cost = time.time() - stime
+
+    stime = time.time()
+    solver = pycryptosat.Solver()
+    for clause in clauses:
+        solver.add_clause(clause)
+    sat, solution = solver.solve()
+    solve_cost = time.time() - stime
+
+    if sat:
+        # at most one version of each package in the solution
+        for nid, children in graph.degree_table.items():
+            if graph.node_type[nid] == PACKAGE_TYPE and sum(1 for child in children if solution[variables.var(child)]) > 1:
+                print('Error: multiple versions of package {} by {}'.format(nid, graph.amo_encoding))
+                sys.exit(1)
+    return sat, len(variables), len(clauses), graph.sat_stats['amo_clauses'], encode_cost, solve_cost
+
+
+def main():
+    """Encode and solve synthetic require graphs with each at-most-one encoding.
+    Usage
+    -----
+    python bench_amo.py <n_packages> <n_versions> <n_requires>
+    -----
+    Packages like boto3 have over 1000 versions, 10 packages of 1000 versions by default.
+    n_requires (Optional): packages required by each version, 0 by default to leave only
+    the at-most-one constraints of the package versions.
+    """
+
+    n_packages = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    n_versions = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    n_requires = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+    print('{} packages with {} versions each'.format(n_packages, n_versions))
+    print('{:>12} {:>6} {:>10} {:>10} {:>12} {:>10} {:>10}'.format('encoding', 'sat', 'variables', 'clauses', 'amo clauses', 'encode(s)', 'solve(s)'))
+    results = {}
+    for encoding in ['auto'] + sorted(AMO_ENCODINGS):
+        graph = synthetic_graph(n_packages, n_versions, n_requires, amo_encoding=encoding)
+        results[encoding] = encode_and_solve(graph)
+        print('{:>12} {:>6} {:>10} {:>10} {:>12} {:>10.3f} {:>10.3f}'.format(encoding, *results[encoding]))
+
+    if len(set(item[0] for item in results.values())) > 1:
+        print('Error: the encodings disagree on satisfiability.')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
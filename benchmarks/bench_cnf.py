@@ -0,0 +1,145 @@
+import os
+import sys
+import time
+import random
+import itertools
+from packaging.specifiers import SpecifierSet
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+from run import RequireGraph, PACKAGE_TYPE
+from kg_records import KGNode, KGRelationship
+from sat_encoding import VariableMap
+
+
+def synthetic_records(n_packages, n_versions, n_requires=3, seed=0):
+    """[[nodes, relationships]] of n_packages packages with n_versions versions each,
+    every version requires n_requires random packages, and the candidates of 10% of them."""
+    rng = random.Random(seed)
+    packages = [KGNode(i, ['Package'], {'name': 'pkg{}'.format(i)}) for i in range(n_packages)]
+    nodes = list(packages)
+    relationships = []
+    next_id = n_packages
+    for package in packages:
+        for v in range(n_versions):
+            status = rng.choice(['Success', 'Success', 'Unknown', 'Fail'])
+            version = KGNode(next_id, ['Version'], {'version': '{}.{}'.format(v // 4, v % 4), 'install_status': status})
+            next_id += 1
+            nodes.append(version)
+            relationships.append(KGRelationship(package, version, 'HAS_VERSION', {}))
+            for required in rng.sample(packages, n_requires):
+                if required is not package:
+                    spec = rng.choice(['', '>={}.0'.format(rng.randint(0, n_versions // 8)), '<{}.0'.format(rng.randint(1, n_versions // 4 + 1))])
+                    relationships.append(KGRelationship(version, required, 'REQUIRES', {'requirement': spec}))
+
+    candidates = {'top{}'.format(i): {'pkg{}'.format(i): set()} for i in range(0, n_packages, max(1, n_packages // 10))}
+    return candidates, [[nodes, relationships]]
+
+
+def synthetic_graph(n_packages, n_versions, n_requires=3, seed=0, amo_encoding='pairwise', preprocess=False):
+    """A require subgraph of n_packages packages with n_versions versions each,
+    every version requires n_requires random packages."""
+    candidates, records = synthetic_records(n_packages, n_versions, n_requires, seed)
+    return RequireGraph(candidates, records, amo_encoding, preprocess=preprocess)
+
+
+class LinearScanEncoder(object):
+    """The CNF encoder before VariableMap: var_list.index for every literal, recursive DFS."""
+    def __init__(self, graph):
+        self.graph = graph
+
+    def encode(self):
+        var_list = list(self.graph.node_dict)
+        has_visit = {item: False for item in var_list}
+        var_list.insert(0, None)
+        clauses = [[var_list.index(-1)]]
+        self._get_cnf_clauses(has_visit, var_list, clauses, -1)
+        return clauses
+
+    def _get_cnf_clauses(self, has_visit, var_list, clauses, node):
+        g = self.graph
+        if has_visit[node]:
+            return
+
+        has_visit[node] = True
+        var_node = var_list.index(node)
+        if g.is_conjunction[node]:
+            for nid, req in g.degree_table[node].items():
+                clauses.append([-var_node, var_list.index(nid)])
+                if g.node_type[nid] == PACKAGE_TYPE:
+                    forbidden_child = [item for item in g.degree_table[nid] if g.node_dict[item]['version'] not in SpecifierSet(req, prereleases=True)]
+                    for child in forbidden_child:
+                        clauses.append([-var_node, -var_list.index(child)])
+        elif len(g.degree_table[node]) > 0:
+            child_index = [var_list.index(item) for item in g.degree_table[node]]
+            clauses.append([-var_node] + child_index)
+            if g.node_type[node] == PACKAGE_TYPE:
+                for nid in g.degree_table[node]:
+                    if g.node_dict[nid]['install_status'] == 'Fail':
+                        clauses.append([-var_list.index(nid)])
+                for comb in itertools.combinations(child_index, 2):
+                    clauses.append([-comb[0], -comb[1]])
+            else:
+                optional_child = []
+                for nid in g.degree_table[node]:
+                    req = g.degree_table[node][nid]
+                    if isinstance(req, set):
+                        package_index = var_list.index(nid)
+                        index_list = [var_list.index(item) for item in req]
+                        for version_index in index_list:
+                            clauses.append([-version_index, package_index])
+                        optional_child.extend(index_list)
+                if len(optional_child) > 0:
+                    optional_child.extend([-var_node])
+                    clauses.append(optional_child)
+
+        for nid in g.degree_table[node]:
+            self._get_cnf_clauses(has_visit, var_list, clauses, nid)
+
+
+def encode(graph):
+    variables = VariableMap(graph.node_dict)
+    clauses = [[variables.var(-1)]]
+    graph._get_cnf_clauses(variables, clauses, -1)
+    return clauses
+
+
+def main():
+    """Encode synthetic require graphs of growing size with VariableMap and with the linear scan.
+    Usage
+    -----
+    python bench_cnf.py <max_versions> <max_linear_versions>
+    -----
+    max_linear_versions (Optional): the largest graph for the quadratic encoder, 20000 by default.
+    """
+
+    max_versions = int(sys.argv[1]) if len(sys.argv) > 1 else 40000
+    max_linear_versions = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    # the recursive encoder walks the whole graph in depth
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10 * max_linear_versions))
+
+    n_versions = 10
+    n_packages = 250
+    print('{:>10} {:>10} {:>10} {:>14} {:>14} {:>10}'.format('packages', 'versions', 'clauses', 'VariableMap(s)', 'linear scan(s)', 'speedup'))
+    while n_packages * n_versions <= max_versions:
+        graph = synthetic_graph(n_packages, n_versions)
+
+        stime = time.time()
+        clauses = encode(graph)
+        cost = time.time() - stime
+
+        linear_cost = None
+        if n_packages * n_versions <= max_linear_versions:
+            stime = time.time()
+            linear_clauses = LinearScanEncoder(graph).encode()
+            linear_cost = time.time() - stime
+            if linear_clauses != clauses:
+                print('Error: different clauses from the linear scan encoder.')
+                sys.exit(1)
+
+        print('{:>10} {:>10} {:>10} {:>14.3f} {:>14} {:>10}'.format(n_packages, n_packages * n_versions, len(clauses), cost,
+              '-' if linear_cost is None else '{:.3f}'.format(linear_cost), '-' if linear_cost is None else '{:.1f}x'.format(linear_cost / cost)))
+        n_packages *= 2
+
+
+if __name__ == '__main__':
+    main()
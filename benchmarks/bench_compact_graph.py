@@ -0,0 +1,62 @@
+import os
+import sys
+import time
+import pickle
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+from run import RequireGraph
+from kg_records import CompactSubgraph
+from bench_cnf import synthetic_records
+
+
+def allocated(build):
+    """(result, bytes still allocated by build)"""
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def main():
+    """Keep synthetic require subgraphs of growing size as KGNode and KGRelationship records and
+    as CompactSubgraph, and build the RequireGraph of each.
+    Usage
+    -----
+    python bench_compact_graph.py <max_versions> <n_requires>
+    -----
+    max_versions (Optional): the largest graph, 80000 versions by default.
+    n_requires (Optional): packages required by each version, 3 by default.
+    """
+
+    max_versions = int(sys.argv[1]) if len(sys.argv) > 1 else 80000
+    n_requires = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    n_versions = 10
+    n_packages = 500
+    print('{:>10} {:>10} {:>12} {:>12} {:>10} {:>12} {:>12}'.format('versions', 'format', 'memory(MB)', 'pickle(MB)', 'ratio', 'graph(MB)', 'graph(s)'))
+    while n_packages * n_versions <= max_versions:
+        candidates, records = synthetic_records(n_packages, n_versions, n_requires)
+        records, records_size = allocated(lambda: pickle.loads(pickle.dumps(records)))
+        compact, compact_size = allocated(lambda: CompactSubgraph.from_records(records))
+
+        graphs = []
+        for name, requires_info, size in (('records', records, records_size), ('compact', compact, compact_size)):
+            stime = time.time()
+            RequireGraph(candidates, requires_info, preprocess=False)
+            cost = time.time() - stime
+            graph, graph_size = allocated(lambda: RequireGraph(candidates, requires_info, preprocess=False))
+            graphs.append(graph)
+            print('{:>10} {:>10} {:>12.1f} {:>12.1f} {:>10} {:>12.1f} {:>12.3f}'.format(
+                  n_packages * n_versions if name == 'records' else '', name, size / 1024.0 / 1024.0, len(pickle.dumps(requires_info)) / 1024.0 / 1024.0,
+                  '' if name == 'records' else '{:.1f}x'.format(records_size / float(compact_size)), graph_size / 1024.0 / 1024.0, cost))
+
+        if graphs[0].degree_table != graphs[1].degree_table or graphs[0].sorted_degree_table != graphs[1].sorted_degree_table:
+            print('Error: different RequireGraph from CompactSubgraph.')
+            sys.exit(1)
+        n_packages *= 2
+
+
+if __name__ == '__main__':
+    main()
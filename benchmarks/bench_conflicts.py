@@ -0,0 +1,105 @@
+import io
+import os
+import sys
+import time
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+from run import RequireGraph, subGraph
+from kg_records import KGNode, KGRelationship
+
+
+def conflict_graph(n_modules, n_candidates, depth, learn_conflicts=True, backjump=False):
+    """A require subgraph where the same conflict is met again and again: a package pins
+    base==1.0, and n_modules modules have n_candidates candidates each requiring mid, whose
+    version requires a chain of depth packages and base>=5.0. The last candidate of each
+    module does not require mid."""
+    nodes = []
+    relationships = []
+
+    def package(name, versions):
+        node = KGNode(len(nodes), ['Package'], {'name': name})
+        nodes.append(node)
+        version_nodes = []
+        for version in versions:
+            version_node = KGNode(len(nodes), ['Version'], {'version': version, 'install_status': 'Success'})
+            nodes.append(version_node)
+            version_nodes.append(version_node)
+            relationships.append(KGRelationship(node, version_node, 'HAS_VERSION', {}))
+        return node, version_nodes
+
+    def requires(version_node, package_node, spec=''):
+        relationships.append(KGRelationship(version_node, package_node, 'REQUIRES', {'requirement': spec}))
+
+    base, _ = package('base', ['{}.0'.format(i) for i in range(10)])
+    _, pin_versions = package('pin', ['1.0'])
+    requires(pin_versions[0], base, '==1.0')
+
+    chain = [package('chain{}'.format(i), ['1.0']) for i in range(depth)]
+    for (_, versions), (next_package, _) in zip(chain, chain[1:]):
+        requires(versions[0], next_package)
+    mid, mid_versions = package('mid', ['1.0'])
+    if depth > 0:
+        requires(mid_versions[0], chain[0][0])
+    requires(mid_versions[0], base, '>=5.0')
+
+    candidates = {'pinned': {'pin': set()}}
+    for k in range(n_modules):
+        module = {}
+        for j in range(n_candidates):
+            _, versions = package('cand{}_{}'.format(k, j), ['1.0'])
+            requires(versions[0], mid)
+            # different requirement hints, so that the candidates are not skipped after a failure
+            module['cand{}_{}'.format(k, j)] = '>=0.{}'.format(j)
+        package('ok{}'.format(k), ['1.0'])
+        module['ok{}'.format(k)] = set()
+        candidates['module{}'.format(k)] = module
+    return RequireGraph(candidates, [[nodes, relationships]], learn_conflicts=learn_conflicts, backjump=backjump, preprocess=False)
+
+
+def main():
+    """Run the heuristic algorithm with and without conflict learning and backjumping, and the
+    SAT solver, on graphs repeating a conflict under a chain of packages.
+    Usage
+    -----
+    python bench_conflicts.py <n_modules> <n_candidates> <max_depth>
+    -----
+    n_modules (Optional): 20 by default.
+    n_candidates (Optional): failing candidates of each module, 10 by default.
+    max_depth (Optional): the longest chain of packages, 800 by default.
+    """
+
+    n_modules = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    n_candidates = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    max_depth = int(sys.argv[3]) if len(sys.argv) > 3 else 800
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 20 * max_depth))
+
+    print('{:>6} {:>8} {:>10} {:>8} {:>10} {:>8} {:>10} {:>10} {:>10}'.format('depth', 'learn', 'backjump', 'success', 'nodes', 'conflicts', 'prunes', 'backjumps', 'time(s)'))
+    depth = 100
+    while depth <= max_depth:
+        results = []
+        for learn_conflicts, backjump in ((False, False), (True, False), (True, True)):
+            graph = conflict_graph(n_modules, n_candidates, depth, learn_conflicts, backjump)
+            subgraph = subGraph({}, {})
+            stime = time.time()
+            success = graph._heuristic_method(subgraph, -1)
+            cost = time.time() - stime
+            subgraph.clear_graph()
+            results.append((success, subgraph.degree_table))
+            print('{:>6} {:>8} {:>10} {:>8} {nodes:>10} {conflicts:>8} {prunes:>10} {backjumps:>10} {:>10.3f}'.format(
+                  depth, str(learn_conflicts), str(backjump), str(success), cost, **graph.heuristic_stats))
+        if any(item != results[0] for item in results[1:]):
+            print('Error: different results with conflict learning.')
+            sys.exit(1)
+
+        graph = conflict_graph(n_modules, n_candidates, depth)
+        stime = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            sat_graph = graph._sat_solver()
+        print('{:>6} {:>19} {:>8} {:>10} {variables:>8} vars {clauses} clauses {:>10.3f}'.format(
+              depth, 'SAT solver', str(sat_graph is not None), '', time.time() - stime, **graph.sat_stats))
+        depth *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import resource
+import tempfile
+import contextlib
+import subprocess
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'build_KG'))
+from kg_store import EmbeddedKG
+from transfer_csv.knowledge2csv import CsvTransformer
+from bench_module_trees import csv_size
+
+
+MODES = ('legacy', 'streaming', 'gzip')
+
+
+def write_data(data_dir, n_packages, n_versions, n_requires, n_attrs, seed=0):
+    """Installation data of n_packages packages of n_versions versions, in the layout read by
+    CsvTransformer.generate_csv. Each version requires n_requires packages, in the data or
+    unknown, and has a few modules with n_attrs attributes of its own."""
+    rng = random.Random(seed)
+    for p in range(n_packages):
+        package = 'pkg{}'.format(p)
+        p_dir = os.path.join(data_dir, package)
+        os.makedirs(p_dir)
+        with open(os.path.join(p_dir, 'exit_status.json'), 'w') as f:
+            json.dump({}, f)
+        for v in range(n_versions):
+            version = '{}.{}'.format(v // 10, v % 10)
+            v_dir = os.path.join(p_dir, version)
+            os.makedirs(v_dir)
+            with open(os.path.join(v_dir, 'LABEL'), 'w') as f:
+                f.write('')
+            requires = []
+            for _ in range(n_requires):
+                name = 'pkg{}'.format(rng.randrange(n_packages)) if rng.random() < 0.8 else 'unknown{}'.format(rng.randrange(n_packages))
+                requires.append(name + rng.choice(['', '>=1.0', '<2.0,>=0.5', '!=1.1']))
+            modules = [package, '{}.core'.format(package), '{}.core.utils'.format(package)]
+            attrs = {module: ['{}_{}_{}'.format(module.replace('.', '_'), version, i) for i in range(n_attrs // len(modules))] for module in modules}
+            with open(os.path.join(v_dir, 'data.json'), 'w') as f:
+                json.dump({'Requires': requires, 'Modules': modules, 'Attrs': attrs}, f)
+            with open(os.path.join(v_dir, 'import_fail.json'), 'w') as f:
+                json.dump({}, f)
+
+
+def build(mode, data_dir, csv_dir):
+    """Build the CSV files in this process, the stats as a JSON line."""
+    tracemalloc.start()
+    stime = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        transformer = CsvTransformer(csv_dir, '/neo4j', streaming=(mode != 'legacy'), compress=(mode == 'gzip'))
+        transformer.generate_csv(data_dir)
+        transformer.close()
+    cost = time.time() - stime
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # ru_maxrss is in KiB on Linux
+    print(json.dumps({'build': cost, 'peak': peak, 'rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}))
+
+
+def main():
+    """Build the CSV files of packages with requirements by the former CsvTransformer, by
+    streaming (CsvTransformer streaming) and by streaming into gzip files (compress), each
+    mode in its own process. Each mode is checked to build the same KG with a lower peak than
+    the former CsvTransformer; the gzip mode holds the state of a zlib compressor (about 0.26 MB)
+    besides, so it only takes less memory from about a thousand versions on.
+    Usage
+    -----
+    python bench_csv_transformer.py <n_packages> <n_versions> <n_requires> <n_attrs>
+    -----
+    n_packages (Optional): packages, 200 by default.
+    n_versions (Optional): versions of each package, 20 by default.
+    n_requires (Optional): requirements of each version, 5 by default.
+    n_attrs (Optional): distinct attributes of each version, 30 by default.
+    """
+
+    if len(sys.argv) > 1 and sys.argv[1] == '--build':
+        build(*sys.argv[2:5])
+        return
+
+    n_packages = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    n_versions = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    n_requires = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    n_attrs = int(sys.argv[4]) if len(sys.argv) > 4 else 30
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        data_dir = os.path.join(work_dir, 'data')
+        write_data(data_dir, n_packages, n_versions, n_requires, n_attrs)
+
+        print('{:>10} {:>10} {:>10} {:>10} {:>10} {:>10}'.format('versions', 'by', 'csv(MB)', 'build(s)', 'peak(MB)', 'rss(MB)'))
+        counts = []
+        peaks = {}
+        for mode in MODES:
+            csv_dir = os.path.join(work_dir, mode)
+            output = subprocess.check_output([sys.executable, os.path.abspath(__file__), '--build', mode, data_dir, csv_dir])
+            stats = json.loads(output.decode().strip().splitlines()[-1])
+            peaks[mode] = stats['peak']
+            with contextlib.redirect_stdout(io.StringIO()):
+                counts.append(EmbeddedKG(csv_dir).counts)
+            print('{:>10} {:>10} {:>10.2f} {:>10.3f} {:>10.2f} {:>10.2f}'.format(
+                  n_packages * n_versions, mode, csv_size(csv_dir) / 1024.0 / 1024.0, stats['build'], stats['peak'] / 1024.0 / 1024.0, stats['rss'] / 1024.0 / 1024.0))
+        if any(item != counts[0] for item in counts[1:]):
+            print('Error: different knowledge graphs.')
+            sys.exit(1)
+        if any(peaks[mode] >= peaks['legacy'] for mode in MODES[1:]):
+            print('Error: streaming takes more memory than the former CsvTransformer.')
+            sys.exit(1)
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
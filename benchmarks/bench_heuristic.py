@@ -0,0 +1,208 @@
+import os
+import sys
+import time
+import copy
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+from run import RequireGraph, subGraph, MODULE_TYPE, VERSION_TYPE
+from kg_records import KGNode, KGRelationship
+
+
+def deep_graph(depth, n_versions, seed=0, graph_class=RequireGraph):
+    """A require subgraph of a chain of depth packages with n_versions versions each: every
+    version requires the next package, and some versions an upper bound of a later package,
+    so that the heuristic algorithm replaces versions it has selected."""
+    rng = random.Random(seed)
+    packages = [KGNode(i, ['Package'], {'name': 'pkg{}'.format(i)}) for i in range(depth)]
+    nodes = list(packages)
+    relationships = []
+    next_id = depth
+    for i, package in enumerate(packages):
+        for v in range(n_versions):
+            status = rng.choice(['Success', 'Success', 'Unknown', 'Fail'])
+            version = KGNode(next_id, ['Version'], {'version': '{}.{}'.format(v // 4, v % 4), 'install_status': status})
+            next_id += 1
+            nodes.append(version)
+            relationships.append(KGRelationship(package, version, 'HAS_VERSION', {}))
+            if i + 1 < depth:
+                spec = rng.choice(['', '', '>={}.0'.format(rng.randint(0, n_versions // 8))])
+                relationships.append(KGRelationship(version, packages[i+1], 'REQUIRES', {'requirement': spec}))
+            if i + 2 < depth and rng.random() < 0.02:
+                later = packages[rng.randint(i + 2, min(depth - 1, i + 5))]
+                spec = '<{}.0'.format(rng.randint(n_versions // 8 + 1, n_versions // 4))
+                relationships.append(KGRelationship(version, later, 'REQUIRES', {'requirement': spec}))
+
+    # modules of a broken package and a package of the chain, from the end of the chain: the
+    # broken package is tried first, fails and is rolled back
+    candidates = {}
+    for i in reversed(range(0, depth, 10)):
+        broken = KGNode(next_id, ['Package'], {'name': 'broken{}'.format(i)})
+        version = KGNode(next_id + 1, ['Version'], {'version': '1.0', 'install_status': 'Success'})
+        next_id += 2
+        nodes.extend([broken, version])
+        relationships.append(KGRelationship(broken, version, 'HAS_VERSION', {}))
+        relationships.append(KGRelationship(version, packages[i], 'REQUIRES', {'requirement': '<0.0'}))
+        # a requirement hint: candidates of the same requirement are skipped after a failure
+        candidates['top{}'.format(i)] = {'broken{}'.format(i): '>=1.0', 'pkg{}'.format(i): set()}
+    return graph_class(candidates, [[nodes, relationships]], preprocess=False)
+
+
+class CopyingSubGraph(subGraph):
+    """subGraph before the trail: deep copies on every visit."""
+    def copy_graph(self):
+        return CopyingSubGraph(copy.deepcopy(self.degree_table), copy.deepcopy(self.in_table))
+
+    def set_graph(self, graph):
+        self.degree_table = copy.deepcopy(graph.degree_table)
+        self.in_table = copy.deepcopy(graph.in_table)
+
+
+class CopyingRequireGraph(RequireGraph):
+    """The heuristic algorithm on a copy of the subgraph at every node."""
+    def _heuristic_method(self, subgraph, node_id, father_id=None):
+        temp_subgraph = subgraph.copy_graph()
+
+        # save to temp_subgraph
+        if node_id not in temp_subgraph.degree_table:
+            temp_subgraph.degree_table[node_id] = set()
+            temp_subgraph.in_table[node_id] = set()
+        if father_id is not None:
+            temp_subgraph.degree_table[father_id].add(node_id)
+            temp_subgraph.in_table[node_id].add(father_id)
+
+        if self.is_conjunction[node_id]:
+            # root or version
+            for child in self.sorted_degree_table[node_id]:
+                if not self._heuristic_method(temp_subgraph, child, node_id):
+                    # Maintain the original state
+                    return False
+            
+            subgraph.set_graph(temp_subgraph)
+            return True
+        else:
+            # module or package
+            all_children = None
+            if self.node_type[node_id] == MODULE_TYPE:
+                all_children = self.sorted_degree_table[node_id]
+            elif len(self.degree_table[node_id]) == 0:
+                # unknown package
+                subgraph.set_graph(temp_subgraph)
+                return True
+            else:
+                # delete all fail versions
+                all_children = [item for item in self.sorted_degree_table[node_id] if self.node_dict[item]['install_status'] != 'Fail']
+
+            optional_children = self._get_optional_children_id(all_children, temp_subgraph, node_id)
+            if len(optional_children) > 0:
+                current_child = None
+                for child in self.degree_table[node_id]:
+                    if child in temp_subgraph.degree_table and len(temp_subgraph.in_table[child]) > 0:
+                        current_child = child
+                        break
+                
+                if current_child is not None:
+                    if self.node_type[node_id] == MODULE_TYPE:
+                        # virtual module node: move the current_child to first index
+                        optional_children.remove(current_child)
+                        optional_children.insert(0, current_child)
+                    elif current_child in optional_children:
+                        # package node: keep the version
+                        if current_child not in temp_subgraph.degree_table[node_id]:
+                            temp_subgraph.degree_table[node_id].add(current_child)
+                            temp_subgraph.in_table[current_child].add(node_id)
+                        subgraph.set_graph(temp_subgraph)
+                        return True
+                    else:
+                        # package node: delete the current version
+                        temp_subgraph.degree_table[node_id].remove(current_child)
+                        temp_subgraph.in_table[current_child].remove(node_id)
+                        check_list = [current_child]
+                        while len(check_list) > 0:
+                            record_list = []
+                            for item in check_list:
+                                if len(temp_subgraph.in_table[item]) == 0:
+                                    for del_child in list(temp_subgraph.degree_table[item]):
+                                        temp_subgraph.degree_table[item].remove(del_child)
+                                        temp_subgraph.in_table[del_child].remove(item)
+                                        record_list.append(del_child)
+                                else:
+                                    if not self._heuristic_method(temp_subgraph, item):
+                                        print('Unexpected fail during deletion!')
+                                        print('Suspect result...')
+                            
+                            check_list = record_list
+
+                index = 0
+                child = None
+                while index < len(optional_children):
+                    child = optional_children[index]
+                    if self._heuristic_method(temp_subgraph, child, node_id):
+                        subgraph.set_graph(temp_subgraph)
+                        return True
+                    else:
+                        req = self.degree_table[node_id][child]
+                        index += 1
+                        while index < len(optional_children):
+                            child = optional_children[index]
+                            if self.degree_table[node_id][child] == req:
+                                # skip the versions having the same requirements
+                                index += 1
+                            else:
+                                break
+            
+            
+
+            for nid in temp_subgraph.in_table[node_id]:
+                req = self.degree_table[nid][node_id]
+                if isinstance(req, set):
+                    versions = self._sort_versions(req)
+                    req = [self._get_node_name(item) for item in versions]
+                
+                parent_node = ''
+                if self.node_type[nid] == VERSION_TYPE:
+                    parent_node = self._get_node_name(list(temp_subgraph.in_table[nid])[0])
+            
+            return False
+
+
+def run_heuristic(graph, subgraph):
+    stime = time.time()
+    success = graph._heuristic_method(subgraph, -1)
+    cost = time.time() - stime
+    subgraph.clear_graph()
+    return success, subgraph, cost
+
+
+def main():
+    """Run the heuristic algorithm on deep require graphs with the trail and with copies.
+    Usage
+    -----
+    python bench_heuristic.py <max_depth> <n_versions>
+    -----
+    max_depth (Optional): the deepest chain of packages, 400 by default.
+    n_versions (Optional): versions of each package, 20 by default.
+    """
+
+    max_depth = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    n_versions = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    # the heuristic algorithm recurses along the chain
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 20 * max_depth))
+
+    depth = 50
+    print('{:>8} {:>10} {:>8} {:>8} {:>10} {:>10} {:>10}'.format('depth', 'versions', 'success', 'nodes', 'trail(s)', 'copy(s)', 'speedup'))
+    while depth <= max_depth:
+        success, subgraph, cost = run_heuristic(deep_graph(depth, n_versions), subGraph({}, {}))
+        copy_success, copy_subgraph, copy_cost = run_heuristic(deep_graph(depth, n_versions, graph_class=CopyingRequireGraph), CopyingSubGraph({}, {}))
+        if success != copy_success or subgraph.degree_table != copy_subgraph.degree_table or subgraph.in_table != copy_subgraph.in_table \
+                or list(subgraph.degree_table) != list(copy_subgraph.degree_table):
+            print('Error: different results from the copying heuristic algorithm.')
+            sys.exit(1)
+
+        print('{:>8} {:>10} {:>8} {:>8} {:>10.3f} {:>10.3f} {:>10}'.format(depth, depth * n_versions, success, len(subgraph.degree_table), cost, copy_cost,
+              '{:.1f}x'.format(copy_cost / cost) if cost > 0 else '-'))
+        depth *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+from run import QueryApplication
+from name_prefixes import NamePrefixes
+
+
+def module_trees(n_module_ids, n_trees, n_submodules, seed=0):
+    """{module_id: set of module names} of a top module 'top', n_module_ids module ids (one per
+    package version) sharing n_trees distinct trees of about n_submodules modules."""
+    rng = random.Random(seed)
+    names = ['top'] + ['top.m{}'.format(i) for i in range(20)]
+    while len(names) < n_submodules:
+        names.append('{}.s{}'.format(rng.choice(names), len(names)))
+    trees = [set(rng.sample(names, n_submodules * 4 // 5)) | {'top'} for _ in range(n_trees)]
+    return {module_id: set(rng.choice(trees)) for module_id in range(n_module_ids)}, names
+
+
+def slicing_degree(tree_set, name_set):
+    """The former _calculate_match_degree, slicing the names for each tree."""
+    if len(tree_set) == 0 or len(name_set) == 0:
+        return 0.0
+    ret = 0.0
+    for name in name_set:
+        if name in tree_set:
+            ret += 1
+        else:
+            split_info = name.split('.')
+            length = len(split_info)
+            prefix_name = name
+            i = 1
+            while i < length:
+                prefix_name = prefix_name[:-(len(split_info[-i])+1)]
+                if prefix_name in tree_set:
+                    break
+                i += 1
+            ret += 1 - i/length
+    return ret
+
+
+def slicing_prefixes(tree_set, possible_attrs):
+    """The former longest proper prefixes of the attributes, slicing them for each tree."""
+    query_set = set()
+    for attr in possible_attrs:
+        split_attr = attr.split('.')
+        prefix_attr = attr
+        i = 1
+        while i < len(split_attr):
+            prefix_attr = prefix_attr[:-(len(split_attr[-i])+1)]
+            if prefix_attr in tree_set:
+                break
+            i += 1
+        query_set.add(prefix_attr)
+    return query_set
+
+
+def main():
+    """Score the module trees of a top module against the names of a snippet, by slicing the
+    names for each tree and by NamePrefixes.
+    Usage
+    -----
+    python bench_match_scoring.py <n_module_ids> <n_trees> <n_names>
+    -----
+    n_module_ids (Optional): module ids of the top module, 5000 by default.
+    n_trees (Optional): distinct module trees among them, 50 by default.
+    n_names (Optional): imported modules and attributes of the snippet, 200 by default.
+    """
+
+    n_module_ids = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    n_trees = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    n_names = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+
+    rng = random.Random(1)
+    trees, module_names = module_trees(n_module_ids, n_trees, 400)
+    names = ['{}.x{}'.format(rng.choice(module_names), i) if i % 2 else rng.choice(module_names) for i in range(n_names)]
+
+    print('{:>12} {:>8} {:>8} {:>12} {:>14}'.format('module ids', 'trees', 'names', 'slicing(s)', 'prefixes(s)'))
+    stime = time.time()
+    scores = {module_id: slicing_degree(tree_set, names) for module_id, tree_set in trees.items()}
+    attrs = {module_id: slicing_prefixes(tree_set, names) for module_id, tree_set in trees.items()}
+    slicing_cost = time.time() - stime
+
+    stime = time.time()
+    score_dict, _ = QueryApplication._score_trees(None, trees, NamePrefixes(names))
+    attr_prefixes = NamePrefixes(names)
+    prefix_attrs = {module_id: attr_prefixes.longest_prefixes(tree_set) for module_id, tree_set in trees.items()}
+    cost = time.time() - stime
+
+    if score_dict != scores or prefix_attrs != attrs:
+        print('Error: different scores.')
+        sys.exit(1)
+    print('{:>12} {:>8} {:>8} {:>12.3f} {:>14.3f}'.format(n_module_ids, n_trees, n_names, slicing_cost, cost))
+
+
+if __name__ == '__main__':
+    main()
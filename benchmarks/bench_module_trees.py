@@ -0,0 +1,128 @@
+import io
+import os
+import sys
+import csv
+import json
+import time
+import random
+import shutil
+import tempfile
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'build_KG'))
+from kg_store import EmbeddedKG
+from run import QueryApplication
+from name_prefixes import NamePrefixes
+from transfer_csv.knowledge2csv import CsvTransformer
+
+
+def write_data(data_dir, n_versions, n_trees, n_submodules, seed=0):
+    """Installation data of a package 'top' with n_versions versions, each with one of n_trees
+    module trees of n_submodules modules, in the layout read by CsvTransformer.generate_csv."""
+    rng = random.Random(seed)
+    names = ['top'] + ['top.m{}'.format(i) for i in range(10)]
+    while len(names) < 2 * n_submodules:
+        names.append('{}.s{}'.format(rng.choice(names), len(names)))
+    trees = []
+    for _ in range(n_trees):
+        modules = sorted(set(['top'] + rng.sample(names[1:], n_submodules - 1)), key=lambda x: len(x.split('.')))
+        attrs = {module: ['f{}'.format(i) for i in rng.sample(range(20), 5)] for module in modules}
+        trees.append({'Requires': None, 'Modules': modules, 'Attrs': attrs})
+
+    p_dir = os.path.join(data_dir, 'top')
+    os.makedirs(p_dir)
+    with open(os.path.join(p_dir, 'exit_status.json'), 'w') as f:
+        json.dump({}, f)
+    for v in range(n_versions):
+        v_dir = os.path.join(p_dir, '{}.{}'.format(v // 10, v % 10))
+        os.makedirs(v_dir)
+        with open(os.path.join(v_dir, 'LABEL'), 'w') as f:
+            f.write('')
+        with open(os.path.join(v_dir, 'data.json'), 'w') as f:
+            json.dump(trees[v % n_trees], f)
+        with open(os.path.join(v_dir, 'import_fail.json'), 'w') as f:
+            json.dump({}, f)
+    return names
+
+
+def drop_tree_hashes(csv_dir):
+    """The KG of the CSV files before the tree_hash column."""
+    path = os.path.join(csv_dir, 'nodes', 'modules.csv')
+    with open(path, 'r', newline='') as f:
+        rows = list(csv.reader(f))
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows(row[:3] + row[4:] for row in rows)
+    with open(os.path.join(csv_dir, 'nodes', 'modules_header.csv'), 'w') as f:
+        f.write(':ID(Module-ID),name,import_status,:LABEL')
+
+
+def csv_size(csv_dir):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(csv_dir) for name in names)
+
+
+def match(kg, forest, attrs):
+    querier = QueryApplication(parser=object(), kg={'Python3': kg}, cache=None)
+    info = {'module_score': 0, 'attr_score': 0}
+    stime = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        candidates = querier._match_forest_batched('Python3', forest, NamePrefixes(attrs), info)
+    return candidates, info, time.time() - stime
+
+
+def main():
+    """Match the modules and attributes of a snippet against a package with many versions
+    sharing a few module trees: by one module per version (KG without tree hashes), by one
+    module per tree hash, and in the KG of shared modules (CsvTransformer dedup_modules).
+    Usage
+    -----
+    python bench_module_trees.py <n_versions> <n_trees> <n_submodules>
+    -----
+    n_versions (Optional): versions of the package, 2000 by default.
+    n_trees (Optional): distinct module trees among the versions, 20 by default.
+    n_submodules (Optional): modules of each tree, 100 by default.
+    """
+
+    n_versions = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    n_trees = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    n_submodules = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        data_dir = os.path.join(work_dir, 'data')
+        names = write_data(data_dir, n_versions, n_trees, n_submodules)
+        csv_dirs = {}
+        build_costs = {}
+        for mode in ('tree_hash', 'module', 'dedup'):
+            csv_dirs[mode] = os.path.join(work_dir, mode)
+            stime = time.time()
+            with contextlib.redirect_stdout(io.StringIO()):
+                CsvTransformer(csv_dirs[mode], '/neo4j', dedup_modules=(mode == 'dedup')).generate_csv(data_dir)
+            build_costs[mode] = time.time() - stime
+        drop_tree_hashes(csv_dirs['module'])
+
+        rng = random.Random(1)
+        modules = rng.sample(names, 10)
+        attrs = ['{}.f{}'.format(rng.choice(names), rng.randrange(20)) for _ in range(30)]
+        forest = {'top': {'modules': modules, 'attrs': attrs, 'max_hop': max(len(item.split('.')) for item in modules + attrs) - 1}}
+
+        print('{:>10} {:>8} {:>12} {:>10} {:>10} {:>10} {:>10} {:>10}'.format('versions', 'trees', 'by', 'modules', 'csv(MB)', 'build(s)', 'load(s)', 'match(s)'))
+        results = []
+        for mode in ('module', 'tree_hash', 'dedup'):
+            stime = time.time()
+            with contextlib.redirect_stdout(io.StringIO()):
+                kg = EmbeddedKG(csv_dirs[mode])
+            load_cost = time.time() - stime
+            candidates, info, cost = match(kg, forest, attrs)
+            results.append((candidates, info))
+            print('{:>10} {:>8} {:>12} {:>10} {:>10.2f} {:>10.3f} {:>10.3f} {:>10.3f}'.format(
+                  n_versions, n_trees, mode, kg.counts['Module'], csv_size(csv_dirs[mode]) / 1024.0 / 1024.0, build_costs[mode], load_cost, cost))
+        if any(item != results[0] for item in results[1:]):
+            print('Error: different matches by tree hash.')
+            sys.exit(1)
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+import io
+import os
+import sys
+import time
+import contextlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+from bench_cnf import synthetic_graph
+
+
+def solve(graph):
+    stime = time.time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        sat_graph = graph._sat_solver()
+    return sat_graph is not None, graph.sat_stats['variables'], graph.sat_stats['clauses'], time.time() - stime
+
+
+def main():
+    """Solve synthetic require graphs of growing size by the SAT solver, with and without the
+    preprocessing pass.
+    Usage
+    -----
+    python bench_preprocess.py <max_versions> <n_requires>
+    -----
+    max_versions (Optional): the largest graph, 20000 versions by default.
+    n_requires (Optional): packages required by each version, 3 by default.
+    """
+
+    max_versions = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    n_requires = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+    n_versions = 10
+    n_packages = 250
+    print('{:>10} {:>10} {:>10} {:>10} {:>6} {:>10} {:>10} {:>10}'.format('versions', 'nodes', 'edges', 'prune(s)', 'sat', 'variables', 'clauses', 'sat(s)'))
+    while n_packages * n_versions <= max_versions:
+        graph = synthetic_graph(n_packages, n_versions, n_requires)
+        full_result = solve(graph)
+
+        graph = synthetic_graph(n_packages, n_versions, n_requires)
+        stime = time.time()
+        graph._preprocess()
+        cost = time.time() - stime
+        result = solve(graph)
+        if result[0] != full_result[0]:
+            print('Error: different results with preprocessing.')
+            sys.exit(1)
+
+        stats = graph.preprocess_stats
+        if stats is None:
+            stats = {'nodes': len(graph.degree_table), 'edges': sum(len(item) for item in graph.degree_table.values())}
+            stats['kept_nodes'], stats['kept_edges'] = stats['nodes'], stats['edges']
+        for name, item in (('full', full_result), ('pruned', result)):
+            print('{:>10} {:>10} {:>10} {:>10} {:>6} {:>10} {:>10} {:>10.3f}'.format(
+                  n_packages * n_versions if name == 'full' else '',
+                  stats['nodes'] if name == 'full' else stats['kept_nodes'],
+                  stats['edges'] if name == 'full' else stats['kept_edges'],
+                  '' if name == 'full' else '{:.3f}'.format(cost), str(item[0]), item[1], item[2], item[3]))
+        n_packages *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import os
+import sys
+import csv
+import time
+import random
+import shutil
+import tempfile
+import tracemalloc
+import contextlib
+import io
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'build_KG'))
+from kg_store import EmbeddedKG
+from run import RequireGraph
+from transfer_csv.knowledge2csv import CsvTransformer
+
+
+def write_kg(csv_dir, n_packages, n_versions, n_requires, seed=0):
+    """CSV files of a KG of n_packages packages with n_versions versions each, every version
+    requires n_requires random packages after its package, mostly in a window of ten versions or
+    pinned, and 5% of the requirements on any version."""
+    rng = random.Random(seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        transformer = CsvTransformer(csv_dir, '/neo4j')
+
+    def write(path, rows):
+        with open(path, 'w', newline='') as f:
+            csv.writer(f).writerows(rows)
+
+    versions = []
+    has_version = []
+    requires = []
+    for p in range(n_packages):
+        for v in range(n_versions):
+            vid = len(versions)
+            versions.append((vid, '{}.{}'.format(v // 10, v % 10), rng.choice(['Success', 'Success', 'Unknown', 'Fail']), 'Version'))
+            has_version.append((p, vid, 'HAS_VERSION'))
+            # packages depend on the packages after them, like the layers of an ecosystem
+            for q in rng.sample(range(p + 1, n_packages), min(n_requires, n_packages - p - 1)):
+                low = rng.randint(0, n_versions // 10 - 1)
+                spec = rng.choice(['>={}.0,<{}.0'.format(low, low + 1)] * 12 + ['=={}.{}'.format(low, rng.randint(0, 9))] * 7 + [''])
+                requires.append((vid, spec, q, 'REQUIRES'))
+
+    write(transformer.csv_package, [(p, 'pkg{}'.format(p), 'Package') for p in range(n_packages)])
+    write(transformer.csv_version, versions)
+    write(transformer.csv_module, [])
+    write(transformer.csv_attribute, [])
+    write(transformer.csv_hasVersion, has_version)
+    write(transformer.csv_version2Module, [])
+    write(transformer.csv_module2Module, [])
+    write(transformer.csv_hasAttribute, [])
+    write(transformer.csv_require, requires)
+
+
+def measure(read, candidates):
+    stime = time.time()
+    records = read()
+    read_cost = time.time() - stime
+    stime = time.time()
+    RequireGraph(candidates, records, preprocess=False)
+    graph_cost = time.time() - stime
+    n_nodes = sum(len(nodes) for nodes, _ in records)
+    n_relationships = sum(len(relationships) for _, relationships in records)
+    del records
+
+    # again for the peak memory of the records, slower under tracemalloc
+    tracemalloc.start()
+    read()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return n_nodes, n_relationships, read_cost, graph_cost, peak
+
+
+def main():
+    """Read the require subgraph of a few packages from an EmbeddedKG, all of it
+    (require_subgraph) and the versions in the requirements (bounded_require_subgraph), and
+    build the RequireGraph of each.
+    Usage
+    -----
+    python bench_require_subgraph.py <n_packages> <n_versions> <n_requires>
+    -----
+    n_packages (Optional): 500 by default.
+    n_versions (Optional): versions of each package, 100 by default.
+    n_requires (Optional): packages required by each version, 2 by default.
+    """
+
+    n_packages = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    n_versions = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    n_requires = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+
+    csv_dir = tempfile.mkdtemp()
+    try:
+        write_kg(csv_dir, n_packages, n_versions, n_requires)
+        with contextlib.redirect_stdout(io.StringIO()):
+            kg = EmbeddedKG(csv_dir)
+
+        print('{} packages with {} versions each, {} requires each'.format(n_packages, n_versions, n_requires))
+        print('{:>10} {:>10} {:>10} {:>14} {:>10} {:>10} {:>10}'.format('packages', 'mode', 'nodes', 'relationships', 'read(s)', 'graph(s)', 'peak(MB)'))
+        rng = random.Random(1)
+        for n_start in (1, 4, 16):
+            names = ['pkg{}'.format(item) for item in rng.sample(range(n_packages), n_start)]
+            # module candidates: a few versions of each package
+            candidates = {}
+            for name in names:
+                first = kg.offsets['Version'] + int(name[3:]) * n_versions
+                candidates['top_{}'.format(name)] = {name: set(first + item for item in rng.sample(range(n_versions), 3))}
+            requirements = [(name, tuple(sorted(vid_set))) for module in candidates.values() for name, vid_set in module.items()]
+
+            for mode, read in (('full', lambda: kg.require_subgraph(names)), ('bounded', lambda: kg.bounded_require_subgraph(requirements))):
+                n_nodes, n_relationships, read_cost, graph_cost, peak = measure(read, candidates)
+                print('{:>10} {:>10} {:>10} {:>14} {:>10.3f} {:>10.3f} {:>10.1f}'.format(n_start, mode, n_nodes, n_relationships, read_cost, graph_cost, peak / 1024.0 / 1024.0))
+    finally:
+        shutil.rmtree(csv_dir)
+
+
+if __name__ == '__main__':
+    main()
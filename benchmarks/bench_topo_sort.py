@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+from run import pvGraph
+
+
+def install_graph(n_packages, n_requires, n_cycles, seed=0):
+    """A pvGraph of n_packages packages, each requiring up to n_requires packages after it,
+    and n_cycles packages requiring a package before them."""
+    rng = random.Random(seed)
+    graph = pvGraph()
+    for pid in range(n_packages):
+        graph.degree_table[pid] = set()
+        graph.in_table[pid] = set()
+        graph.node_dict[pid] = ('pkg{}'.format(pid), '1.0')
+    for pid in range(n_packages - 1):
+        for item in rng.sample(range(pid + 1, n_packages), min(n_requires, n_packages - pid - 1)):
+            graph.degree_table[pid].add(item)
+            graph.in_table[item].add(pid)
+    for pid in rng.sample(range(1, n_packages), n_cycles):
+        item = rng.randrange(pid)
+        graph.degree_table[pid].add(item)
+        graph.in_table[item].add(pid)
+    graph.install_set = set(range(n_packages))
+    return graph
+
+
+def rescan_sort(graph):
+    """The former topo_sort: remove the first node without requirements, from the start of
+    degree_table again, and the remaining nodes in order at a circle."""
+    while len(graph.degree_table) > 0:
+        for key, value in list(graph.degree_table.items()):
+            if len(value) == 0:
+                graph.install_pair.append(graph.node_dict[key])
+                for in_node in graph.in_table[key]:
+                    graph.degree_table[in_node].remove(key)
+                graph.degree_table.pop(key)
+                graph.in_table.pop(key)
+                break
+        else:
+            graph.install_pair.extend(graph.node_dict[key] for key in graph.degree_table)
+            return False
+    return True
+
+
+def main():
+    """Order install graphs of growing size by topo_sort and by the former rescanning sort.
+    Usage
+    -----
+    python bench_topo_sort.py <max_packages> <n_requires> <n_cycles>
+    -----
+    max_packages (Optional): the largest graph, 4000 packages by default.
+    n_requires (Optional): packages required by each package, 3 by default.
+    n_cycles (Optional): requirements back to an earlier package, 0 by default.
+    """
+
+    max_packages = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    n_requires = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    n_cycles = int(sys.argv[3]) if len(sys.argv) > 3 else 0
+
+    print('{:>10} {:>10} {:>10} {:>12} {:>10}'.format('packages', 'acyclic', 'groups', 'rescan(s)', 'topo(s)'))
+    n_packages = 250
+    while n_packages <= max_packages:
+        graph = install_graph(n_packages, n_requires, n_cycles)
+        stime = time.time()
+        rescan_sort(graph)
+        rescan_cost = time.time() - stime
+        rescan_order = graph.install_pair
+
+        graph = install_graph(n_packages, n_requires, n_cycles)
+        stime = time.time()
+        acyclic = graph.topo_sort()
+        cost = time.time() - stime
+        if acyclic and graph.install_pair != rescan_order:
+            print('Error: different install order.')
+            sys.exit(1)
+        print('{:>10} {:>10} {:>10} {:>12.3f} {:>10.3f}'.format(n_packages, str(acyclic), len(graph.install_groups), rescan_cost, cost))
+        n_packages *= 2
+
+
+if __name__ == '__main__':
+    main()
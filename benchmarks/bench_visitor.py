@@ -0,0 +1,77 @@
+import os
+import sys
+import ast
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'docker_env', 'python_parser'))
+from visitor import ParserVisitor
+
+
+def synthetic_snippet(n_imports, n_attrs, seed=0):
+    """Generate a large snippet like generated code: many imports and attribute chains."""
+    rng = random.Random(seed)
+    lines = []
+    names = []
+    for i in range(n_imports):
+        name = 'pkg{}.mod{}'.format(i % 97, i)
+        if i % 3 == 0:
+            lines.append('import {} as m{}'.format(name, i))
+            names.append('m{}'.format(i))
+        elif i % 3 == 1:
+            lines.append('from pkg{} import mod{}'.format(i % 97, i))
+            names.append('mod{}'.format(i))
+        else:
+            lines.append('import {}'.format(name))
+            names.append(name)
+
+    for i in range(n_attrs):
+        chain = '.'.join('a{}'.format(rng.randint(0, 50)) for _ in range(rng.randint(1, 5)))
+        lines.append('x{} = {}.{}'.format(i, rng.choice(names), chain))
+    return '\n'.join(lines)
+
+
+def bench(n_imports, n_attrs, repeat=3):
+    tree = ast.parse(synthetic_snippet(n_imports, n_attrs))
+    best = None
+    for _ in range(repeat):
+        stime = time.time()
+        visitor = ParserVisitor('3.8')
+        visitor.visit(tree)
+        cost = time.time() - stime
+        best = cost if best is None else min(best, cost)
+    return best, len(visitor.attrs)
+
+
+def main():
+    """Parse synthetic snippets of growing size, the time per attribute must stay flat.
+    Usage
+    -----
+    python bench_visitor.py <max_attrs>
+    """
+
+    max_attrs = int(sys.argv[1]) if len(sys.argv) > 1 else 64000
+    sizes = []
+    n_attrs = 1000
+    while n_attrs <= max_attrs:
+        sizes.append(n_attrs)
+        n_attrs *= 4
+
+    per_attr = []
+    print('{:>10} {:>10} {:>10} {:>12} {:>14}'.format('imports', 'attrs', 'collected', 'time (s)', 'us per attr'))
+    for n_attrs in sizes:
+        n_imports = n_attrs // 10
+        cost, collected = bench(n_imports, n_attrs)
+        per_attr.append(cost / n_attrs)
+        print('{:>10} {:>10} {:>10} {:>12.3f} {:>14.2f}'.format(n_imports, n_attrs, collected, cost, cost / n_attrs * 1e6))
+
+    # quadratic walk: the time per attribute grows with the snippet size
+    growth = per_attr[-1] / per_attr[0]
+    print('Growth of the time per attribute: {:.2f}x'.format(growth))
+    if growth > 3:
+        print('Regression: attribute collection is not linear.')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+import json
+import time
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+# marker of a missing entry, None is a valid cached value
+MISSING = object()
+
+
+class LRUCache(object):
+    """In-memory LRU cache with an optional time to live (seconds) of the entries."""
+    def __init__(self, maxsize=4096, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()    # {key: (created, value)}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key, MISSING)
+            if entry is not MISSING and self.ttl is not None and time.time() - entry[0] > self.ttl:
+                self.entries.pop(key)
+                entry = MISSING
+
+            if entry is MISSING:
+                self.misses += 1
+                return MISSING
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.time(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'maxsize': self.maxsize}
+
+
+class SqliteCache(object):
+    """On-disk cache in a sqlite file, survives restarts of the inference process."""
+    def __init__(self, path, ttl=None):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        # the file may be shared by the workers of batch inference
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, created REAL, value BLOB)')
+        self.conn.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute('SELECT created, value FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is not None and self.ttl is not None and time.time() - row[0] > self.ttl:
+                self.conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+                self.conn.commit()
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return MISSING
+
+            self.hits += 1
+            return pickle.loads(row[1])
+
+    def put(self, key, value):
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?)', (key, time.time(), pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            size = self.conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'size': size, 'path': self.path}
+
+    def close(self):
+        self.conn.close()
+
+
+class KGCache(object):
+    """Cache of KG lookups, keyed by the identity of the KG dump and the query parameters.
+
+    The KG is a read-only dump, so a cached result stays valid as long as the dump is the same.
+    Lookups go through the in-memory LRU first, then the optional sqlite file, unless they are
+    not persistent (a KG without the identity of its dump).
+    """
+    def __init__(self, maxsize=4096, ttl=None, disk_path=None):
+        self.memory = LRUCache(maxsize, ttl)
+        self.disk = SqliteCache(disk_path, ttl) if disk_path is not None else None
+
+    @staticmethod
+    def make_key(kg_identity, query, params):
+        return json.dumps([kg_identity, query, params], sort_keys=True)
+
+    def get(self, kg_identity, query, params, persistent=True):
+        key = self.make_key(kg_identity, query, params)
+        value = self.memory.get(key)
+        if value is MISSING and self.disk is not None and persistent:
+            value = self.disk.get(key)
+            if value is not MISSING:
+                self.memory.put(key, value)
+        return value
+
+    def put(self, kg_identity, query, params, value, persistent=True):
+        key = self.make_key(kg_identity, query, params)
+        self.memory.put(key, value)
+        if self.disk is not None and persistent:
+            self.disk.put(key, value)
+
+    def get_or_load(self, kg_identity, query, params, loader, persistent=True):
+        value = self.get(kg_identity, query, params, persistent)
+        if value is MISSING:
+            value = loader()
+            self.put(kg_identity, query, params, value, persistent)
+        return value
+
+    def stats(self):
+        ret = {'memory': self.memory.stats()}
+        if self.disk is not None:
+            ret['disk'] = self.disk.stats()
+        return ret
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
@@ -0,0 +1,181 @@
+from array import array
+
+
+class KGNode(object):
+    """A detached KG node with the interface of neo4j.graph.Node used by RequireGraph."""
+    __slots__ = ('id', 'labels', 'properties')
+
+    def __init__(self, id, labels, properties):
+        self.id = id
+        self.labels = frozenset(labels)
+        self.properties = properties
+
+    def __getitem__(self, key):
+        return self.properties[key]
+
+    def get(self, key, default=None):
+        return self.properties.get(key, default)
+
+    def __repr__(self):
+        return 'KGNode({}, {}, {})'.format(self.id, sorted(self.labels), self.properties)
+
+
+class KGRelationship(object):
+    """A detached KG relationship with the interface of neo4j.graph.Relationship used by RequireGraph."""
+    __slots__ = ('start_node', 'end_node', 'type', 'properties')
+
+    def __init__(self, start_node, end_node, type, properties):
+        self.start_node = start_node
+        self.end_node = end_node
+        self.type = type
+        self.properties = properties
+
+    def __getitem__(self, key):
+        return self.properties[key]
+
+    def get(self, key, default=None):
+        return self.properties.get(key, default)
+
+    def __repr__(self):
+        return 'KGRelationship({}-[{}]->{}, {})'.format(self.start_node.id, self.type, self.end_node.id, self.properties)
+
+
+def detach_node(node):
+    """Copy a neo4j node to KGNode."""
+    return KGNode(node.id, node.labels, dict(node))
+
+
+def detach_subgraph_records(records):
+    """Copy the [nodes, relationships] records of a neo4j result to KGNode and KGRelationship."""
+    ret = []
+    for nodes, relationships in records:
+        node_dict = {node.id: detach_node(node) for node in nodes}
+        rels = []
+        for rel in relationships:
+            start_node = node_dict.get(rel.start_node.id)
+            if start_node is None:
+                start_node = detach_node(rel.start_node)
+            end_node = node_dict.get(rel.end_node.id)
+            if end_node is None:
+                end_node = detach_node(rel.end_node)
+            rels.append(KGRelationship(start_node, end_node, rel.type, dict(rel)))
+        ret.append([list(node_dict.values()), rels])
+    return ret
+
+
+# node kinds of CompactSubgraph
+PACKAGE_KIND = 0
+VERSION_KIND = 1
+KIND_LABELS = [frozenset(['Package']), frozenset(['Version'])]
+
+
+class CompactNode(object):
+    """A node of a CompactSubgraph with the interface of KGNode, read from its arrays."""
+    __slots__ = ('graph', 'index')
+
+    def __init__(self, graph, index):
+        self.graph = graph
+        self.index = index
+
+    @property
+    def id(self):
+        return self.graph.ids[self.index]
+
+    @property
+    def labels(self):
+        return KIND_LABELS[self.graph.kinds[self.index]]
+
+    def __getitem__(self, key):
+        column = self.graph.columns.get(key)
+        if column is None or column[self.index] < 0:
+            raise KeyError(key)
+        return self.graph.strings[column[self.index]]
+
+    def get(self, key, default=None):
+        column = self.graph.columns.get(key)
+        if column is None or column[self.index] < 0:
+            return default
+        return self.graph.strings[column[self.index]]
+
+    def __repr__(self):
+        return 'CompactNode({}, {})'.format(self.id, sorted(self.labels))
+
+
+class CompactSubgraph(object):
+    """The [[nodes, relationships]] records of a require subgraph in arrays.
+
+    Nodes get dense indexes in the order they are first met: ids[i] is the KG id of node i,
+    kinds[i] its PACKAGE_KIND or VERSION_KIND, and columns[property][i] the index of its
+    property in strings (-1 if missing). The relationships are compressed sparse rows in the
+    order they are first met: the edges of node i are targets[offsets[i]:offsets[i+1]], with
+    edge_requirements indexes into requirements (the requirement of a REQUIRES, None for
+    HAS_VERSION or without it).
+    """
+    __slots__ = ('ids', 'kinds', 'columns', 'strings', 'offsets', 'targets', 'edge_requirements', 'requirements')
+
+    def __init__(self, ids, kinds, columns, strings, offsets, targets, edge_requirements, requirements):
+        self.ids = ids
+        self.kinds = kinds
+        self.columns = columns
+        self.strings = strings
+        self.offsets = offsets
+        self.targets = targets
+        self.edge_requirements = edge_requirements
+        self.requirements = requirements
+
+    @classmethod
+    def from_records(cls, records):
+        index = {}              # {KG id: dense index}
+        ids = array('q')
+        kinds = array('b')
+        columns = {}            # {property: array of string indexes}
+        strings = []
+        string_index = {}
+        requirements = [None]
+        requirement_index = {None: 0}
+        edges = []              # [{dense index: requirement index}], the last requirement of an edge
+
+        def intern(value, table, table_index):
+            i = table_index.get(value)
+            if i is None:
+                i = len(table)
+                table_index[value] = i
+                table.append(value)
+            return i
+
+        for nodes, relationships in records:
+            for node in nodes:
+                if node.id in index:
+                    continue
+                i = len(ids)
+                index[node.id] = i
+                ids.append(node.id)
+                kinds.append(PACKAGE_KIND if 'Package' in node.labels else VERSION_KIND)
+                properties = node.properties if isinstance(node, KGNode) else dict(node)
+                for key in properties:
+                    if key not in columns:
+                        columns[key] = array('i', [-1] * i)
+                for key, column in columns.items():
+                    column.append(intern(properties[key], strings, string_index) if key in properties else -1)
+                edges.append({})
+            for rel in relationships:
+                edges[index[rel.start_node.id]][index[rel.end_node.id]] = intern(rel.get('requirement', default=None), requirements, requirement_index)
+
+        offsets = array('i', [0])
+        targets = array('i')
+        edge_requirements = array('i')
+        for node_edges in edges:
+            targets.extend(node_edges.keys())
+            edge_requirements.extend(node_edges.values())
+            offsets.append(len(targets))
+        return cls(ids, kinds, columns, strings, offsets, targets, edge_requirements, requirements)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def node(self, i):
+        return CompactNode(self, i)
+
+    def edges(self, i):
+        """[(target index, requirement)] of node i"""
+        return [(self.targets[edge], self.requirements[self.edge_requirements[edge]]) for edge in range(self.offsets[i], self.offsets[i+1])]
@@ -0,0 +1,380 @@
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+from array import array
+from kg_store import Adjacency, EmbeddedKG
+
+
+# Snapshot of an EmbeddedKG, little-endian:
+#   header    magic, format version, number of sections, offset of the section table
+#   sections  8-byte aligned arrays
+#   table     name, typecode ('i' int32, 'q' int64, 'B' bytes), offset, number of items per section
+# Strings are sorted by their UTF-8 bytes, so the string table is searched without loading it.
+MAGIC = b'PYCREKG\x00'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<8sIIQ')
+SECTION = struct.Struct('<96s1s7xQQ')
+
+SNAPSHOT_FILE = 'kg.snapshot'
+
+
+def _native(values):
+    # sections are little-endian
+    if sys.byteorder != 'little' and values.typecode != 'B':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+class SnapshotWriter(object):
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, 'wb')
+        self.f.write(b'\x00' * HEADER.size)
+        self.sections = []      # [(name, typecode, offset, count)]
+
+    def add(self, name, values):
+        """values: array('i'), array('q') or bytes"""
+        if len(name.encode('utf-8')) > SECTION.size - 24:
+            raise ValueError('Section name {} is too long'.format(name))
+        if isinstance(values, (bytes, bytearray)):
+            values = array('B', values)
+        position = self.f.tell()
+        self.f.write(b'\x00' * (-position % 8))
+        self.sections.append((name, values.typecode, self.f.tell(), len(values)))
+        self.f.write(_native(values).tobytes())
+
+    def add_adjacency(self, name, adjacency):
+        self.add('{}/offsets'.format(name), adjacency.offsets)
+        self.add('{}/targets'.format(name), adjacency.targets)
+        for key, column in adjacency.columns.items():
+            self.add('{}/column/{}'.format(name, key), column)
+
+    def close(self):
+        position = self.f.tell()
+        self.f.write(b'\x00' * (-position % 8))
+        table_offset = self.f.tell()
+        for name, typecode, offset, count in self.sections:
+            self.f.write(SECTION.pack(name.encode('utf-8'), typecode.encode('ascii'), offset, count))
+        self.f.seek(0)
+        self.f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(self.sections), table_offset))
+        self.f.close()
+
+
+def write_snapshot(kg, path):
+    """Write an EmbeddedKG to a snapshot file, replaced atomically."""
+    order = sorted(range(len(kg.strings)), key=lambda i: kg.strings[i].encode('utf-8'))
+    remap = array('i', [0]) * len(order)
+    for new_id, old_id in enumerate(order):
+        remap[old_id] = new_id
+
+    def remap_column(column):
+        return array('i', (remap[string_id] for string_id in column))
+
+    adjacency_keys = sorted(kg.adjacency)
+    meta = {
+        'labels': kg.labels,
+        'counts': kg.counts,
+        'properties': {label: sorted(kg.properties[label]) for label in kg.labels},
+        'adjacency': [[key[0], key[1], key[2], sorted(kg.adjacency[key].columns)] for key in adjacency_keys],
+        'identity': kg.identity(),
+    }
+
+    tmp_path = '{}.tmp'.format(path)
+    writer = SnapshotWriter(tmp_path)
+    writer.add('meta', json.dumps(meta, sort_keys=True).encode('utf-8'))
+
+    data = bytearray()
+    string_offsets = array('q', [0])
+    for i in order:
+        data += kg.strings[i].encode('utf-8')
+        string_offsets.append(len(data))
+    writer.add('strings/offsets', string_offsets)
+    writer.add('strings/data', data)
+    del data
+
+    properties = {}
+    for label in kg.labels:
+        properties[label] = {}
+        for key, column in kg.properties[label].items():
+            properties[label][key] = remap_column(column)
+            writer.add('node/{}/{}'.format(label, key), properties[label][key])
+
+    for key in adjacency_keys:
+        adjacency = kg.adjacency[key]
+        columns = {column: remap_column(values) for column, values in adjacency.columns.items()}
+        writer.add_adjacency('adjacency/{}/{}/{}'.format(*key), Adjacency.from_arrays(adjacency.offsets, adjacency.targets, columns))
+    writer.add_adjacency('index/module_versions', kg.module_versions)
+    writer.add_adjacency('index/version_packages', kg.version_packages)
+
+    # indexes by name are keyed by the sorted string ids
+    for name, label in (('index/modules', 'Module'), ('index/packages', 'Package')):
+        names = properties[label]['name']
+        writer.add_adjacency(name, Adjacency(len(order), names, array('i', range(len(names)))))
+
+    writer.close()
+    os.replace(tmp_path, path)
+
+
+class MappedStrings(object):
+    """The sorted string table of a snapshot."""
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return bytes(self.data[self.offsets[i]:self.offsets[i+1]]).decode('utf-8')
+
+    def index(self, value):
+        """The id of value by binary search, None if it's not in the table."""
+        key = value.encode('utf-8')
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if bytes(self.data[self.offsets[middle]:self.offsets[middle+1]]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self) and bytes(self.data[self.offsets[low]:self.offsets[low+1]]) == key:
+            return low
+        return None
+
+
+class SnapshotKG(EmbeddedKG):
+    """EmbeddedKG on a memory-mapped snapshot.
+
+    The arrays are views of the mapped file, so opening takes milliseconds and the
+    worker processes of batch inference share the pages of one snapshot.
+    """
+    def __init__(self, path):
+        stime = time.time()
+        self.path = path
+        self.f = open(path, 'rb')
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.views = []
+        self.sections = read_sections(self.mm)
+
+        meta = json.loads(bytes(self._section('meta')).decode('utf-8'))
+        self.meta = meta
+        self.csv_dir = None
+        self.labels = meta['labels']
+        self.counts = meta['counts']
+        self.offsets = {}
+        total = 0
+        for label in self.labels:
+            self.offsets[label] = total
+            total += self.counts[label]
+
+        self.strings = MappedStrings(self._section('strings/offsets'), self._section('strings/data'))
+        self.properties = {label: {key: self._section('node/{}/{}'.format(label, key)) for key in keys} for label, keys in meta['properties'].items()}
+        self.adjacency = {}
+        for start_label, rel_type, end_label, columns in meta['adjacency']:
+            name = 'adjacency/{}/{}/{}'.format(start_label, rel_type, end_label)
+            self.adjacency[(start_label, rel_type, end_label)] = self._adjacency(name, columns)
+        self.module_versions = self._adjacency('index/module_versions')
+        self.version_packages = self._adjacency('index/version_packages')
+        self.module_index = self._adjacency('index/modules')
+        self.package_index = self._adjacency('index/packages')
+
+        self.empty = Adjacency(0, array('i'), array('i'))
+        print('Open KG snapshot {} in {:.1f}ms: {}'.format(path, (time.time() - stime) * 1000, self.counts))
+
+
+    def _section(self, name):
+        typecode, offset, count = self.sections[name]
+        size = struct.calcsize(typecode) * count
+        view = memoryview(self.mm)[offset:offset+size]
+        if typecode == 'B':
+            self.views.append(view)
+            return view
+        if sys.byteorder != 'little':
+            values = array(typecode)
+            values.frombytes(view)
+            values.byteswap()
+            view.release()
+            return values
+        view = view.cast(typecode)
+        self.views.append(view)
+        return view
+
+    def _adjacency(self, name, columns=()):
+        return Adjacency.from_arrays(self._section('{}/offsets'.format(name)), self._section('{}/targets'.format(name)),
+                                     {key: self._section('{}/column/{}'.format(name, key)) for key in columns})
+
+    def _string_id(self, value):
+        return self.strings.index(value)
+
+    def identity(self):
+        # the identity of the CSV files it is built from
+        return self.meta['identity']
+
+    def close(self):
+        for view in self.views:
+            view.release()
+        try:
+            self.mm.close()
+        except BufferError:
+            # views still held by a caller, the map is closed when they're gone
+            pass
+        self.f.close()
+
+
+def read_sections(mm):
+    """{name: (typecode, offset, count)} of a mapped snapshot"""
+    if len(mm) < HEADER.size:
+        raise ValueError('Not a KG snapshot: the file is too short')
+    magic, version, count, table_offset = HEADER.unpack_from(mm, 0)
+    if magic != MAGIC:
+        raise ValueError('Not a KG snapshot: bad magic {!r}'.format(magic))
+    if version != FORMAT_VERSION:
+        raise ValueError('Unsupported KG snapshot format version {} (expect {})'.format(version, FORMAT_VERSION))
+    if table_offset + count * SECTION.size > len(mm):
+        raise ValueError('Truncated KG snapshot: the section table is out of the file')
+
+    sections = {}
+    for i in range(count):
+        name, typecode, offset, items = SECTION.unpack_from(mm, table_offset + i * SECTION.size)
+        name = name.rstrip(b'\x00').decode('utf-8')
+        typecode = typecode.decode('ascii')
+        if typecode not in ('i', 'q', 'B'):
+            raise ValueError('Section {}: unknown typecode {}'.format(name, typecode))
+        if offset + struct.calcsize(typecode) * items > table_offset:
+            raise ValueError('Section {}: out of the data area'.format(name))
+        sections[name] = (typecode, offset, items)
+    return sections
+
+
+def _check_adjacency(errors, name, adjacency, size, target_size):
+    offsets = adjacency.offsets
+    if len(offsets) != size + 1:
+        errors.append('{}: {} offsets for {} nodes'.format(name, len(offsets), size))
+        return
+    if offsets[0] != 0 or offsets[-1] != len(adjacency.targets):
+        errors.append('{}: offsets do not span the {} targets'.format(name, len(adjacency.targets)))
+    if any(offsets[i] > offsets[i+1] for i in range(size)):
+        errors.append('{}: offsets are not sorted'.format(name))
+    if any(target < 0 or target >= target_size for target in adjacency.targets):
+        errors.append('{}: targets out of [0, {})'.format(name, target_size))
+    for key, column in adjacency.columns.items():
+        if len(column) != len(adjacency.targets):
+            errors.append('{}: column {} has {} items for {} targets'.format(name, key, len(column), len(adjacency.targets)))
+
+
+def validate_snapshot(path, csv_dir=None):
+    """Check the structure of a snapshot, and that it holds the same KG as csv_dir if given.
+    Returns
+    -------
+    list
+        Error messages, empty if the snapshot is valid.
+    """
+
+    errors = []
+    try:
+        kg = SnapshotKG(path)
+    except (ValueError, KeyError, struct.error) as e:
+        return ['Can\'t open {}: {}'.format(path, e)]
+
+    try:
+        # strings: sorted, unique and UTF-8
+        strings = kg.strings
+        previous = None
+        for i in range(len(strings)):
+            if strings.offsets[i] > strings.offsets[i+1]:
+                errors.append('strings: offsets are not sorted at {}'.format(i))
+                break
+            value = bytes(strings.data[strings.offsets[i]:strings.offsets[i+1]])
+            if previous is not None and previous >= value:
+                errors.append('strings: not sorted or not unique at {}'.format(i))
+                break
+            previous = value
+            try:
+                value.decode('utf-8')
+            except UnicodeDecodeError:
+                errors.append('strings: invalid UTF-8 at {}'.format(i))
+                break
+        if strings.offsets[-1] != len(strings.data):
+            errors.append('strings: offsets do not span the data')
+
+        for label in kg.labels:
+            for key, column in kg.properties[label].items():
+                if len(column) != kg.counts[label]:
+                    errors.append('node/{}/{}: {} values for {} nodes'.format(label, key, len(column), kg.counts[label]))
+                if any(string_id < 0 or string_id >= len(strings) for string_id in column):
+                    errors.append('node/{}/{}: string ids out of range'.format(label, key))
+
+        for (start_label, rel_type, end_label), adjacency in kg.adjacency.items():
+            _check_adjacency(errors, '{}-[{}]->{}'.format(start_label, rel_type, end_label), adjacency, kg.counts[start_label], kg.counts[end_label])
+        _check_adjacency(errors, 'index/module_versions', kg.module_versions, kg.counts['Module'], kg.counts['Version'])
+        _check_adjacency(errors, 'index/version_packages', kg.version_packages, kg.counts['Version'], kg.counts['Package'])
+        _check_adjacency(errors, 'index/modules', kg.module_index, len(strings), kg.counts['Module'])
+        _check_adjacency(errors, 'index/packages', kg.package_index, len(strings), kg.counts['Package'])
+
+        if len(errors) == 0 and csv_dir is not None:
+            errors.extend(_compare_with_csv(kg, EmbeddedKG(csv_dir)))
+    finally:
+        kg.close()
+    return errors
+
+
+def _compare_with_csv(kg, csv_kg):
+    errors = []
+    if kg.counts != csv_kg.counts:
+        return ['counts {} != {} of the CSV files'.format(kg.counts, csv_kg.counts)]
+
+    for label in csv_kg.labels:
+        for key, column in csv_kg.properties[label].items():
+            values = kg.properties[label].get(key)
+            if values is None or [kg.strings[i] for i in values] != [csv_kg.strings[i] for i in column]:
+                errors.append('node/{}/{}: differs from the CSV files'.format(label, key))
+
+    if set(kg.adjacency) != set(csv_kg.adjacency):
+        errors.append('relationship types {} != {} of the CSV files'.format(sorted(kg.adjacency), sorted(csv_kg.adjacency)))
+    for key, adjacency in csv_kg.adjacency.items():
+        mapped = kg.adjacency.get(key)
+        if mapped is None:
+            continue
+        if list(mapped.offsets) != list(adjacency.offsets) or list(mapped.targets) != list(adjacency.targets):
+            errors.append('{}-[{}]->{}: differs from the CSV files'.format(*key))
+        for column, values in adjacency.columns.items():
+            if [kg.strings[i] for i in mapped.columns.get(column, [])] != [csv_kg.strings[i] for i in values]:
+                errors.append('{}-[{}]->{}: column {} differs from the CSV files'.format(key[0], key[1], key[2], column))
+    return errors
+
+
+def main():
+    """
+    python kg_snapshot.py build <csv_dir> <snapshot_path>
+    python kg_snapshot.py validate <snapshot_path> <csv_dir>
+    -----
+    snapshot_path (Optional): <csv_dir>/kg.snapshot by default.
+    csv_dir (Optional): also check that the snapshot holds the KG of the CSV files.
+    """
+    command = sys.argv[1]
+    if command == 'build':
+        csv_dir = os.path.abspath(sys.argv[2])
+        path = sys.argv[3] if len(sys.argv) > 3 else os.path.join(csv_dir, SNAPSHOT_FILE)
+        stime = time.time()
+        write_snapshot(EmbeddedKG(csv_dir), path)
+        print('KG snapshot saved to {} ({:.1f} MB, {:.2f}s)'.format(path, os.path.getsize(path) / 1024 / 1024, time.time() - stime))
+    elif command == 'validate':
+        path = sys.argv[2]
+        csv_dir = sys.argv[3] if len(sys.argv) > 3 else None
+        errors = validate_snapshot(path, csv_dir)
+        for error in errors:
+            print('Error: {}'.format(error))
+        if len(errors) > 0:
+            sys.exit(1)
+        print('{} is valid.'.format(path))
+    else:
+        print('Unknown command \"{}\"'.format(command))
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,761 @@
+import os
+import csv
+import gzip
+import json
+import time
+import hashlib
+from array import array
+from kg_records import KGNode, KGRelationship, detach_node, detach_subgraph_records
+from version_index import VersionIndex
+
+
+# packages or versions read from the KG at a time by bounded_require_subgraph
+REQUIRE_PAGE_SIZE = 1000
+
+
+def _pages(items, page_size):
+    for i in range(0, len(items), page_size):
+        yield items[i:i+page_size]
+
+
+class KGQueries(object):
+    """The queries of QueryApplication against one KG.
+
+    Module, version and package ids are the node ids of the KG. The single-module queries
+    default to their UNWIND counterparts.
+    """
+    def module_info_by_name(self, module_name):
+        """[(module_id, import_status, tree_hash)] of the modules named module_name, tree_hash None if not in the KG"""
+        return self.module_info_by_names([module_name])[module_name]
+
+    def submodules_by_module(self, module_name, max_hop):
+        """[(module_id, submodule)], the imported submodules within max_hop of the modules named module_name"""
+        return self.submodules_by_modules([(module_name, max_hop)])[(module_name, max_hop)]
+
+    def attributes_by_module_list(self, module_id_list, submodule_list, ret):
+        """ret: {module_id: [attr]}, appended with "submodule.attribute" of the modules"""
+        self.attributes_by_module_lists([(None, module_id_list, submodule_list)], {None: ret})
+
+    def packages_and_versions_by_module_list(self, module_id_list):
+        """{package: version_id_set} of the versions that have the modules"""
+        return self.packages_and_versions_by_module_lists({None: module_id_list})[None]
+
+    def module_info_by_names(self, module_names):
+        """{module_name: [(module_id, import_status, tree_hash)]}"""
+        raise NotImplementedError
+
+    def submodules_by_module_ids(self, module_hops):
+        """
+        module_hops: [(module_ids, max_hop)], module_ids a tuple
+        Return: {(module_ids, max_hop): [(module_id, submodule)]}, like submodules_by_modules for these modules only
+        """
+        raise NotImplementedError
+
+    def submodules_by_modules(self, module_hops):
+        """
+        module_hops: [(module_name, max_hop)]
+        Return: {(module_name, max_hop): [(module_id, submodule)]}
+        """
+        raise NotImplementedError
+
+    def attributes_by_module_lists(self, items, ret):
+        """items: [(top_module, module_id_list, submodule_list)], ret: {top_module: {module_id: [attr]}}"""
+        raise NotImplementedError
+
+    def packages_and_versions_by_module_lists(self, module_id_lists):
+        """
+        module_id_lists: {top_module: [module_id]}
+        Return: {top_module: {package: version_id_set}}
+        """
+        raise NotImplementedError
+
+    def require_subgraph(self, package_list):
+        """[[nodes, relationships]] reachable by HAS_VERSION and REQUIRES, one record per package in the KG"""
+        raise NotImplementedError
+
+    def packages_by_names(self, names):
+        """{name: [package node]} of the packages in the KG"""
+        raise NotImplementedError
+
+    def versions_by_packages(self, package_ids):
+        """{package_id: [version node]}"""
+        raise NotImplementedError
+
+    def requires_by_versions(self, version_ids):
+        """{version_id: [(package node, requirement)]}, requirement is None without the property"""
+        raise NotImplementedError
+
+    def bounded_require_subgraph(self, requirements, page_size=REQUIRE_PAGE_SIZE):
+        """[[nodes, relationships]] of require_subgraph, in one record, without the versions out of
+        all the requirements on their package. A version is expanded by its REQUIRES once it is in
+        a requirement, from requirements or from an expanded version. Fail versions are kept but
+        not expanded, no solution installs them.
+        requirements: [(package, requirement)], requirement is '' for any version, a specifier,
+        or a list of version ids (the versions of a module candidate).
+        The KG is read page_size packages or versions at a time.
+        """
+        versions = VersionIndex()
+        version_nodes = {}      # {version_id: version node} of the packages read
+        version_package = {}    # {version_id: package_id}
+        admitted = {}           # {package_id: bitset of the versions in the subgraph}
+        applied = set()         # {(package_id, requirement)}
+        nodes = {}              # {id: node} in the subgraph
+        relationships = []
+
+        packages = {}
+        for page in _pages(sorted(set(name for name, _ in requirements)), page_size):
+            packages.update(self.packages_by_names(page))
+        pending = []            # [(package_id, requirement)]
+        for name, requirement in requirements:
+            for package in packages.get(name, []):
+                nodes[package.id] = package
+                pending.append((package.id, requirement))
+
+        while len(pending) > 0:
+            new_packages = sorted(set(pid for pid, _ in pending if pid not in admitted))
+            for page in _pages(new_packages, page_size):
+                for pid, package_versions in self.versions_by_packages(page).items():
+                    for node in package_versions:
+                        version_nodes[node.id] = node
+                        version_package[node.id] = pid
+                    versions.add_package(pid, {node.id: node['version'] for node in package_versions})
+            for pid in new_packages:
+                if pid not in versions.package_versions:
+                    versions.add_package(pid, {})
+                admitted[pid] = 0
+
+            expand = []
+            for pid, requirement in pending:
+                if isinstance(requirement, (list, tuple)):
+                    requirement = tuple(requirement)
+                # the versions of a requirement are admitted once
+                if (pid, requirement) in applied or admitted[pid] == versions.all_bits(pid):
+                    continue
+                applied.add((pid, requirement))
+                if isinstance(requirement, tuple):
+                    bitset = versions.bits_of(item for item in requirement if version_package.get(item) == pid)
+                else:
+                    bitset = versions.bits(pid, requirement)
+                new_bits = bitset & ~admitted[pid]
+                if new_bits == 0:
+                    continue
+                admitted[pid] |= new_bits
+                for vid in versions.filter(versions.package_versions[pid], new_bits):
+                    nodes[vid] = version_nodes[vid]
+                    relationships.append(KGRelationship(nodes[pid], nodes[vid], 'HAS_VERSION', {}))
+                    if nodes[vid].get('install_status') != 'Fail':
+                        expand.append(vid)
+
+            pending = []
+            for page in _pages(expand, page_size):
+                for vid, required in self.requires_by_versions(page).items():
+                    for package, requirement in required:
+                        if package.id not in nodes:
+                            nodes[package.id] = package
+                        properties = {} if requirement is None else {'requirement': requirement}
+                        relationships.append(KGRelationship(nodes[vid], nodes[package.id], 'REQUIRES', properties))
+                        pending.append((package.id, requirement))
+
+        # a package without versions in the requirements keeps its newest version, not expanded,
+        # or it would be a package out of the KG that any requirement accepts
+        for pid, bitset in admitted.items():
+            if bitset == 0 and len(versions.package_versions[pid]) > 0:
+                vid = versions.package_versions[pid][0]
+                nodes[vid] = version_nodes[vid]
+                relationships.append(KGRelationship(nodes[pid], nodes[vid], 'HAS_VERSION', {}))
+
+        if len(nodes) == 0:
+            return []
+        return [[list(nodes.values()), relationships]]
+
+
+class KGStore(object):
+    """A read-only Python package KG.
+
+    read(work, *args) runs work(queries, *args) in one read transaction, where queries
+    is a KGQueries. identity() tells the KG dumps apart for the cache of lookups, None if
+    the KG can't tell its dump, then its lookups are only cached in memory.
+    """
+    def read(self, work, *args):
+        raise NotImplementedError
+
+    def identity(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class Neo4jQueries(KGQueries):
+    """KGQueries in a read transaction of Neo4j 4.1 with APOC."""
+    def __init__(self, tx):
+        self.tx = tx
+
+    def statistics(self):
+        result = self.tx.run("CALL apoc.meta.stats() "
+                             "YIELD nodeCount, relCount, labels, relTypesCount "
+                             "RETURN nodeCount, relCount, labels, relTypesCount;")
+        record = result.single()
+        return [record[0], record[1], record[2], record[3]]
+
+    def module_info_by_name(self, module_name):
+        result = self.tx.run("MATCH (m:Module {name:$module_name}) "
+                             "RETURN m;", module_name=module_name)
+        ret = []
+        for record in result:
+            ret.append((record[0].id, record[0]['import_status'], record[0].get('tree_hash')))
+        return ret
+
+    def submodules_by_module(self, module_name, max_hop):
+        result = self.tx.run("MATCH (m:Module {name:$module_name}) "
+                             "CALL apoc.neighbors.tohop(m, \"HAS_MODULE>\", $max_hop) "
+                             "YIELD node "
+                             "RETURN id(m), node;", module_name=module_name, max_hop=max_hop)
+
+        ret = []    # [(module_id, submodule)]
+        for record in result:
+            if record[1]['import_status'] == 'True':
+                ret.append((record[0], record[1]['name']))
+        return ret
+
+    def attributes_by_module_list(self, module_id_list, submodule_list, ret):
+        result = self.tx.run("MATCH (m:Module)-[:HAS_MODULE*0..]->(s:Module)-[:HAS_ATTRIBUTE]->(a:Attribute) "
+                             "WHERE id(m) in $module_id_list AND s.name in $submodule_list "
+                             "RETURN id(m), s.name, a.name", module_id_list=module_id_list, submodule_list=submodule_list)
+
+        for record in result:
+            ret[record[0]].append('{}.{}'.format(record[1], record[2]))
+
+    def packages_and_versions_by_module_list(self, module_id_list):
+        result = self.tx.run("MATCH (p:Package)-[:HAS_VERSION]->(v:Version)-[:HAS_MODULE]->(m:Module) "
+                             "WHERE id(m) in $module_id_list "
+                             "RETURN p.name,id(v);", module_id_list=module_id_list)
+
+        ret = {}    # {package: version_id_set}
+        for record in result:
+            p = record[0]
+            vid = record[1]
+            if p not in ret:
+                ret[p] = set()
+            ret[p].add(vid)
+
+        return ret
+
+    def module_info_by_names(self, module_names):
+        result = self.tx.run("UNWIND $module_names AS module_name "
+                             "MATCH (m:Module {name:module_name}) "
+                             "RETURN module_name, id(m), m.import_status, m.tree_hash;", module_names=module_names)
+        ret = {name: [] for name in module_names}
+        for record in result:
+            ret[record[0]].append((record[1], record[2], record[3]))
+        return ret
+
+    def submodules_by_modules(self, module_hops):
+        result = self.tx.run("UNWIND $items AS item "
+                             "MATCH (m:Module {name:item.name}) "
+                             "CALL apoc.neighbors.tohop(m, \"HAS_MODULE>\", item.max_hop) "
+                             "YIELD node "
+                             "RETURN item.name, item.max_hop, id(m), node;", items=[{'name': name, 'max_hop': max_hop} for name, max_hop in module_hops])
+
+        ret = {key: [] for key in module_hops}
+        for record in result:
+            if record[3]['import_status'] == 'True':
+                ret[(record[0], record[1])].append((record[2], record[3]['name']))
+        return ret
+
+    def submodules_by_module_ids(self, module_hops):
+        result = self.tx.run("UNWIND $items AS item "
+                             "MATCH (m:Module) WHERE id(m) IN item.module_ids "
+                             "CALL apoc.neighbors.tohop(m, \"HAS_MODULE>\", item.max_hop) "
+                             "YIELD node "
+                             "RETURN item.index, id(m), node;", items=[{'index': i, 'module_ids': list(module_ids), 'max_hop': max_hop} for i, (module_ids, max_hop) in enumerate(module_hops)])
+
+        ret = {key: [] for key in module_hops}
+        for record in result:
+            if record[2]['import_status'] == 'True':
+                ret[module_hops[record[0]]].append((record[1], record[2]['name']))
+        return ret
+
+    def attributes_by_module_lists(self, items, ret):
+        result = self.tx.run("UNWIND $items AS item "
+                             "MATCH (m:Module)-[:HAS_MODULE*0..]->(s:Module)-[:HAS_ATTRIBUTE]->(a:Attribute) "
+                             "WHERE id(m) in item.module_id_list AND s.name in item.submodule_list "
+                             "RETURN item.top_module, id(m), s.name, a.name",
+                             items=[{'top_module': top_module, 'module_id_list': module_id_list, 'submodule_list': submodule_list} for top_module, module_id_list, submodule_list in items])
+
+        for record in result:
+            ret[record[0]][record[1]].append('{}.{}'.format(record[2], record[3]))
+
+    def packages_and_versions_by_module_lists(self, module_id_lists):
+        result = self.tx.run("UNWIND $items AS item "
+                             "MATCH (p:Package)-[:HAS_VERSION]->(v:Version)-[:HAS_MODULE]->(m:Module) "
+                             "WHERE id(m) in item.module_id_list "
+                             "RETURN item.top_module, p.name, id(v);",
+                             items=[{'top_module': top_module, 'module_id_list': module_id_list} for top_module, module_id_list in module_id_lists.items()])
+
+        ret = {top_module: {} for top_module in module_id_lists}    # {top_module: {package: version_id_set}}
+        for record in result:
+            p = record[1]
+            vid = record[2]
+            if p not in ret[record[0]]:
+                ret[record[0]][p] = set()
+            ret[record[0]][p].add(vid)
+
+        return ret
+
+    def require_subgraph(self, package_list):
+        result = self.tx.run("WITH $package_list AS package_list "
+                             "MATCH (startNode:Package) WHERE startNode.name in package_list "
+                             "WITH startNode "
+                             "CALL apoc.path.subgraphAll(startNode, { "
+                                 "relationshipFilter:\"REQUIRES>|HAS_VERSION>\" "
+                             "}) "
+                             "YIELD nodes, relationships "
+                             "RETURN nodes, relationships", package_list=package_list).values()
+
+        return detach_subgraph_records(result)
+
+    # the results are read record by record, without .values()
+    def packages_by_names(self, names):
+        result = self.tx.run("UNWIND $names AS name "
+                             "MATCH (p:Package {name: name}) "
+                             "RETURN name, p;", names=names)
+
+        ret = {}    # {name: [package node]}
+        for record in result:
+            if record[0] not in ret:
+                ret[record[0]] = []
+            ret[record[0]].append(detach_node(record[1]))
+        return ret
+
+    def versions_by_packages(self, package_ids):
+        result = self.tx.run("UNWIND $package_ids AS package_id "
+                             "MATCH (p:Package)-[:HAS_VERSION]->(v:Version) "
+                             "WHERE id(p) = package_id "
+                             "RETURN package_id, v;", package_ids=package_ids)
+
+        ret = {}    # {package_id: [version node]}
+        for record in result:
+            if record[0] not in ret:
+                ret[record[0]] = []
+            ret[record[0]].append(detach_node(record[1]))
+        return ret
+
+    def requires_by_versions(self, version_ids):
+        result = self.tx.run("UNWIND $version_ids AS version_id "
+                             "MATCH (v:Version)-[r:REQUIRES]->(p:Package) "
+                             "WHERE id(v) = version_id "
+                             "RETURN version_id, p, r.requirement;", version_ids=version_ids)
+
+        ret = {}    # {version_id: [(package node, requirement)]}
+        for record in result:
+            if record[0] not in ret:
+                ret[record[0]] = []
+            ret[record[0]].append((detach_node(record[1]), record[2]))
+        return ret
+
+
+class Neo4jKG(KGStore):
+    """The KG in a Neo4j database.
+
+    It has no identity: another dump with the same node and relationship counts can't be told
+    apart without reading the whole KG. Pass kg_identity to QueryApplication to keep its lookups
+    in the on-disk cache.
+    """
+    def __init__(self, driver):
+        import neo4j
+
+        self.driver = driver
+        self.access_mode = neo4j.READ_ACCESS
+
+    def read(self, work, *args):
+        with self.driver.session(default_access_mode=self.access_mode) as session:
+            return session.read_transaction(lambda tx: work(Neo4jQueries(tx), *args))
+
+    def identity(self):
+        return None
+
+    def close(self):
+        self.driver.close()
+
+
+# The node and relationship files of CsvTransformer (build_KG/transfer_csv/knowledge2csv.py),
+# the order of the node files gives the ranges of the node ids
+NODE_FILES = ['packages', 'versions', 'modules', 'attributes']
+RELATIONSHIP_FILES = ['hasVersion', 'version2Module', 'module2Module', 'hasAttribute', 'requires']
+
+
+def _read_header(path):
+    with open(path, 'r', newline='') as f:
+        return next(csv.reader(f))
+
+
+def _csv_path(csv_dir, sub_dir, name):
+    # <name>.csv, or <name>.csv.gz of CsvTransformer(compress=True)
+    path = os.path.join(csv_dir, sub_dir, '{}.csv'.format(name))
+    if not os.path.exists(path) and os.path.exists(path + '.gz'):
+        return path + '.gz'
+    return path
+
+
+def _open_csv(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', newline='')
+    return open(path, 'r', newline='')
+
+
+def _id_space(field):
+    # ':ID(Package-ID)' -> 'Package'
+    space = field[field.index('(')+1:field.rindex(')')]
+    return space[:-len('-ID')] if space.endswith('-ID') else space
+
+
+class Adjacency(object):
+    """Compressed sparse rows: the targets of node i are targets[offsets[i]:offsets[i+1]]."""
+    __slots__ = ('offsets', 'targets', 'columns')
+
+    def __init__(self, size, sources, targets, columns=None):
+        columns = columns or {}
+        # counting sort of the edges by source, stable in the order of the CSV file
+        offsets = array('i', [0]) * (size + 1)
+        for source in sources:
+            offsets[source+1] += 1
+        for i in range(size):
+            offsets[i+1] += offsets[i]
+
+        position = array('i', offsets[:-1])
+        self.targets = array('i', [0]) * len(targets)
+        self.columns = {key: array('i', [0]) * len(targets) for key in columns}
+        for index, source in enumerate(sources):
+            pos = position[source]
+            self.targets[pos] = targets[index]
+            for key, column in columns.items():
+                self.columns[key][pos] = column[index]
+            position[source] = pos + 1
+        self.offsets = offsets
+
+    @classmethod
+    def from_arrays(cls, offsets, targets, columns=None):
+        adjacency = cls.__new__(cls)
+        adjacency.offsets = offsets
+        adjacency.targets = targets
+        adjacency.columns = columns or {}
+        return adjacency
+
+    def neighbors(self, i):
+        return self.targets[self.offsets[i]:self.offsets[i+1]]
+
+    def edges(self, i):
+        return range(self.offsets[i], self.offsets[i+1])
+
+
+class EmbeddedKG(KGStore, KGQueries):
+    """The KG loaded from the CSV files of CsvTransformer, without Neo4j.
+
+    Nodes of a label are numbered in the order of their CSV file, and their properties are
+    kept as int32 indexes in one table of interned strings. Relationships are kept as
+    Adjacency by (start label, type, end label). The node id of the queries is the index
+    of the node plus the number of nodes in the files before it (see NODE_FILES).
+    """
+    def __init__(self, csv_dir):
+        self.csv_dir = csv_dir
+        self.strings = []           # interned strings of the properties
+        self.string_ids = {}        # {string: index}
+        self.labels = []            # node labels in the order of NODE_FILES
+        self.offsets = {}           # {label: id of the first node}
+        self.counts = {}            # {label: number of nodes}
+        self.properties = {}        # {label: {property: array of string indexes}}
+        self.adjacency = {}         # {(start label, type, end label): Adjacency}
+
+        stime = time.time()
+        edges = {}
+        for name in NODE_FILES:
+            self._load_nodes(name)
+        for name in RELATIONSHIP_FILES:
+            self._load_relationships(name, edges)
+        for key, (sources, targets, columns) in edges.items():
+            self.adjacency[key] = Adjacency(self.counts[key[0]], sources, targets, columns)
+
+        # reverse HAS_MODULE and HAS_VERSION, for the versions and packages of modules
+        sources, targets, _ = edges.get(('Version', 'HAS_MODULE', 'Module'), (array('i'), array('i'), None))
+        self.module_versions = Adjacency(self.counts['Module'], targets, sources)
+        sources, targets, _ = edges.get(('Package', 'HAS_VERSION', 'Version'), (array('i'), array('i'), None))
+        self.version_packages = Adjacency(self.counts['Version'], targets, sources)
+        del edges
+
+        # modules by name, packages by name
+        module_names = self.properties['Module']['name']
+        self.module_index = Adjacency(len(self.strings), module_names, array('i', range(len(module_names))))
+        package_names = self.properties['Package']['name']
+        self.package_index = Adjacency(len(self.strings), package_names, array('i', range(len(package_names))))
+
+        self.empty = Adjacency(0, array('i'), array('i'))
+        print('Load KG from {} in {:.2f}s: {}'.format(csv_dir, time.time() - stime, self.counts))
+
+
+    def _intern(self, value):
+        string_id = self.string_ids.get(value)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.string_ids[value] = string_id
+            self.strings.append(value)
+        return string_id
+
+    def _load_nodes(self, name):
+        header = _read_header(os.path.join(self.csv_dir, 'nodes', '{}_header.csv'.format(name)))
+        id_index = [i for i, field in enumerate(header) if field.startswith(':ID')][0]
+        label = _id_space(header[id_index])
+        fields = [(i, field) for i, field in enumerate(header) if not field.startswith(':')]
+
+        columns = {field: array('i') for _, field in fields}
+        count = 0
+        with _open_csv(_csv_path(self.csv_dir, 'nodes', name)) as f:
+            for row in csv.reader(f):
+                if int(row[id_index]) != count:
+                    raise ValueError('{}.csv: expect node id {}, got {}'.format(name, count, row[id_index]))
+                for i, field in fields:
+                    columns[field].append(self._intern(row[i]))
+                count += 1
+
+        self.offsets[label] = sum(self.counts.values())
+        self.counts[label] = count
+        self.properties[label] = columns
+        self.labels.append(label)
+
+    def _load_relationships(self, name, edges):
+        header = _read_header(os.path.join(self.csv_dir, 'relationships', '{}_header.csv'.format(name)))
+        start_index = [i for i, field in enumerate(header) if field.startswith(':START_ID')][0]
+        end_index = [i for i, field in enumerate(header) if field.startswith(':END_ID')][0]
+        type_index = header.index(':TYPE')
+        start_label = _id_space(header[start_index])
+        end_label = _id_space(header[end_index])
+        fields = [(i, field) for i, field in enumerate(header) if not field.startswith(':')]
+
+        with _open_csv(_csv_path(self.csv_dir, 'relationships', name)) as f:
+            for row in csv.reader(f):
+                key = (start_label, row[type_index], end_label)
+                if key not in edges:
+                    edges[key] = (array('i'), array('i'), {field: array('i') for _, field in fields})
+                sources, targets, columns = edges[key]
+                sources.append(int(row[start_index]))
+                targets.append(int(row[end_index]))
+                for i, field in fields:
+                    columns[field].append(self._intern(row[i]))
+
+
+    def _string_id(self, value):
+        return self.string_ids.get(value)
+
+    def _property(self, label, index, key):
+        return self.strings[self.properties[label][key][index]]
+
+    def _node(self, label, index):
+        properties = {key: self.strings[column[index]] for key, column in self.properties[label].items()}
+        return KGNode(self.offsets[label] + index, [label], properties)
+
+    def _out(self, start_label, rel_type, end_label):
+        return self.adjacency.get((start_label, rel_type, end_label), self.empty)
+
+    def _modules_named(self, module_name):
+        string_id = self._string_id(module_name)
+        if string_id is None:
+            return []
+        return self.module_index.neighbors(string_id)
+
+
+    def read(self, work, *args):
+        return work(self, *args)
+
+    def identity(self):
+        return self.csv_identity(self.csv_dir)
+
+    @staticmethod
+    def csv_identity(csv_dir):
+        files = []
+        for sub_dir, names in (('nodes', NODE_FILES), ('relationships', RELATIONSHIP_FILES)):
+            for name in names:
+                stat = os.stat(_csv_path(csv_dir, sub_dir, name))
+                files.append([sub_dir, name, stat.st_size, stat.st_mtime])
+        return hashlib.sha1(json.dumps(files).encode()).hexdigest()
+
+
+    def module_info_by_names(self, module_names):
+        offset = self.offsets['Module']
+        # KGs of CSV files before the tree_hash column have no tree hashes
+        has_hash = 'tree_hash' in self.properties['Module']
+        ret = {}
+        for name in module_names:
+            ret[name] = [(offset + index, self._property('Module', index, 'import_status'), self._property('Module', index, 'tree_hash') if has_hash else None)
+                         for index in self._modules_named(name)]
+        return ret
+
+    def submodules_by_modules(self, module_hops):
+        ret = {}
+        for name, max_hop in module_hops:
+            ret[(name, max_hop)] = []
+            for index in self._modules_named(name):
+                self._submodules(index, max_hop, ret[(name, max_hop)])
+        return ret
+
+    def submodules_by_module_ids(self, module_hops):
+        offset = self.offsets['Module']
+        ret = {}
+        for module_ids, max_hop in module_hops:
+            ret[(module_ids, max_hop)] = []
+            for module_id in module_ids:
+                self._submodules(module_id - offset, max_hop, ret[(module_ids, max_hop)])
+        return ret
+
+    def _submodules(self, index, max_hop, ret):
+        offset = self.offsets['Module']
+        has_module = self._out('Module', 'HAS_MODULE', 'Module')
+        # breadth first, like apoc.neighbors.tohop
+        visited = {index}
+        frontier = [index]
+        for _ in range(max_hop):
+            next_frontier = []
+            for node in frontier:
+                for child in has_module.neighbors(node):
+                    if child in visited:
+                        continue
+                    visited.add(child)
+                    next_frontier.append(child)
+                    if self._property('Module', child, 'import_status') == 'True':
+                        ret.append((offset + index, self._property('Module', child, 'name')))
+            frontier = next_frontier
+
+    def attributes_by_module_lists(self, items, ret):
+        offset = self.offsets['Module']
+        has_module = self._out('Module', 'HAS_MODULE', 'Module')
+        has_attribute = self._out('Module', 'HAS_ATTRIBUTE', 'Attribute')
+        for top_module, module_id_list, submodule_list in items:
+            submodules = set(submodule_list)
+            # submodules extend the names of their parents, so only these prefixes can lead to a match
+            prefixes = set()
+            for submodule in submodules:
+                split_info = submodule.split('.')
+                for i in range(1, len(split_info) + 1):
+                    prefixes.add('.'.join(split_info[:i]))
+
+            for module_id in module_id_list:
+                stack = [module_id - offset]
+                while len(stack) > 0:
+                    node = stack.pop()
+                    name = self._property('Module', node, 'name')
+                    if name in submodules:
+                        for attr in has_attribute.neighbors(node):
+                            ret[top_module][module_id].append('{}.{}'.format(name, self._property('Attribute', attr, 'name')))
+                    stack.extend(child for child in has_module.neighbors(node) if self._property('Module', child, 'name') in prefixes)
+
+    def packages_and_versions_by_module_lists(self, module_id_lists):
+        module_offset = self.offsets['Module']
+        version_offset = self.offsets['Version']
+        ret = {top_module: {} for top_module in module_id_lists}    # {top_module: {package: version_id_set}}
+        for top_module, module_id_list in module_id_lists.items():
+            for module_id in module_id_list:
+                for version in self.module_versions.neighbors(module_id - module_offset):
+                    for package in self.version_packages.neighbors(version):
+                        p = self._property('Package', package, 'name')
+                        if p not in ret[top_module]:
+                            ret[top_module][p] = set()
+                        ret[top_module][p].add(version_offset + version)
+        return ret
+
+    def require_subgraph(self, package_list):
+        has_version = self._out('Package', 'HAS_VERSION', 'Version')
+        requires = self._out('Version', 'REQUIRES', 'Package')
+
+        ret = []
+        for name in package_list:
+            string_id = self._string_id(name)
+            if string_id is None:
+                continue
+            for start in self.package_index.neighbors(string_id):
+                ret.append(self._require_subgraph(start, has_version, requires))
+        return ret
+
+    def packages_by_names(self, names):
+        ret = {}
+        for name in names:
+            string_id = self._string_id(name)
+            if string_id is not None:
+                ret[name] = [self._node('Package', index) for index in self.package_index.neighbors(string_id)]
+        return ret
+
+    def versions_by_packages(self, package_ids):
+        offset = self.offsets['Package']
+        has_version = self._out('Package', 'HAS_VERSION', 'Version')
+        return {package_id: [self._node('Version', index) for index in has_version.neighbors(package_id - offset)] for package_id in package_ids}
+
+    def requires_by_versions(self, version_ids):
+        offset = self.offsets['Version']
+        requires = self._out('Version', 'REQUIRES', 'Package')
+        ret = {}
+        for version_id in version_ids:
+            ret[version_id] = [(self._node('Package', requires.targets[edge]), self.strings[requires.columns['requirement'][edge]])
+                               for edge in requires.edges(version_id - offset)]
+        return ret
+
+    def _require_subgraph(self, start, has_version, requires):
+        # everything reachable by HAS_VERSION> and REQUIRES>, like apoc.path.subgraphAll
+        nodes = {('Package', start): self._node('Package', start)}
+        relationships = []
+        frontier = [('Package', start)]
+        while len(frontier) > 0:
+            next_frontier = []
+            for key in frontier:
+                label, index = key
+                if label == 'Package':
+                    out_edges = [('Version', has_version.targets[edge], 'HAS_VERSION', {}) for edge in has_version.edges(index)]
+                else:
+                    out_edges = [('Package', requires.targets[edge], 'REQUIRES', {'requirement': self.strings[requires.columns['requirement'][edge]]}) for edge in requires.edges(index)]
+                for end_label, end_index, rel_type, properties in out_edges:
+                    end_key = (end_label, end_index)
+                    if end_key not in nodes:
+                        nodes[end_key] = self._node(end_label, end_index)
+                        next_frontier.append(end_key)
+                    relationships.append(KGRelationship(nodes[key], nodes[end_key], rel_type, properties))
+            frontier = next_frontier
+        return [list(nodes.values()), relationships]
+
+
+def create_kg_stores(kg='neo4j'):
+    """Create the KG stores of both Python versions.
+    Parameters
+    ----------
+    kg : string
+        'neo4j': the Neo4j databases of docker_env on ports 7687 (Python 2) and 7697 (Python 3).
+        Otherwise a data directory of build_KG with the CSV files in <kg>/Python2/csv-data and
+        <kg>/Python3/csv-data (or <kg>/Python2 and <kg>/Python3), loaded by EmbeddedKG, or
+        their kg.snapshot opened by SnapshotKG.
+    Returns
+    -------
+    dict
+        {'Python2': KGStore, 'Python3': KGStore}
+    """
+
+    if kg == 'neo4j':
+        from neo4j import GraphDatabase
+        py2_driver = GraphDatabase.driver("bolt://localhost:7687", auth=('neo4j', 'neo4j'))
+        py3_driver = GraphDatabase.driver("bolt://localhost:7697", auth=('neo4j', 'neo4j'))
+        return {'Python2': Neo4jKG(py2_driver), 'Python3': Neo4jKG(py3_driver)}
+
+    from kg_snapshot import SNAPSHOT_FILE, SnapshotKG
+
+    stores = {}
+    for py_version in ('Python2', 'Python3'):
+        csv_dir = os.path.join(kg, py_version, 'csv-data')
+        if not os.path.isdir(csv_dir):
+            csv_dir = os.path.join(kg, py_version)
+
+        # the snapshot of the CSV files, unless they are changed after it's built
+        snapshot_path = os.path.join(csv_dir, SNAPSHOT_FILE)
+        if os.path.exists(snapshot_path):
+            snapshot = SnapshotKG(snapshot_path)
+            if not os.path.exists(os.path.join(csv_dir, 'nodes')) or snapshot.identity() == EmbeddedKG.csv_identity(csv_dir):
+                stores[py_version] = snapshot
+                continue
+            print('Warning: {} is older than the CSV files, load the CSV files instead'.format(snapshot_path))
+            snapshot.close()
+        stores[py_version] = EmbeddedKG(csv_dir)
+    return stores
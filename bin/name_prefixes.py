@@ -0,0 +1,72 @@
+class NamePrefixes(object):
+    """The dotted prefixes of the names of a snippet, interned once.
+
+    A module tree is reduced to the prefixes it contains by one set intersection, and trees
+    with the same prefixes share their score, so the many module ids of a top module (one per
+    package version) are mostly scored once. A new one is scored over the bits of its prefixes.
+    """
+    def __init__(self, names):
+        self.names = list(names)
+        self.bits = {}          # {prefix: bit}
+        self.chains = []        # [[(bit, prefix, parts)]] of each name, the longest prefix first
+        for name in self.names:
+            split_name = name.split('.')
+            length = len(split_name)
+            chain = []
+            for i in range(length):
+                prefix = '.'.join(split_name[:length-i])
+                if prefix not in self.bits:
+                    self.bits[prefix] = 1 << len(self.bits)
+                chain.append((self.bits[prefix], prefix, i))
+            self.chains.append(chain)
+        self.prefix_set = frozenset(self.bits)
+        self.degrees = {}       # {prefixes in a tree: match degree}
+        self.longest = {}       # {prefixes in a tree: longest proper prefixes}
+
+    def bitset(self, prefixes):
+        ret = 0
+        for prefix in prefixes:
+            ret |= self.bits[prefix]
+        return ret
+
+    def match_degree(self, tree_set):
+        """
+        Sum over the names: 1 if the name is in tree_set, else 1 - i/n for the longest prefix
+        in tree_set without i of the n parts of the name (0 without any).
+        """
+        if len(tree_set) == 0 or len(self.names) == 0:
+            return 0.0
+
+        prefixes = self.prefix_set.intersection(tree_set)
+        if prefixes not in self.degrees:
+            bitset = self.bitset(prefixes)
+            ret = 0.0
+            for chain in self.chains:
+                length = len(chain)
+                i = length
+                for bit, _, parts in chain:
+                    if bit & bitset:
+                        i = parts
+                        break
+                if i == 0:
+                    ret += 1
+                else:
+                    ret += 1 - i/length
+            self.degrees[prefixes] = ret
+        return self.degrees[prefixes]
+
+    def longest_prefixes(self, tree_set):
+        """The longest proper prefix in tree_set of each name, its first part without any."""
+        prefixes = self.prefix_set.intersection(tree_set)
+        if prefixes not in self.longest:
+            bitset = self.bitset(prefixes)
+            ret = set()
+            for chain in self.chains:
+                prefix = chain[-1][1]
+                for bit, item, parts in chain[1:]:
+                    if bit & bitset:
+                        prefix = item
+                        break
+                ret.add(prefix)
+            self.longest[prefixes] = ret
+        return set(self.longest[prefixes])
@@ -0,0 +1,398 @@
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import platform
+import itertools
+import threading
+import subprocess
+
+
+# The parser scripts shipped in the parse images
+PARSER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'docker_env', 'python_parser')
+
+
+def _load_parser_module():
+    """Import parse.py of the parse images, None if it can't run in this interpreter."""
+    if PARSER_DIR not in sys.path:
+        sys.path.insert(0, PARSER_DIR)
+    try:
+        import parse
+    except ImportError:
+        return None
+    return parse
+
+
+# Python versions of the parse images, for the standard library index
+PY2_VERSION = '2.7'
+PY3_VERSION = '3.8'
+
+# Seconds to wait for the response of a parse worker
+PARSE_TIMEOUT = 60
+
+# lib2to3 fixers that only rewrite Python 2 syntax, never the imported or used names
+PY2_SYNTAX_FIXERS = ['lib2to3.fixes.fix_{}'.format(name) for name in (
+    'except', 'exec', 'ne', 'numliterals', 'paren', 'print', 'raise', 'repr', 'tuple_params')]
+
+
+class ParserBackend(object):
+    """Parse snippets for one Python version.
+
+    parse() returns the dict of parse.py ({'imports', 'resources', 'attrs'}), or None if the
+    snippet can't be parsed by this Python version.
+    """
+    label = None
+
+    def parse(self, source):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class DockerBackend(ParserBackend):
+    """Run the parse image of a real interpreter, one container per snippet."""
+    def __init__(self, image, label):
+        import docker
+
+        self.image = image
+        self.label = label
+
+        # one mount dir per process, for the workers of batch inference
+        self.local_dir = os.path.abspath(os.path.join('mount', '{}-{}'.format(image.replace(':', '-'), os.getpid())))
+        if not os.path.isdir(self.local_dir):
+            os.makedirs(self.local_dir)
+
+        remote_dir = '/volumes/'
+        self.mount = docker.types.Mount(target=remote_dir, source=self.local_dir, type='bind', read_only=False)
+
+        self.local_file = os.path.join(self.local_dir, 'snippet.py')
+        self.remote_file = os.path.join(remote_dir, 'snippet.py')
+
+        self.client = docker.from_env()
+
+    def parse(self, source):
+        with open(self.local_file, 'w') as f:
+            f.write(source)
+
+        container = self.client.containers.run(image=self.image, detach=True, mounts=[self.mount], command=[self.remote_file])
+        container.wait(condition='not-running')['StatusCode']
+        run_logs = container.logs(stdout=True, stderr=True).decode().strip()
+        container.remove()
+        os.remove(self.local_file)
+
+        try:
+            return json.loads(run_logs)
+        except json.JSONDecodeError:
+            print(run_logs)
+            return None
+
+    def close(self):
+        shutil.rmtree(self.local_dir)
+        try:
+            # the mount dir is shared by the docker backends
+            os.rmdir(os.path.dirname(self.local_dir))
+        except OSError:
+            pass
+        self.client.close()
+
+
+class InProcessBackend(ParserBackend):
+    """Run the ParserVisitor of the parse images in this (Python 3) interpreter.
+
+    The snippet is checked against the grammar of this interpreter, which is the one of the
+    python3:parse image only in Python 3.8. Imports are told apart by the standard library of
+    Python 3.8, as in the python3:parse image.
+    """
+    def __init__(self):
+        self.parse_module = _load_parser_module()
+        if self.parse_module is None:
+            raise RuntimeError('The parser scripts can\'t be imported in Python {}'.format(platform.python_version()))
+        self.label = 'Python {}'.format(platform.python_version())
+
+    def parse(self, source):
+        ret = self.parse_module.parse_source(source, self.parse_module.ParserVisitor(PY3_VERSION))
+        if ret is None:
+            print('The snippet can\'t be parsed by {}.'.format(self.label))
+        return ret
+
+
+class Lib2to3Backend(ParserBackend):
+    """Check the snippet against the Python 2 grammar of lib2to3.
+
+    The grammar of lib2to3 also accepts most Python 3 syntax, so a snippet with syntax of
+    Python 3 only (see python3_only_syntax) is rejected. An accepted snippet is rewritten to
+    Python 3 syntax by the fixers in PY2_SYNTAX_FIXERS and walked by the ParserVisitor with the
+    standard library of Python 2.7. lib2to3 is removed in Python 3.13.
+    """
+    label = 'Python 2 grammar (lib2to3)'
+
+    def __init__(self):
+        import warnings
+        with warnings.catch_warnings():
+            # lib2to3 is deprecated since Python 3.9
+            warnings.simplefilter('ignore')
+            from lib2to3 import refactor, pytree, pygram
+            from lib2to3.pgen2 import token
+
+        self.parse_module = _load_parser_module()
+        if self.parse_module is None:
+            raise RuntimeError('The parser scripts can\'t be imported in Python {}'.format(platform.python_version()))
+        self.tool = refactor.RefactoringTool(PY2_SYNTAX_FIXERS)
+        self.pytree = pytree
+        self.syms = pygram.python_symbols
+        self.token = token
+
+    def parse(self, source):
+        if not source.endswith('\n'):
+            source += '\n'
+        try:
+            tree = self.tool.refactor_string(source, '<snippet>')
+        except Exception:
+            # lib2to3 raises ParseError or TokenError on a syntax error
+            print('The snippet can\'t be parsed by {}.'.format(self.label))
+            return None
+
+        syntax = self.python3_only_syntax(tree)
+        if syntax is not None:
+            print('The snippet can\'t be parsed by {}: {} of Python 3.'.format(self.label, syntax))
+            return None
+
+        ret = self.parse_module.parse_source(str(tree), self.parse_module.ParserVisitor(PY2_VERSION))
+        if ret is None:
+            print('The snippet can\'t be parsed by {}.'.format(self.label))
+        return ret
+
+
+    def python3_only_syntax(self, tree):
+        """The first syntax of Python 3 only in a lib2to3 tree, None without any.
+
+        The print function with keywords is already a syntax error in the Python 2 grammar.
+        """
+        syms, token = self.syms, self.token
+        for node in tree.pre_order():
+            if isinstance(node, self.pytree.Leaf):
+                # the prefix of a string ends at the first quote like the last one
+                if node.type == token.STRING and 'f' in node.value[:node.value.find(node.value[-1])].lower():
+                    return 'f-string'
+                if node.type in (token.ASYNC, token.AWAIT):
+                    return 'async/await'
+                if node.type == token.RARROW:
+                    return 'return annotation'
+                if node.type == token.AT and node.parent.type != syms.decorator:
+                    return 'matrix multiplication'
+                if node.type == token.ATEQUAL:
+                    return 'matrix multiplication'
+            elif node.type == syms.global_stmt and node.children[0].value == 'nonlocal':
+                return 'nonlocal'
+            elif node.type in (syms.tname, syms.annassign):
+                return 'annotation'
+            elif node.type == syms.namedexpr_test:
+                return 'assignment expression'
+            elif node.type == syms.star_expr:
+                return 'starred expression'
+            elif node.type == syms.yield_arg:
+                return 'yield from'
+            elif node.type == syms.raise_stmt and any(getattr(child, 'value', None) == 'from' for child in node.children):
+                return 'raise from'
+            elif node.type in (syms.typedargslist, syms.varargslist):
+                # keyword-only arguments after a bare *
+                for i, child in enumerate(node.children[:-1]):
+                    if child.type == token.STAR and node.children[i+1].type == token.COMMA:
+                        return 'keyword-only arguments'
+        return None
+
+
+def _response(line, request_id):
+    """The response to request_id in a line of a parse worker, None for any other output."""
+    try:
+        response = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(response, dict) or 'result' not in response or response.get('id') != request_id:
+        return None
+    if 'error' in response:
+        print('Parse worker error: {}'.format(response['error']))
+    return response
+
+
+class ParseWorker(object):
+    """A long-lived `parse.py --serve` process, fed with one JSON line per snippet.
+
+    Its stdout is read by a thread, so a worker which doesn't answer within timeout seconds
+    is killed instead of blocking the caller. Other output of the worker is skipped.
+    """
+    def __init__(self, command, timeout=PARSE_TIMEOUT):
+        self.command = command
+        self.timeout = timeout
+        self.process = None
+        self.lines = None
+        self.request_id = itertools.count()
+
+    def start(self):
+        self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        universal_newlines=True, bufsize=1)
+        self.lines = queue.Queue()
+        reader = threading.Thread(target=self._read_lines, args=(self.process.stdout, self.lines))
+        reader.daemon = True
+        reader.start()
+
+    @staticmethod
+    def _read_lines(stdout, lines):
+        for line in iter(stdout.readline, ''):
+            lines.put(line)
+        lines.put(None)
+
+    def request(self, source):
+        if self.process is None or self.process.poll() is not None:
+            self.start()
+
+        request_id = next(self.request_id)
+        self.process.stdin.write(json.dumps({'id': request_id, 'source': source}) + '\n')
+        self.process.stdin.flush()
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                line = self.lines.get(timeout=max(0, deadline - time.time()))
+            except queue.Empty:
+                self.kill()
+                raise RuntimeError('Parse worker timed out after {}s'.format(self.timeout))
+            if line is None:
+                raise RuntimeError('Parse worker exited with code {}'.format(self.process.wait()))
+            response = _response(line, request_id)
+            if response is not None:
+                return response['result']
+            print('Unexpected output of parse worker: {}'.format(line.rstrip()))
+
+    def request_once(self, source):
+        """Parse by a new process of the command, which exits after the snippet."""
+        try:
+            output = subprocess.run(self.command, input=json.dumps({'id': 0, 'source': source}) + '\n',
+                                    stdout=subprocess.PIPE, universal_newlines=True, timeout=self.timeout).stdout
+        except subprocess.TimeoutExpired:
+            raise RuntimeError('One-shot parse timed out after {}s'.format(self.timeout))
+        for line in output.splitlines():
+            response = _response(line, 0)
+            if response is not None:
+                return response['result']
+        raise RuntimeError('No response of one-shot parse')
+
+    def kill(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+    def close(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.stdin.close()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+
+class WorkerPoolBackend(ParserBackend):
+    """A pool of warm parse workers (local interpreters or parse containers) for one Python version.
+
+    parse() is thread-safe: each call borrows an idle worker, so up to `workers` snippets
+    are parsed at the same time. A worker which fails or times out is restarted, and the
+    snippet is parsed by a one-shot process instead.
+    """
+    def __init__(self, command, label, workers=1, timeout=PARSE_TIMEOUT):
+        self.label = label
+        self.workers = [ParseWorker(command, timeout) for _ in range(workers)]
+        self.idle = queue.Queue()
+        for worker in self.workers:
+            worker.start()
+            self.idle.put(worker)
+
+    def parse(self, source):
+        worker = self.idle.get()
+        try:
+            try:
+                ret = worker.request(source)
+            except (RuntimeError, IOError, ValueError) as e:
+                # the killed worker is started again by its next request
+                print('Restart parse worker: {}'.format(e))
+                worker.kill()
+                try:
+                    ret = worker.request_once(source)
+                except (RuntimeError, IOError, ValueError) as e:
+                    print('One-shot parse failed: {}'.format(e))
+                    ret = None
+        finally:
+            self.idle.put(worker)
+
+        if ret is None:
+            print('The snippet can\'t be parsed by {}.'.format(self.label))
+        return ret
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+
+
+def worker_command(image=None, interpreter=None):
+    """Command of a parse worker: a parse container, or parse.py in a local interpreter."""
+    if interpreter is not None:
+        return [interpreter, os.path.join(PARSER_DIR, 'parse.py'), '--serve']
+    return ['docker', 'run', '--interactive', '--rm', image, '--serve']
+
+
+def create_backends(backend='auto', workers=1, interpreters=None):
+    """Create the parser backends of both Python versions.
+    Parameters
+    ----------
+    backend : string
+        'docker': the parse images of Python 2.7.18 and 3.8.11.
+        'inprocess': ParserVisitor in this interpreter, lib2to3 for the Python 2 grammar
+                     (removed in Python 3.13, where it raises).
+        'auto': in-process for Python 3 when this interpreter has the grammar of the python3:parse
+                image (Python 3.8), docker otherwise. Python 2 is always parsed by docker, since
+                the grammar of lib2to3 is only close to the one of Python 2.7.
+        'pool': warm parse workers, the parse images or the local `interpreters`.
+    workers : int
+        Number of parse workers per Python version of the 'pool' backend.
+    interpreters : dict, optional
+        {'Python2': path, 'Python3': path} of local interpreters for the 'pool' backend.
+    Returns
+    -------
+    dict
+        {'Python2': ParserBackend, 'Python3': ParserBackend}
+    """
+
+    if backend not in ('auto', 'inprocess', 'docker', 'pool'):
+        raise ValueError('Unknown parser backend \"{}\"'.format(backend))
+
+    backends = {}
+    if backend == 'pool':
+        interpreters = interpreters or {}
+        for py_version, image, label in (('Python2', 'python2:parse', 'Python 2.7.18'), ('Python3', 'python3:parse', 'Python 3.8.11')):
+            interpreter = interpreters.get(py_version)
+            if interpreter is not None:
+                label = '{} ({})'.format(py_version, interpreter)
+            backends[py_version] = WorkerPoolBackend(worker_command(image, interpreter), label, workers)
+        return backends
+
+    if backend != 'docker':
+        in_process = [('Python2', Lib2to3Backend), ('Python3', InProcessBackend)]
+        if backend == 'auto':
+            in_process = [item for item in in_process if item[0] == 'Python3' and
+                          '.'.join(platform.python_version_tuple()[:2]) == PY3_VERSION]
+        for py_version, backend_class in in_process:
+            try:
+                backends[py_version] = backend_class()
+            except (ImportError, RuntimeError) as e:
+                if backend == 'inprocess':
+                    raise
+                print('In-process parser of {} is not available: {}'.format(py_version, e))
+
+    if 'Python2' not in backends:
+        backends['Python2'] = DockerBackend('python2:parse', 'Python 2.7.18')
+    if 'Python3' not in backends:
+        backends['Python3'] = DockerBackend('python3:parse', 'Python 3.8.11')
+    return backends
@@ -1,88 +1,118 @@
-import docker
 import os
-import shutil
 import json
-import neo4j
-from neo4j import GraphDatabase
-from packaging.version import parse
-from packaging.specifiers import SpecifierSet
 from packaging.utils import canonicalize_name
+from packaging.requirements import Requirement
 import time
 import copy
+import heapq
+import hashlib
 import pycryptosat
-import itertools
 import sys
+import contextlib
+import traceback
+import multiprocessing
+import multiprocessing.util
+from concurrent.futures import ThreadPoolExecutor
+from parse_backends import create_backends
+from kg_cache import KGCache, MISSING
+from kg_store import Neo4jKG, create_kg_stores
+from sat_encoding import VariableMap, at_most_one, weighted_sum, at_most_value
+from version_index import VersionIndex
+from name_prefixes import NamePrefixes
+from kg_records import CompactSubgraph, PACKAGE_KIND
 
 
 class PythonParser(object):
-    def __init__(self):
-        self.python2_tag = 'python2:parse'
-        self.python3_tag = 'python3:parse'
-        
-        self.local_dir = os.path.abspath('mount')
-        if not os.path.isdir(self.local_dir):
-            os.mkdir(self.local_dir)
-        
-        remote_dir = '/volumes/'
-        self.mount = docker.types.Mount(target=remote_dir, source=self.local_dir, type='bind', read_only=False)
-        
-        self.local_file = os.path.join(self.local_dir, 'snippet.py')
-        self.remote_file = os.path.join(remote_dir, 'snippet.py')
-
-        self.client = docker.from_env()
+    def __init__(self, backend='auto', workers=1, interpreters=None):
+        # {'Python2': ParserBackend, 'Python3': ParserBackend}
+        self.backends = create_backends(backend, workers, interpreters)
+        # parse in Python 2 and Python 3 at the same time
+        self.executor = ThreadPoolExecutor(max_workers=2)
 
 
     def parse_pyfile(self, pyfile):
-        parse_results = {'Python2': None, 'Python3': None}
-        shutil.copyfile(pyfile, self.local_file)
+        with open(pyfile, 'r') as f:
+            source = f.read()
+        return self.parse_source(source)
 
-        # Python 2
-        container = self.client.containers.run(image=self.python2_tag, detach=True, mounts=[self.mount], command=[self.remote_file])
-        container.wait(condition='not-running')['StatusCode']
-        run_logs = container.logs(stdout=True, stderr=True).decode().strip()
-        container.remove()
-        try:
-            parse_results['Python2'] = json.loads(run_logs)
-            print('Parsing result in Python 2.7.18:\n{}'.format(parse_results['Python2']))
-        except json.JSONDecodeError:
-            print(run_logs)
-        
-        # Python3
-        container = self.client.containers.run(image=self.python3_tag, detach=True, mounts=[self.mount], command=[self.remote_file])
-        container.wait(condition='not-running')['StatusCode']
-        run_logs = container.logs(stdout=True, stderr=True).decode().strip()
-        container.remove()
-        try:
-            parse_results['Python3'] = json.loads(run_logs)
-            print('Parsing result in Python 3.8.11:\n{}'.format(parse_results['Python3']))
-        except json.JSONDecodeError:
-            print(run_logs)
+    def parse_source(self, source):
+        parse_results = {'Python2': None, 'Python3': None}
+        futures = {py_version: self.executor.submit(self.backends[py_version].parse, source) for py_version in parse_results}
+        for py_version in ('Python2', 'Python3'):
+            parse_results[py_version] = futures[py_version].result()
+            if parse_results[py_version] is not None:
+                print('Parsing result in {}:\n{}'.format(self.backends[py_version].label, parse_results[py_version]))
         
-        os.remove(self.local_file)
         return parse_results
     
     def close(self):
-        shutil.rmtree(self.local_dir)
-        self.client.close()
+        self.executor.shutdown()
+        for backend in self.backends.values():
+            backend.close()
 
 
 class subGraph(object):
-    def __init__(self, degree_table={}, in_table={}):
-        self.degree_table = degree_table  # {id: set()}
-        self.in_table = in_table  # {id: set()}
+    """Nodes and edges selected by the heuristic algorithm.
+
+    Changes through add_node, add_edge and remove_edge are recorded in a trail, so that a
+    failed branch can roll back to a checkpoint instead of working on a copy of the graph.
+    """
+    def __init__(self, degree_table=None, in_table=None):
+        self.degree_table = degree_table if degree_table is not None else {}  # {id: set()}
+        self.in_table = in_table if in_table is not None else {}  # {id: set()}
+        self.trail = []  # [(operation, node, child)]
+        self.added_at = {}  # {(node, child): position in the trail of the last add_edge}
+    
+    def add_node(self, nid):
+        if nid not in self.degree_table:
+            self.degree_table[nid] = set()
+            self.in_table[nid] = set()
+            self.trail.append(('node', nid, None))
+    
+    def add_edge(self, nid, child):
+        if child not in self.degree_table[nid]:
+            self.degree_table[nid].add(child)
+            self.in_table[child].add(nid)
+            self.added_at[(nid, child)] = len(self.trail)
+            self.trail.append(('add', nid, child))
+    
+    def remove_edge(self, nid, child):
+        self.degree_table[nid].remove(child)
+        self.in_table[child].remove(nid)
+        self.trail.append(('remove', nid, child))
+    
+    def checkpoint(self):
+        return len(self.trail)
     
-    def copy_graph(self):
-        return subGraph(copy.deepcopy(self.degree_table), copy.deepcopy(self.in_table))
+    def has_edge(self, nid, child):
+        return nid in self.degree_table and child in self.degree_table[nid]
     
-    def set_graph(self, graph):
-        self.degree_table = copy.deepcopy(graph.degree_table)
-        self.in_table = copy.deepcopy(graph.in_table)
+    def added_since(self, edge, checkpoint):
+        """If edge was added after checkpoint, even if rolled back since."""
+        return self.added_at.get(edge, -1) >= checkpoint
+    
+    def rollback(self, checkpoint):
+        """Undo the changes after checkpoint, latest first."""
+        while len(self.trail) > checkpoint:
+            operation, nid, child = self.trail.pop()
+            if operation == 'node':
+                self.degree_table.pop(nid)
+                self.in_table.pop(nid)
+            elif operation == 'add':
+                self.degree_table[nid].remove(child)
+                self.in_table[child].remove(nid)
+            else:
+                self.degree_table[nid].add(child)
+                self.in_table[child].add(nid)
     
     def clear_graph(self):
         for key in list(self.degree_table.keys()):
             if len(self.degree_table[key]) == 0 and len(self.in_table[key]) == 0:
                 self.degree_table.pop(key)
                 self.in_table.pop(key)
+        # nodes are removed out of the trail
+        self.trail = []
+        self.added_at = {}
 
 
 class pvGraph(object):
@@ -93,47 +123,126 @@ class pvGraph(object):
         self.install_set = set()    # The packages that need to be explicitly installed
 
         self.install_pair = []  # [(package, version)]
+        self.install_groups = []    # [[(package, version)]], a group per pip install, cycles in one group
     
 
     def topo_sort(self):
+        """
+        Install order of the packages, the required packages first: Kahn's algorithm over the
+        strongly connected components, the component of the earliest node in degree_table first
+        among the ready ones. Return False if there exists a circle.
+        """
         for key, value in self.in_table.items():
             if len(value) == 0:
                 # needs to be explicitly installed
                 self.install_set.add(key)
 
-        while len(self.degree_table) > 0:
-            has_find = False
-            for key, value in list(self.degree_table.items()):
-                if len(value) == 0:
-                    has_find = True
-                    # install pair
-                    if key in self.install_set:
-                        self.install_pair.append(self.node_dict[key])
-                    # delete the connected nodes
-                    for in_node in self.in_table[key]:
-                        self.degree_table[in_node].remove(key)
-                    # delete itself
-                    self.degree_table.pop(key)
-                    self.in_table.pop(key)
-                    
-                    break
-            
-            if not has_find:
-                # There exsits a circle!
-                for key in self.degree_table:
-                    if key in self.install_set:
-                        self.install_pair.append(self.node_dict[key])
-                return False
-        
-        return True
+        position = {key: i for i, key in enumerate(self.degree_table)}
+        components = self._strongly_connected_components()
+        component_of = {}
+        for c, component in enumerate(components):
+            component.sort(key=position.get)
+            for key in component:
+                component_of[key] = c
+
+        # dependents of each component, and the number of components each one requires
+        dependents = [set() for _ in components]
+        for key, value in self.degree_table.items():
+            c = component_of[key]
+            for pid in value:
+                if component_of[pid] != c:
+                    dependents[component_of[pid]].add(c)
+        pending = [0] * len(components)
+        for items in dependents:
+            for c in items:
+                pending[c] += 1
+
+        ready = [(position[component[0]], c) for c, component in enumerate(components) if pending[c] == 0]
+        heapq.heapify(ready)
+        while len(ready) > 0:
+            _, c = heapq.heappop(ready)
+            group = [self.node_dict[key] for key in components[c] if key in self.install_set]
+            if len(group) > 0:
+                self.install_pair.extend(group)
+                self.install_groups.append(group)
+            for item in dependents[c]:
+                pending[item] -= 1
+                if pending[item] == 0:
+                    heapq.heappush(ready, (position[components[item][0]], item))
+
+        return all(len(component) == 1 and component[0] not in self.degree_table[component[0]] for component in components)
+
+
+    def _strongly_connected_components(self):
+        """Tarjan's algorithm without recursion, the components of the required packages first."""
+        index = {}
+        low = {}
+        stack = []
+        on_stack = set()
+        components = []
+        for root in self.degree_table:
+            if root in index:
+                continue
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(self.degree_table[root]))]
+            while len(work) > 0:
+                key, children = work[-1]
+                for pid in children:
+                    if pid not in index:
+                        index[pid] = low[pid] = len(index)
+                        stack.append(pid)
+                        on_stack.add(pid)
+                        work.append((pid, iter(self.degree_table[pid])))
+                        break
+                    if pid in on_stack:
+                        low[key] = min(low[key], index[pid])
+                else:
+                    work.pop()
+                    if len(work) > 0:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[key])
+                    if low[key] == index[key]:
+                        component = []
+                        while True:
+                            item = stack.pop()
+                            on_stack.discard(item)
+                            component.append(item)
+                            if item == key:
+                                break
+                        components.append(component)
+        return components
 
 
 ROOT_TYPE = 'root node'
 MODULE_TYPE = 'module node'
 PACKAGE_TYPE = 'package node'
 VERSION_TYPE = 'version node'
+# solves for the preferred versions in the incremental SAT mode
+MAX_PREFERENCE_SOLVES = 1000
+# objective of the optimal SAT mode: the rank of the version of each package in sorted_degree_table
+# (newer Success versions first), and INSTALL_WEIGHT for each package to install
+INSTALL_WEIGHT = 1
 class RequireGraph(object):
-    def __init__(self, candidate_libraries, requires_info):
+    def __init__(self, candidate_libraries, requires_info, amo_encoding='auto', learn_conflicts=False, backjump=False, incremental_sat=False,
+                 optimize_sat=False, sat_time_budget=10.0, preprocess=False):
+        # at-most-one encoding of the versions of a package in the SAT solver
+        self.amo_encoding = amo_encoding
+        self.sat_stats = None
+        # SAT solver encoded once, and preferred versions by assumptions in the incremental mode
+        self.incremental_sat = incremental_sat
+        # minimize the objective in the SAT solver within sat_time_budget seconds, the best model so far after
+        self.optimize_sat = optimize_sat
+        self.sat_time_budget = sat_time_budget
+        self.solver = None
+        self.variables = None
+        # conflict-driven learning and backjumping in the heuristic algorithm
+        self.learn_conflicts = learn_conflicts
+        self.backjump = backjump
+        self.nogoods = {}               # {id: [nogood]}, nogood: frozenset of requirement edges (id, package id)
+        self.conflict = None            # requirement edges of the last failure, None if unknown
+        self.heuristic_stats = {'nodes': 0, 'conflicts': 0, 'prunes': 0, 'backjumps': 0}
         self.degree_table = {}          # {id: {id: edge_info}}
         self.node_dict = {}             # {id: node}
         self.is_conjunction = {}        # {id: True/False}
@@ -143,23 +252,33 @@ class RequireGraph(object):
 
         # packages and versions (nodes and relationships)
         package_dict = {}
-        for record in requires_info:
-            # nodes
-            for node in record[0]:
-                self.node_dict[node.id] = node
-                if node.id not in self.degree_table:
-                    self.degree_table[node.id] = {}
-                    if 'Package' in node.labels:
-                        self.node_type[node.id] = PACKAGE_TYPE
-                        package_dict[node['name']] = node.id
-                        self.is_conjunction[node.id] = False
-                    else:
-                        self.node_type[node.id] = VERSION_TYPE
-                        self.is_conjunction[node.id] = True
-            # relationships
-            for rel in record[1]:
-                # version REQUIRES package: requirement (str)
-                self.degree_table[rel.start_node.id][rel.end_node.id] = rel.get('requirement', default=None)
+        if isinstance(requires_info, CompactSubgraph):
+            self._load_compact_subgraph(requires_info, package_dict)
+        else:
+            for record in requires_info:
+                # nodes
+                for node in record[0]:
+                    self.node_dict[node.id] = node
+                    if node.id not in self.degree_table:
+                        self.degree_table[node.id] = {}
+                        if 'Package' in node.labels:
+                            self.node_type[node.id] = PACKAGE_TYPE
+                            package_dict[node['name']] = node.id
+                            self.is_conjunction[node.id] = False
+                        else:
+                            self.node_type[node.id] = VERSION_TYPE
+                            self.is_conjunction[node.id] = True
+                # relationships
+                for rel in record[1]:
+                    # version REQUIRES package: requirement (str)
+                    self.degree_table[rel.start_node.id][rel.end_node.id] = rel.get('requirement', default=None)
+
+        # parse the versions once, requirements are matched by bitsets over the versions of a package
+        self.versions = VersionIndex()
+        for nid, node_type in self.node_type.items():
+            if node_type == PACKAGE_TYPE:
+                self.versions.add_package(nid, {vid: self.node_dict[vid]['version'] for vid in self.degree_table[nid]})
+        self.versions.build()
 
         # virtual root node
         virtual_index = -1
@@ -192,6 +311,9 @@ class RequireGraph(object):
                 if len(vid_set) == 0:
                     # module REQUIRES package: requirement (str, all)
                     self.degree_table[virtual_index][pid] = ''
+                elif isinstance(vid_set, str):
+                    # requirement hint REQUIRES package: requirement (str)
+                    self.degree_table[virtual_index][pid] = vid_set
                 else:
                     # module REQUIRES package: requirement (set)
                     self.degree_table[virtual_index][pid] = vid_set
@@ -211,13 +333,188 @@ class RequireGraph(object):
             else:
                 # version node: sort the packages by the number of versions
                 self.sorted_degree_table[nid] = sorted(list(neighbor_dict), key=lambda item:len(self.degree_table[item]))
+
+        # {version id: index in the sorted versions of its package}
+        self.version_rank = {}
+        for nid, node_type in self.node_type.items():
+            if node_type == PACKAGE_TYPE:
+                for index, vid in enumerate(self.sorted_degree_table[nid]):
+                    self.version_rank[vid] = index
+
+        # the SAT solver works on degree_table and sorted_degree_table, pruned by the preprocessing;
+        # the heuristic algorithm and the installation order (simulating pip) on the full tables
+        self.full_degree_table = self.degree_table
+        self.full_sorted_degree_table = self.sorted_degree_table
+        self.preprocess_stats = None
+        # [[(package, version)]] of infer_install_pairs, a group per pip install
+        self.install_groups = []
+        if preprocess:
+            self._preprocess()
+    
+
+    def _load_compact_subgraph(self, graph, package_dict):
+        """The nodes and relationships of a CompactSubgraph, in the order of its records."""
+        # one int object per id, shared by the tables
+        ids = graph.ids.tolist()
+        for i in range(len(graph)):
+            nid = ids[i]
+            node = graph.node(i)
+            self.node_dict[nid] = node
+            self.degree_table[nid] = {}
+            if graph.kinds[i] == PACKAGE_KIND:
+                self.node_type[nid] = PACKAGE_TYPE
+                package_dict[node['name']] = nid
+                self.is_conjunction[nid] = False
+            else:
+                self.node_type[nid] = VERSION_TYPE
+                self.is_conjunction[nid] = True
+        targets, edge_requirements, requirements = graph.targets, graph.edge_requirements, graph.requirements
+        for i in range(len(graph)):
+            children = self.degree_table[ids[i]]
+            for edge in range(graph.offsets[i], graph.offsets[i+1]):
+                children[ids[targets[edge]]] = requirements[edge_requirements[edge]]
+    
+
+    def _preprocess(self):
+        """Prune the nodes out of any solution, to a fixpoint: Fail versions, versions out of all the
+        requirements on their package or out of a requirement of a mandatory node, versions requiring
+        a package without versions left, and the nodes unreachable from the root. The tables are
+        kept unpruned if a module is left without candidates, for the solvers to report it."""
+        table = self.full_degree_table
+        in_table = {nid: [] for nid in table}
+        for nid, children in table.items():
+            for child in children:
+                in_table[child].append(nid)
+
+        # bitsets of the versions left in the packages of the KG
+        alive = {}
+        for nid, node_type in self.node_type.items():
+            if node_type == PACKAGE_TYPE and self.node_dict[nid] is not None:
+                alive[nid] = self.versions.bits_of(item for item in table[nid] if self.node_dict[item]['install_status'] != 'Fail')
+        removed = set()
+
+        while True:
+            reachable = self._reachable_nodes(removed, alive)
+            mandatory = self._mandatory_edges(reachable, removed, alive)
+            has_change = False
+            for pid in alive:
+                if pid not in reachable:
+                    continue
+                any_allowed = 0
+                all_allowed = alive[pid]
+                for nid in in_table[pid]:
+                    if nid in reachable:
+                        allowed = self._requirement_bits(nid, pid)
+                        any_allowed |= allowed
+                        if (nid, pid) in mandatory:
+                            all_allowed &= allowed
+                if alive[pid] & any_allowed & all_allowed != alive[pid]:
+                    alive[pid] &= any_allowed & all_allowed
+                    has_change = True
+
+            for pid in alive:
+                if pid in reachable:
+                    for vid in table[pid]:
+                        if vid in removed or not self.versions.contains(alive[pid], vid):
+                            continue
+                        # a required package without versions left in the requirement
+                        if any(alive[child] & self._requirement_bits(vid, child) == 0 for child in table[vid] if child in alive):
+                            alive[pid] &= ~(1 << self.versions.position[vid])
+                            has_change = True
+                    for vid in table[pid]:
+                        if vid not in removed and not self.versions.contains(alive[pid], vid):
+                            removed.add(vid)
+
+            if not has_change:
+                break
+
+        live_table = {nid: set(self._live_children(nid, removed, alive)) for nid in reachable}
+        for nid in reachable:
+            if self.node_type[nid] == MODULE_TYPE and len(live_table[nid]) == 0:
+                # no candidate package left
+                return
+
+        self.degree_table = {}
+        self.sorted_degree_table = {}
+        for nid, children in table.items():
+            if nid in reachable:
+                self.degree_table[nid] = {}
+                for child, info in children.items():
+                    if child in live_table[nid]:
+                        if isinstance(info, set):
+                            info = set(item for item in info if item in reachable)
+                        self.degree_table[nid][child] = info
+                self.sorted_degree_table[nid] = [child for child in self.full_sorted_degree_table[nid] if child in live_table[nid]]
+        self.preprocess_stats = {
+            'nodes': len(table),
+            'edges': sum(len(children) for children in table.values()),
+            'kept_nodes': len(self.degree_table),
+            'kept_edges': sum(len(children) for children in self.degree_table.values()),
+        }
+    
+
+    def _requirement_bits(self, nid, pid):
+        """Bitset of the versions of package pid allowed by the requirement of node nid."""
+        req = self.full_degree_table[nid][pid]
+        if isinstance(req, set):
+            return self.versions.bits_of(item for item in req if item in self.versions.position)
+        return self.versions.bits(pid, req)
+    
+
+    def _live_children(self, nid, removed, alive):
+        """Children of nid, without the removed versions and the packages of the KG without
+        versions left in the requirement of nid. A module with candidate versions is met only
+        by them in the SAT solver, so its other candidate packages are not live."""
+        children = self.full_degree_table[nid]
+        by_versions = self.node_type[nid] == MODULE_TYPE and any(isinstance(req, set) for req in children.values())
+        for child in children:
+            if child in removed or (by_versions and not isinstance(children[child], set)):
+                continue
+            if child in alive and alive[child] & self._requirement_bits(nid, child) == 0:
+                continue
+            yield child
+    
+
+    def _reachable_nodes(self, removed, alive):
+        """Nodes reachable from the root by _live_children."""
+        reachable = {-1}
+        check_list = [-1]
+        while len(check_list) > 0:
+            nid = check_list.pop()
+            for child in self._live_children(nid, removed, alive):
+                if child in reachable:
+                    continue
+                reachable.add(child)
+                check_list.append(child)
+        return reachable
+    
+
+    def _mandatory_edges(self, reachable, removed, alive):
+        """Edges in every solution, with their requirements: the edges of a mandatory root or
+        version, and the edge to the only candidate left of a mandatory module or package.
+        A mandatory node is the root or the end of a mandatory edge."""
+        mandatory = set()
+        visited = {-1}
+        check_list = [-1]
+        while len(check_list) > 0:
+            nid = check_list.pop()
+            children = [child for child in self._live_children(nid, removed, alive) if child in reachable]
+            if not self.is_conjunction[nid]:
+                if len(children) != 1:
+                    continue
+            for child in children:
+                mandatory.add((nid, child))
+                if child not in visited:
+                    visited.add(child)
+                    check_list.append(child)
+        return mandatory
     
 
     def _sort_versions(self, version_id_list):
         '''
             Sort versions by install status, newest
         '''
-        sorted_versions = sorted(version_id_list, key=lambda item:parse(self.node_dict[item]['version']), reverse=True)
+        sorted_versions = sorted(version_id_list, key=self.versions.rank.__getitem__)
 
         success_list = []
         unseen_list = []
@@ -268,8 +565,8 @@ class RequireGraph(object):
                 print('\n')
     
 
-    def _filter_child_id(self, optional_child, spec):
-        return [item for item in optional_child if self.node_dict[item]['version'] in spec]
+    def _filter_child_id(self, optional_child, bitset):
+        return self.versions.filter(optional_child, bitset)
     
 
     def _get_install_graph(self, graph):
@@ -314,15 +611,15 @@ class RequireGraph(object):
                     pv_graph.degree_table[nid].add(pid)
                     pv_graph.in_table[pid].add(nid)
                 
-                # judge if package needs to be explicitly installed
-                version_list = self._sort_versions(self.degree_table[nid])
+                # judge if package needs to be explicitly installed, all versions for pip
+                version_list = self._sort_versions(self.full_degree_table[nid])
                 each_version = None
-                all_req = SpecifierSet(prereleases=True)
+                all_req = self.versions.all_bits(nid)
                 has_req = False
                 for in_node in graph.in_table[nid]:
-                    req = self.degree_table[in_node][nid]
+                    req = self.full_degree_table[in_node][nid]
                     if isinstance(req, str):
-                        spec = SpecifierSet(req, prereleases=True)
+                        spec = self.versions.bits(nid, req)
                         # newest version in this requirement
                         optional_versions = self._filter_child_id(version_list, spec)
                         if len(optional_versions) == 0:
@@ -330,8 +627,8 @@ class RequireGraph(object):
                             print(self._get_node_name(nid))
                             print(self._get_node_name(vid))
                             print([self._get_node_name(item) for item in version_list])
-                            print(spec)
-                            print(self._get_node_name(vid) in spec)
+                            print(req)
+                            print(self.versions.contains(spec, vid))
                             continue
 
                         version = optional_versions[0]
@@ -356,7 +653,7 @@ class RequireGraph(object):
     def _get_optional_children_id(self, optional_children, subgraph, node_id):
         ret = copy.deepcopy(optional_children)
         if self.node_type[node_id] == PACKAGE_TYPE:
-            all_req = SpecifierSet(prereleases=True)
+            all_req = self.versions.all_bits(node_id)
             for nid in subgraph.in_table[node_id]:
                 req_info = self.degree_table[nid][node_id]
                 if req_info is None:
@@ -364,9 +661,9 @@ class RequireGraph(object):
                 if isinstance(req_info, set):
                     ret = [item for item in ret if item in req_info]
                 elif req_info != '':
-                    all_req &= SpecifierSet(req_info, prereleases=True)
+                    all_req &= self.versions.bits(node_id, req_info)
                 
-            ret = [item for item in ret if self.node_dict[item]['version'] in all_req]
+            ret = self._filter_child_id(ret, all_req)
             ret = self._sort_versions(ret)
 
         return ret
@@ -374,24 +671,31 @@ class RequireGraph(object):
 
     # Our heuristic algorithm
     def _heuristic_method(self, subgraph, node_id, father_id=None):
-        temp_subgraph = subgraph.copy_graph()
+        self.heuristic_stats['nodes'] += 1
+        if self.learn_conflicts and self.node_type[node_id] == VERSION_TYPE:
+            nogood = self._violated_nogood(subgraph, node_id)
+            if nogood is not None:
+                # a learned conflict with the requirements of this version
+                self.heuristic_stats['prunes'] += 1
+                self.conflict = None
+                if father_id is not None:
+                    self.conflict = frozenset(edge for edge in nogood if edge[0] != node_id) | {(father_id, node_id)}
+                return False
+
+        # roll back to the checkpoint when failing
+        checkpoint = subgraph.checkpoint()
 
-        # save to temp_subgraph
-        if node_id not in temp_subgraph.degree_table:
-            temp_subgraph.degree_table[node_id] = set()
-            temp_subgraph.in_table[node_id] = set()
+        subgraph.add_node(node_id)
         if father_id is not None:
-            temp_subgraph.degree_table[father_id].add(node_id)
-            temp_subgraph.in_table[node_id].add(father_id)
+            subgraph.add_edge(father_id, node_id)
 
         if self.is_conjunction[node_id]:
             # root or version
             for child in self.sorted_degree_table[node_id]:
-                if not self._heuristic_method(temp_subgraph, child, node_id):
+                if not self._heuristic_method(subgraph, child, node_id):
                     # Maintain the original state
-                    return False
+                    return self._heuristic_fail(subgraph, checkpoint, node_id, father_id)
             
-            subgraph.set_graph(temp_subgraph)
             return True
         else:
             # module or package
@@ -401,7 +705,6 @@ class RequireGraph(object):
                 all_children = self.sorted_degree_table[node_id]
             elif len(self.degree_table[node_id]) == 0:
                 # unknown package
-                subgraph.set_graph(temp_subgraph)
                 return True
             else:
                 # all_children = self.sorted_degree_table[node_id]
@@ -409,11 +712,13 @@ class RequireGraph(object):
                 all_children = [item for item in self.sorted_degree_table[node_id] if self.node_dict[item]['install_status'] != 'Fail']
                 # label_children = [self.node_dict[item] for item in self.sorted_degree_table[node_id]]
 
-            optional_children = self._get_optional_children_id(all_children, temp_subgraph, node_id)
+            # requirement edges of the failure: the conflicts of all children
+            conflict = set()
+            optional_children = self._get_optional_children_id(all_children, subgraph, node_id)
             if len(optional_children) > 0:
                 current_child = None
                 for child in self.degree_table[node_id]:
-                    if child in temp_subgraph.degree_table and len(temp_subgraph.in_table[child]) > 0:
+                    if child in subgraph.degree_table and len(subgraph.in_table[child]) > 0:
                         current_child = child
                         break
                 
@@ -424,26 +729,22 @@ class RequireGraph(object):
                         optional_children.insert(0, current_child)
                     elif current_child in optional_children:
                         # package node: keep the version
-                        if current_child not in temp_subgraph.degree_table[node_id]:
-                            temp_subgraph.degree_table[node_id].add(current_child)
-                            temp_subgraph.in_table[current_child].add(node_id)
-                        subgraph.set_graph(temp_subgraph)
+                        subgraph.add_edge(node_id, current_child)
                         return True
                     else:
                         # package node: delete the current version
-                        temp_subgraph.degree_table[node_id].remove(current_child)
-                        temp_subgraph.in_table[current_child].remove(node_id)
+                        conflict = None
+                        subgraph.remove_edge(node_id, current_child)
                         check_list = [current_child]
                         while len(check_list) > 0:
                             record_list = []
                             for item in check_list:
-                                if len(temp_subgraph.in_table[item]) == 0:
-                                    for del_child in list(temp_subgraph.degree_table[item]):
-                                        temp_subgraph.degree_table[item].remove(del_child)
-                                        temp_subgraph.in_table[del_child].remove(item)
+                                if len(subgraph.in_table[item]) == 0:
+                                    for del_child in list(subgraph.degree_table[item]):
+                                        subgraph.remove_edge(item, del_child)
                                         record_list.append(del_child)
                                 else:
-                                    if not self._heuristic_method(temp_subgraph, item):
+                                    if not self._heuristic_method(subgraph, item):
                                         print('Unexpected fail during deletion!')
                                         print('Suspect result...')
                             
@@ -453,10 +754,20 @@ class RequireGraph(object):
                 child = None
                 while index < len(optional_children):
                     child = optional_children[index]
-                    if self._heuristic_method(temp_subgraph, child, node_id):
-                        subgraph.set_graph(temp_subgraph)
+                    if self._heuristic_method(subgraph, child, node_id):
                         return True
                     else:
+                        if conflict is not None:
+                            if self.conflict is None:
+                                conflict = None
+                            elif self.backjump and (node_id, child) not in self.conflict:
+                                # the conflict is not caused by this child, the other children would fail too
+                                self.heuristic_stats['backjumps'] += 1
+                                self.conflict = frozenset(self.conflict)
+                                return self._heuristic_fail(subgraph, checkpoint, node_id, father_id)
+                            else:
+                                conflict |= self.conflict - {(node_id, child)}
+
                         req = self.degree_table[node_id][child]
                         index += 1
                         while index < len(optional_children):
@@ -466,7 +777,18 @@ class RequireGraph(object):
                                 index += 1
                             else:
                                 break
+            elif self.node_type[node_id] == PACKAGE_TYPE and (self.learn_conflicts or self.backjump):
+                # no version of the package meets the requirements
+                conflict = self._minimal_conflict(subgraph, node_id, all_children, father_id)
+                if self.learn_conflicts:
+                    self._learn_nogood(conflict)
+            else:
+                conflict = None
             
+            if conflict is not None and len(optional_children) > 0:
+                # and the requirements on the node
+                conflict |= {(nid, node_id) for nid in subgraph.in_table[node_id]}
+            self.conflict = None if conflict is None else frozenset(conflict)
             
             # print the conflict package
             # print('Conflict in our heuristic algorithm : ')
@@ -475,41 +797,134 @@ class RequireGraph(object):
             # print(optional_children)
             # print(label_children)
 
-            for nid in temp_subgraph.in_table[node_id]:
+            for nid in subgraph.in_table[node_id]:
                 req = self.degree_table[nid][node_id]
                 if isinstance(req, set):
                     versions = self._sort_versions(req)
                     req = [self._get_node_name(item) for item in versions]
                 
                 parent_node = ''
-                if self.node_type[nid] == VERSION_TYPE:
-                    parent_node = self._get_node_name(list(temp_subgraph.in_table[nid])[0])
+                if self.node_type[nid] == VERSION_TYPE and len(subgraph.in_table[nid]) > 0:
+                    parent_node = self._get_node_name(list(subgraph.in_table[nid])[0])
                 # print('- {} {}: {}'.format(parent_node, self._get_node_name(nid), req))
             
-            return False
+            return self._heuristic_fail(subgraph, checkpoint, node_id, father_id)
     
 
-    def _sat_solver(self):
-        # reload SAT solver
-        solver = pycryptosat.Solver()
+    def _heuristic_fail(self, subgraph, checkpoint, node_id, father_id):
+        """Roll back a failed node. The edges of the conflict added under the node are replaced by
+        the edge choosing the node, or the conflict is unknown without father."""
+        if self.conflict is not None:
+            added = [edge for edge in self.conflict if subgraph.added_since(edge, checkpoint)]
+            if len(added) > 0:
+                if father_id is None:
+                    self.conflict = None
+                else:
+                    self.conflict = self.conflict.difference(added) | {(father_id, node_id)}
+        subgraph.rollback(checkpoint)
+        return False
+    
+
+    def _minimal_conflict(self, subgraph, package_id, all_children, father_id):
+        """A minimal set of the requirement edges into package_id leaving none of all_children."""
+        installable = self.versions.bits_of(all_children)
+        allowed = {}
+        for nid in subgraph.in_table[package_id]:
+            allowed[(nid, package_id)] = self._allowed_versions(nid, package_id)
+
+        conflict = list(allowed)
+        for edge in list(conflict):
+            rest = [item for item in conflict if item != edge]
+            bitset = installable
+            for item in rest:
+                bitset &= allowed[item]
+            if bitset == 0:
+                conflict = rest
+        if len(conflict) == 0 and father_id is not None:
+            # no installable version at all
+            conflict = [(father_id, package_id)]
+        return frozenset(conflict)
+    
+
+    def _learn_nogood(self, nogood):
+        # a nogood is indexed by the source of each of its edges
+        if len(nogood) == 0 or nogood in self.nogoods.get(next(iter(nogood))[0], []):
+            return
+        for nid, _ in nogood:
+            self.nogoods.setdefault(nid, []).append(nogood)
+        self.heuristic_stats['conflicts'] += 1
+    
+
+    def _violated_nogood(self, subgraph, version_id):
+        """A learned nogood all of whose edges are in subgraph, but those of version_id to be added,
+        and whose requirements still leave no installable version of the package."""
+        for nogood in self.nogoods.get(version_id, []):
+            if all(nid == version_id or subgraph.has_edge(nid, child) for nid, child in nogood) and self._is_conflict(nogood):
+                return nogood
+        return None
+    
 
-        var_list = list(self.node_dict)
-        has_visit = {item: False for item in var_list}
-        var_list.insert(0, None)
-        cnf_clauses = [[var_list.index(-1)]]
-        self._get_cnf_clauses(has_visit, var_list, cnf_clauses, -1)
+    def _is_conflict(self, nogood):
+        # the edges of a nogood all require the same package
+        package_id = next(iter(nogood))[1]
+        bitset = self.versions.bits_of(item for item in self.degree_table[package_id] if self.node_dict[item]['install_status'] != 'Fail')
+        for nid, child in nogood:
+            if child != package_id or package_id not in self.degree_table.get(nid, {}):
+                return False
+            bitset &= self._allowed_versions(nid, package_id)
+        return bitset == 0
+    
+
+    def _allowed_versions(self, nid, package_id):
+        """Bitset of the versions of package_id meeting the requirement of nid."""
+        req = self.degree_table[nid][package_id]
+        if isinstance(req, set):
+            return self.versions.bits_of(req)
+        return self.versions.bits(package_id, req)
+    
 
-        # CryptoMiniSat SAT solver
-        for clause in cnf_clauses:
-            solver.add_clause(clause)
+    def _sat_solver(self):
+        if self.solver is None:
+            # encode once, the solver is kept for the solving with assumptions
+            stime = time.time()
+            self.variables = VariableMap(self.degree_table)
+            cnf_clauses = [[self.variables.var(-1)]]
+            self._get_cnf_clauses(self.variables, cnf_clauses, -1)
+            self.sat_stats['encode'] = time.time() - stime
+
+            # CryptoMiniSat SAT solver
+            stime = time.time()
+            self.solver = pycryptosat.Solver()
+            for clause in cnf_clauses:
+                self.solver.add_clause(clause)
+            self.sat_stats['variables'] = len(self.variables)
+            self.sat_stats['clauses'] = len(cnf_clauses)
+        else:
+            stime = time.time()
 
-        sat, solution = solver.solve()
+        sat, solution = self.solver.solve()
+        self.sat_stats['solves'] = 1
+        if sat and self.incremental_sat:
+            solution = self._prefer_versions(solution)
+            self.sat_stats['preference_solves'] = self.sat_stats['solves']
+        if sat and self.optimize_sat:
+            # from the preferred versions in the incremental mode
+            solution = self._optimize_versions(solution, stime + self.sat_time_budget)
+        self.sat_stats['solve'] = time.time() - stime
+        print('CNF: {variables} variables, {clauses} clauses ({amo_clauses} at-most-one by {amo_encoding}), encode {encode:.3f}s, solve {solve:.3f}s'.format(**self.sat_stats))
+        if sat and self.incremental_sat:
+            print('Preferred versions by {} solves.'.format(self.sat_stats['preference_solves']))
+        if sat and self.optimize_sat:
+            print('Objective: {cost} ({status}) by {solves} solves.'.format(**self.sat_stats))
         if not sat:
             # unsatisfiable
             return None
 
+        variables = self.variables
         sat_graph = subGraph({}, {})
-        keep_nodes = [var_list[index] for index in range(1, len(solution)) if solution[index]]
+        # auxiliary variables of the encodings have no node id
+        keep_nodes = [variables.id(index) for index in range(1, len(solution)) if solution[index] and variables.id(index) is not None]
+        keep_set = set(keep_nodes)
         for nid in keep_nodes:
             # print('{}:{}'.format(nid, self._get_node_name(nid)))
             # all nodes
@@ -517,51 +932,194 @@ class RequireGraph(object):
             sat_graph.in_table[nid] = set()
 
         for nid, children in self.degree_table.items():
-            if nid in keep_nodes:
+            if nid in keep_set:
                 for child in children:
-                    if child in keep_nodes:
+                    if child in keep_set:
                         sat_graph.degree_table[nid].add(child)
                         sat_graph.in_table[child].add(nid)
         
         # print(sat_graph.degree_table)
         
-        while True:
-            has_delete = False
-            for nid, in_set in list(sat_graph.in_table.items()):
-                if len(in_set) == 0 and nid != -1:
-                    # delete redundant nodes
-                    has_delete = True
-                    for child in sat_graph.degree_table[nid]:
-                        sat_graph.in_table[child].remove(nid)
-                    sat_graph.degree_table.pop(nid)
-                    sat_graph.in_table.pop(nid)
-            
-            if not has_delete:
-                break
+        # delete redundant nodes, and then their children without other requirements
+        check_list = [nid for nid, in_set in sat_graph.in_table.items() if len(in_set) == 0 and nid != -1]
+        while len(check_list) > 0:
+            nid = check_list.pop()
+            for child in sat_graph.degree_table[nid]:
+                sat_graph.in_table[child].remove(nid)
+                if len(sat_graph.in_table[child]) == 0 and child != -1:
+                    check_list.append(child)
+            sat_graph.degree_table.pop(nid)
+            sat_graph.in_table.pop(nid)
 
         return sat_graph
 
 
-    def _get_cnf_clauses(self, has_visit, var_list, clauses, node):
-        if has_visit[node]:
-            return
+    def _optimize_versions(self, solution, deadline):
+        """Minimize the objective by linear search: binary adders over the objective, and solves
+        bounded below the cost of the best model by a guarded comparator, until unsatisfiable
+        (optimal) or the deadline (the best model so far)."""
+        var = self.variables.var
+        new_var = self.variables.new_var
+        cost = self._objective(solution)
+
+        # objective literals: the bits of the rank of the version of each package, weighted 2^bit
+        weighted_literals = []
+        clauses = []
+        for pid, versions in self.sorted_degree_table.items():
+            if self.node_type[pid] != PACKAGE_TYPE or self.node_dict[pid] is None:
+                continue
+            weighted_literals.append((var(pid), INSTALL_WEIGHT))
+            max_rank = max([self.version_rank[vid] for vid in versions] + [0])
+            bit = 0
+            while (1 << bit) <= max_rank:
+                rank_bit = new_var()
+                for vid in versions:
+                    if (self.version_rank[vid] >> bit) & 1:
+                        clauses.append([-var(vid), rank_bit])
+                weighted_literals.append((rank_bit, 1 << bit))
+                bit += 1
+        bits, sum_clauses = weighted_sum(weighted_literals, new_var)
+        for clause in clauses + sum_clauses:
+            self.solver.add_clause(clause)
+
+        status = 'optimal'
+        while cost > 0:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                status = 'time budget'
+                break
+            guard = new_var()
+            for clause in at_most_value(bits, cost - 1, guard):
+                self.solver.add_clause(clause)
+            sat, model = self.solver.solve([guard], time_limit=remaining)
+            self.sat_stats['solves'] += 1
+            if sat is None:
+                status = 'time budget'
+                break
+            if not sat:
+                break
+            solution = model
+            cost = self._objective(solution)
+        self.sat_stats['cost'] = cost
+        self.sat_stats['status'] = status
+        return solution
+
+
+    def _objective(self, solution):
+        """Objective of a model: INSTALL_WEIGHT for each package, and the highest rank of its versions."""
+        var = self.variables.var
+        cost = 0
+        for pid, versions in self.sorted_degree_table.items():
+            if self.node_type[pid] != PACKAGE_TYPE or self.node_dict[pid] is None:
+                continue
+            if solution[var(pid)]:
+                cost += INSTALL_WEIGHT
+            cost += max([self.version_rank[vid] for vid in versions if solution[var(vid)]] + [0])
+        return cost
+
+
+    def _prefer_versions(self, solution):
+        """Fix the version of each package required in the model, top-down, to the first version in
+        sorted_degree_table satisfiable with the versions fixed before it, by assumptions.
+        A version preferred to the one of the model costs a solve, at most MAX_PREFERENCE_SOLVES."""
+        var = self.variables.var
+        assumptions = []
+        decided = set()
+        order = self._package_order()
+        while True:
+            # the fixed versions may require packages out of the previous model
+            required = self._required_nodes(solution)
+            pending = [pid for pid in order if pid not in decided and pid in required]
+            if len(pending) == 0:
+                break
+            for pid in pending:
+                if not solution[var(pid)]:
+                    continue
+                decided.add(pid)
+                for vid in self.sorted_degree_table[pid]:
+                    if solution[var(vid)]:
+                        # the version of the model
+                        assumptions.append(var(vid))
+                        break
+                    if self.node_dict[vid]['install_status'] == 'Fail' or self.sat_stats['solves'] >= MAX_PREFERENCE_SOLVES:
+                        continue
+                    sat, model = self.solver.solve(assumptions + [var(vid)])
+                    self.sat_stats['solves'] += 1
+                    if sat:
+                        solution = model
+                        assumptions.append(var(vid))
+                        break
+        return solution
+
+
+    def _required_nodes(self, solution):
+        """Nodes of the model reachable from the root, the others are not needed."""
+        var = self.variables.var
+        required = {-1}
+        check_list = [-1]
+        while len(check_list) > 0:
+            nid = check_list.pop()
+            for child in self.degree_table[nid]:
+                if child not in required and solution[var(child)]:
+                    required.add(child)
+                    check_list.append(child)
+        return required
+
+
+    def _package_order(self):
+        """Packages in the order of the heuristic algorithm: preorder from the root by sorted_degree_table."""
+        order = []
+        has_visit = {-1}
+        stack = [iter(self.sorted_degree_table[-1])]
+        while len(stack) > 0:
+            nid = next(stack[-1], None)
+            if nid is None:
+                stack.pop()
+                continue
+            if nid in has_visit:
+                continue
+            has_visit.add(nid)
+            if self.node_type[nid] == PACKAGE_TYPE:
+                order.append(nid)
+            stack.append(iter(self.sorted_degree_table[nid]))
+        return order
+
+
+    def _get_cnf_clauses(self, variables, clauses, root):
+        self.sat_stats = {'amo_encoding': self.amo_encoding, 'amo_clauses': 0}
+        # DFS in preorder, with a stack of child iterators instead of recursion
+        has_visit = set()
+        stack = [iter([root])]
+        while len(stack) > 0:
+            node = next(stack[-1], None)
+            if node is None:
+                stack.pop()
+                continue
+            if node in has_visit:
+                continue
 
-        has_visit[node] = True
-        var_node = var_list.index(node)
+            has_visit.add(node)
+            self._add_node_clauses(variables, clauses, node)
+            stack.append(iter(self.degree_table[node]))
+
+
+    def _add_node_clauses(self, variables, clauses, node):
+        var_node = variables.var(node)
         if self.is_conjunction[node]:
             for nid, req in self.degree_table[node].items():
                 # (not x) or y
-                clauses.append([-var_node, var_list.index(nid)])
+                clauses.append([-var_node, variables.var(nid)])
                 if self.node_type[nid] == PACKAGE_TYPE:
                     # Version node -> Package node
-                    forbidden_child = [item for item in self.degree_table[nid] if self.node_dict[item]['version'] not in SpecifierSet(req, prereleases=True)]
+                    spec = self.versions.bits(nid, req)
+                    forbidden_child = [item for item in self.degree_table[nid] if not self.versions.contains(spec, item)]
                     for child in forbidden_child:
                         # (not x) or (not y)
-                        clauses.append([-var_node, -var_list.index(child)])
+                        clauses.append([-var_node, -variables.var(child)])
 
         elif len(self.degree_table[node]) > 0:
             # (not x) or x1 or ...
-            child_index = [var_list.index(item) for item in self.degree_table[node]]
+            child_index = [variables.var(item) for item in self.degree_table[node]]
             temp = [-var_node]
             temp.extend(child_index)
             clauses.append(temp)
@@ -571,11 +1129,12 @@ class RequireGraph(object):
                 # remove the versions that fails to install
                 for nid in self.degree_table[node]:
                     if self.node_dict[nid]['install_status'] == 'Fail':
-                        clauses.append([-var_list.index(nid)])
+                        clauses.append([-variables.var(nid)])
                 
                 # only one version for a package
-                for comb in itertools.combinations(child_index, 2):
-                    clauses.append([-comb[0], -comb[1]])
+                amo_clauses = at_most_one(child_index, variables.new_var, self.amo_encoding)
+                self.sat_stats['amo_clauses'] += len(amo_clauses)
+                clauses.extend(amo_clauses)
             else:
                 # virtual module node
                 optional_child = []
@@ -583,21 +1142,23 @@ class RequireGraph(object):
                 for nid in self.degree_table[node]:
                     req = self.degree_table[node][nid]
                     if isinstance(req, set):
-                        package_index = var_list.index(nid)
-                        index_list = [var_list.index(item) for item in req]
+                        package_index = variables.var(nid)
+                        index_list = [variables.var(item) for item in req]
                         # bind candidate versions with candidate packages
                         for version_index in index_list:
                             clauses.append([-version_index, package_index])
                         optional_child.extend(index_list)
+                    elif req is not None and req != '' and self.node_dict[nid] is not None:
+                        # requirement hint: forbid the versions out of the specifier
+                        spec = self.versions.bits(nid, req)
+                        forbidden_child = [item for item in self.degree_table[nid] if not self.versions.contains(spec, item)]
+                        for child in forbidden_child:
+                            clauses.append([-var_node, -variables.var(child)])
                 
                 if len(optional_child) > 0:
                     # at least one candidate version for a module
                     optional_child.extend([-var_node])
                     clauses.append(optional_child)
-
-        # DFS
-        for nid in self.degree_table[node]:
-            self._get_cnf_clauses(has_visit, var_list, clauses, nid)
     
 
     def infer_install_pairs(self):
@@ -605,9 +1166,24 @@ class RequireGraph(object):
         install_pairs = None
 
         # generate subgraph
+        if self.preprocess_stats is not None:
+            print('Preprocessing: {nodes} nodes, {edges} edges -> {kept_nodes} nodes, {kept_edges} edges'.format(**self.preprocess_stats))
         subgraph = subGraph({}, {})
         print('Using our heuristic algorithm ...')
-        if self._heuristic_method(subgraph, -1):
+        # the greedy choices of the heuristic algorithm depend on the versions it can try, so it
+        # works on the unpruned tables and returns the same result as without preprocessing
+        pruned_tables = self.degree_table, self.sorted_degree_table
+        self.degree_table, self.sorted_degree_table = self.full_degree_table, self.full_sorted_degree_table
+        try:
+            success = self._heuristic_method(subgraph, -1)
+        except RecursionError:
+            # the versions in a requirement cycle can replace each other without end
+            print('Our method does not terminate.')
+            success = False
+        finally:
+            self.degree_table, self.sorted_degree_table = pruned_tables
+        print('Heuristic: {nodes} nodes explored, {conflicts} conflicts learned, {prunes} prunes, {backjumps} backjumps'.format(**self.heuristic_stats))
+        if success:
             # our algorithm
             subgraph.clear_graph()
             pv_graph = self._get_install_graph(subgraph)
@@ -622,7 +1198,7 @@ class RequireGraph(object):
                 has_solution = -1
                 # Best package-version in sorted_degree_table
                 subgraph = subGraph({}, {})
-                for nid, out_list in self.sorted_degree_table.items():
+                for nid, out_list in self.full_sorted_degree_table.items():
                     if self.node_type[nid] == MODULE_TYPE:
                     # if isinstance(nid, str) and nid != 'virtual root':
                         # one package
@@ -631,18 +1207,22 @@ class RequireGraph(object):
                             subgraph.degree_table[pid] = set()
                             subgraph.in_table[pid] = set()
 
-                        if len(self.degree_table[pid]) == 0:
+                        if len(self.full_degree_table[pid]) == 0:
                             continue
 
                         # candidate versions
-                        req = self.degree_table[nid][pid]
+                        req = self.full_degree_table[nid][pid]
                         # best version 
-                        vid = self.sorted_degree_table[pid][0]
+                        vid = self.full_sorted_degree_table[pid][0]
                         if isinstance(req, set):
-                            for item in self.sorted_degree_table[pid]:
+                            for item in self.full_sorted_degree_table[pid]:
                                 if item in req:
                                     vid = item
                                     break
+                        elif req != '':
+                            optional_versions = self._filter_child_id(self.full_sorted_degree_table[pid], self.versions.bits(pid, req))
+                            if len(optional_versions) > 0:
+                                vid = optional_versions[0]
 
                         if vid not in subgraph.degree_table:
                             subgraph.degree_table[vid] = set()
@@ -655,110 +1235,322 @@ class RequireGraph(object):
         # print('Topo sort for installation order.')
         if not pv_graph.topo_sort():
             print("Warning: Exist a circle for topology order!")
+            for group in pv_graph.install_groups:
+                if len(group) > 1:
+                    print('Install together: {}'.format(', '.join(item[0] for item in group)))
             
         install_pairs = pv_graph.install_pair[:]
+        self.install_groups = [group[:] for group in pv_graph.install_groups]
 
         return install_pairs, has_solution
 
 
 class QueryApplication(object):
-    def __init__(self):
-        self.parser = PythonParser()
-        py2_driver = GraphDatabase.driver("bolt://localhost:7687", auth=('neo4j', 'neo4j'))
-        py3_driver = GraphDatabase.driver("bolt://localhost:7697", auth=('neo4j', 'neo4j'))
-        self.neo4j_driver = {'Python2':py2_driver, 'Python3':py3_driver}
-    
+    def __init__(self, parser_backend='auto', parser=None, neo4j_driver=None, batch_query=True, cache=MISSING, kg_identity=None, kg='neo4j', amo_encoding='auto', learn_conflicts=False, backjump=False, incremental_sat=False,
+                 optimize_sat=False, sat_time_budget=10.0, preprocess=False, bounded_subgraph=False,
+                 compact_subgraph=True, grouped_install=False, parser_workers=1, parser_interpreters=None):
+        # parser_workers and parser_interpreters: the warm parse workers of the 'pool' backend (see create_backends)
+        self.parser = parser if parser is not None else PythonParser(parser_backend, parser_workers, parser_interpreters)
+        # match all top modules of a snippet in one transaction
+        self.batch_query = batch_query
+        # at-most-one encoding of package versions in the SAT solver (see sat_encoding.AMO_ENCODINGS)
+        self.amo_encoding = amo_encoding
+        # conflict learning and backjumping in the heuristic algorithm (see RequireGraph)
+        self.learn_conflicts = learn_conflicts
+        self.backjump = backjump
+        # SAT solver with the preferred versions of the heuristic algorithm (see RequireGraph)
+        self.incremental_sat = incremental_sat
+        # SAT solver minimizing the ranks of the versions and the packages to install (see RequireGraph)
+        self.optimize_sat = optimize_sat
+        self.sat_time_budget = sat_time_budget
+        # prune the require graph before the SAT solver (see RequireGraph)
+        self.preprocess = preprocess
+        # read only the versions in the requirements from the KG (see KGQueries.bounded_require_subgraph)
+        self.bounded_subgraph = bounded_subgraph
+        # keep the require subgraphs in arrays, in the cache too (see kg_records.CompactSubgraph)
+        self.compact_subgraph = compact_subgraph
+        # a pip install step in the Dockerfile per install group, the packages of a cycle together
+        self.grouped_install = grouped_install
+        # {py_version: KGStore}: 'neo4j', a build_KG data directory of CSV files, or the stores
+        if isinstance(kg, dict):
+            self.kg = kg
+        elif neo4j_driver is not None:
+            self.kg = {py_version: Neo4jKG(driver) for py_version, driver in neo4j_driver.items()}
+        else:
+            self.kg = create_kg_stores(kg)
+
+        # cache of module, submodule and require-subgraph lookups, None to disable
+        self.cache = KGCache() if cache is MISSING else cache
+        # {py_version: identity of the KG dump}, KGStore.identity() by default
+        self.kg_identity = dict(kg_identity or {})
+        # py_versions of the KGs without identity, cached in memory only
+        self.memory_only_kg = set()
     
-    @staticmethod
-    def _get_module_info_by_name(tx, module_name):
-        result = tx.run("MATCH (m:Module {name:$module_name}) "
-                        "RETURN m;", module_name=module_name)
-        ret = []
-        for record in result:
-            ret.append((record[0].id, record[0]['import_status']))
+
+    def _get_kg_identity(self, py_version):
+        if py_version not in self.kg_identity:
+            identity = self.kg[py_version].identity()
+            if identity is None:
+                # the KG store of this process only, never the sqlite file
+                identity = 'memory:{}:{}'.format(py_version, id(self.kg[py_version]))
+                self.memory_only_kg.add(py_version)
+            self.kg_identity[py_version] = identity
+        return self.kg_identity[py_version]
+
+    def _lookup(self, py_version, query, keys, loader):
+        """
+        Cached lookups of a query: {key: result}
+        loader: load the results of the missing keys, {key: result}
+        """
+        if self.cache is None:
+            return loader(keys)
+
+        kg_identity = self._get_kg_identity(py_version)
+        persistent = py_version not in self.memory_only_kg
+        ret = {}
+        missing_keys = []
+        for key in keys:
+            value = self.cache.get(kg_identity, query, key, persistent)
+            if value is MISSING:
+                missing_keys.append(key)
+            else:
+                ret[key] = value
+
+        if len(missing_keys) > 0:
+            for key, value in loader(missing_keys).items():
+                self.cache.put(kg_identity, query, key, value, persistent)
+                ret[key] = value
         return ret
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache is not None else None
     
-    @staticmethod
-    def _get_submodules_by_module(tx, module_name, max_hop, query_modules):
-        result = tx.run("MATCH (m:Module {name:$module_name}) "
-                        "CALL apoc.neighbors.tohop(m, \"HAS_MODULE>\", $max_hop) "
-                        "YIELD node "
-                        "RETURN id(m), node;", module_name=module_name, max_hop=max_hop)
+    
+    def _calculate_match_degree(self, tree_set, name_set):
+        return NamePrefixes(name_set).match_degree(tree_set)
+
+
+    def _score_trees(self, tree_sets, name_set):
+        # {module_id: score}, the prefixes of the names interned once for all trees
+        prefixes = name_set if isinstance(name_set, NamePrefixes) else NamePrefixes(name_set)
+        score_dict = {}
+        max_query = 0
+        for module_id, tree_set in tree_sets.items():
+            score = prefixes.match_degree(tree_set)
+            score_dict[module_id] = score
+            if score > max_query:
+                max_query = score
+        return score_dict, max_query
 
-        for record in result:
-            if record[1]['import_status'] == 'True':
-                query_modules[record[0]].append(record[1]['name'])
 
-    
     @staticmethod
-    def _get_attributes_by_module_list(tx, module_id_list, submodule_list, ret):
-        result = tx.run("MATCH (m:Module)-[:HAS_MODULE*0..]->(s:Module)-[:HAS_ATTRIBUTE]->(a:Attribute) "
-                        "WHERE id(m) in $module_id_list AND s.name in $submodule_list "
-                        "RETURN id(m), s.name, a.name", module_id_list=module_id_list, submodule_list=submodule_list)
-        
-        for record in result:
-            ret[record[0]].append('{}.{}'.format(record[1], record[2]))
-    
+    def _get_attr_queries(query_modules, score_dict, max_query, attr_prefixes):
+        # the longest module prefix of each attribute, for the best modules
+        query_attrs = {}
+        need_query_modules = set()
+        for module_id, score in score_dict.items():
+            if score == max_query:
+                query_set = attr_prefixes.longest_prefixes(query_modules[module_id])
+                query_attrs[module_id] = list(query_set)
+                need_query_modules |= query_set
+        return query_attrs, need_query_modules
+
+
     @staticmethod
-    def _get_packages_and_versions_by_module_list(tx, module_id_list):
-        result = tx.run("MATCH (p:Package)-[:HAS_VERSION]->(v:Version)-[:HAS_MODULE]->(m:Module) "
-                        "WHERE id(m) in $module_id_list "
-                        "RETURN p.name,id(v);", module_id_list=module_id_list)
-        
-        ret = {}    # {package: version_id_set}
-        for record in result:
-            p = record[0]
-            vid = record[1]
-            if p not in ret:
-                ret[p] = set()
-            ret[p].add(vid)
-        
+    def _distinct_trees(query_top_modules):
+        """{module_id: the first module id of its tree hash}, itself without a tree hash"""
+        first = {}
+        ret = {}
+        for item in query_top_modules:
+            key = item[2] if len(item) > 2 and item[2] else item[0]
+            ret[item[0]] = first.setdefault(key, item[0])
         return ret
-    
+
+
     @staticmethod
-    def _get_require_subgraph(tx, package_list):
-        result = tx.run("WITH $package_list AS package_list "
-                        "MATCH (startNode:Package) WHERE startNode.name in package_list "
-                        "WITH startNode "
-                        "CALL apoc.path.subgraphAll(startNode, { "
-                            "relationshipFilter:\"REQUIRES>|HAS_VERSION>\" "
-                        "}) "
-                        "YIELD nodes, relationships "
-                        "RETURN nodes, relationships", package_list=package_list).values()
-
-        return result
+    def _expand_trees(best_module_list, trees):
+        """All module ids of the trees of best_module_list, in the order of trees"""
+        best_modules = set(best_module_list)
+        return [module_id for module_id, first in trees.items() if first in best_modules]
 
-    
-    def _calculate_match_degree(self, tree_set, name_set):
-        if len(tree_set) == 0 or len(name_set) == 0:
-            return 0.0
-        
-        ret = 0.0
-        for name in name_set:
-            if name in tree_set:
-                ret += 1
+
+    @staticmethod
+    def _init_query_modules(query_top_modules, top_module):
+        # handle ImportError
+        query_modules = {}
+        for item in query_top_modules:
+            if item[1] == 'True':
+                query_modules[item[0]] = [top_module]
             else:
-                split_info = name.split('.')
-                length = len(split_info)
-                prefix_name = name
-                i = 1
-                while i < length:
-                    prefix_name = prefix_name[:-(len(split_info[-i])+1)]
-                    if prefix_name in tree_set:
-                        break
-                    i += 1
+                query_modules[item[0]] = []
+        return query_modules
+
+
+    def _add_match(self, top_module, parse_info, match, info, candidate_libraries):
+        """
+        match: None if top module is not in KG, else (module_score, attr_score, {package: version_id_set})
+        """
+        print('--- Query module \"{}\" in KG'.format(top_module))
+        if match is None:
+            print('There is not module \"{}\" in KG'.format(top_module))
+            homonymic_package = canonicalize_name(top_module)
+            print('Try to install package \"{}\"'.format(homonymic_package))
+            candidate_libraries[top_module] = {canonicalize_name(homonymic_package): set()}
+            return
+
+        module_score, attr_score, trans_res = match
+        if module_score > 0:
+            info['module_score'] += module_score / len(parse_info['modules'])
+        if attr_score > 0:
+            info['attr_score'] += attr_score / len(parse_info['attrs'])
+        candidate_libraries[top_module] = trans_res
+        print('Candidate packages for top module \"{}\": {}'.format(top_module, list(trans_res)))
+
+
+    def _match_forest(self, py_version, forest, attr_prefixes, info):
+        kg = self.kg[py_version]
+        candidate_libraries = {}   # {top_module: {package_id: version_id_set}}
+        for top_module, parse_info in forest.items():
+            # query top module
+            query_top_modules = self._lookup(py_version, 'module_info', [top_module],
+                                             lambda keys: {keys[0]: kg.read(lambda queries: queries.module_info_by_name(keys[0]))})[top_module]
             
-                ret += 1 - i/length
-    
-        return ret
+            if len(query_top_modules) == 0:
+                self._add_match(top_module, parse_info, None, info, candidate_libraries)
+                continue
+
+            # query modules, one per distinct tree
+            trees = self._distinct_trees(query_top_modules)
+            query_modules = self._init_query_modules([item for item in query_top_modules if trees[item[0]] == item[0]], top_module)
+            module_ids = tuple(query_modules)
+            submodules = self._lookup(py_version, 'tree_submodules', [(top_module, parse_info['max_hop'])],
+                                      lambda keys: {keys[0]: kg.read(lambda queries: queries.submodules_by_module_ids([(module_ids, keys[0][1])]))[(module_ids, keys[0][1])]})
+            for module_id, submodule in submodules[(top_module, parse_info['max_hop'])]:
+                query_modules[module_id].append(submodule)
+            
+            # transform list to set
+            for module_id in query_modules:
+                query_modules[module_id] = set(query_modules[module_id])
+
+            score_dict, module_score = self._score_trees(query_modules, parse_info['modules'])
+
+            # handle attributes
+            query_attrs, need_query_modules = self._get_attr_queries(query_modules, score_dict, module_score, attr_prefixes)
+            if len(query_attrs) > 0 and len(need_query_modules) > 0:
+                module_id_list = list(query_attrs)
+                kg.read(lambda queries: queries.attributes_by_module_list(module_id_list, list(need_query_modules), query_attrs))
+            
+            # transform list to set
+            for module_id in query_attrs:
+                query_attrs[module_id] = set(query_attrs[module_id])
+
+            score_dict, attr_score = self._score_trees(query_attrs, parse_info['attrs'])
+            best_module_list = self._expand_trees([key for key,value in score_dict.items() if value==attr_score], trees)
+            trans_res = kg.read(lambda queries: queries.packages_and_versions_by_module_list(best_module_list))
+
+            self._add_match(top_module, parse_info, (module_score, attr_score, trans_res), info, candidate_libraries)
+
+        return candidate_libraries
+
+
+    def _match_forest_batched(self, py_version, forest, attr_prefixes, info):
+        """Same candidates and scores as _match_forest, with four UNWIND queries in one transaction for all top modules."""
+        matches = self.kg[py_version].read(self._query_forest, py_version, forest, attr_prefixes)
+
+        candidate_libraries = {}   # {top_module: {package_id: version_id_set}}
+        for top_module, parse_info in forest.items():
+            self._add_match(top_module, parse_info, matches[top_module], info, candidate_libraries)
+        return candidate_libraries
+
+
+    def _query_forest(self, queries, py_version, forest, attr_prefixes):
+        # top modules
+        query_top_modules = self._lookup(py_version, 'module_info', list(forest), lambda keys: queries.module_info_by_names(keys))
+        matches = {top_module: None for top_module in forest if len(query_top_modules[top_module]) == 0}
+        found_modules = [top_module for top_module in forest if top_module not in matches]
+        if len(found_modules) == 0:
+            return matches
+
+        # submodules, of one module per distinct tree
+        trees = {}          # {top_module: {module_id: module_id of its tree}}
+        query_modules = {}  # {top_module: {module_id: submodules}}
+        for top_module in found_modules:
+            trees[top_module] = self._distinct_trees(query_top_modules[top_module])
+            query_modules[top_module] = self._init_query_modules([item for item in query_top_modules[top_module] if trees[top_module][item[0]] == item[0]], top_module)
+        module_hops = [(top_module, forest[top_module]['max_hop']) for top_module in found_modules]
+        submodules = self._lookup(py_version, 'tree_submodules', module_hops, lambda keys: self._submodules_by_trees(queries, keys, query_modules))
+        for key in module_hops:
+            for module_id, submodule in submodules[key]:
+                query_modules[key[0]][module_id].append(submodule)
+        
+        module_scores = {}
+        query_attrs = {}    # {top_module: {module_id: attrs}}
+        attr_items = []
+        for top_module in found_modules:
+            # transform list to set
+            for module_id in query_modules[top_module]:
+                query_modules[top_module][module_id] = set(query_modules[top_module][module_id])
+
+            score_dict, module_scores[top_module] = self._score_trees(query_modules[top_module], forest[top_module]['modules'])
+            query_attrs[top_module], need_query_modules = self._get_attr_queries(query_modules[top_module], score_dict, module_scores[top_module], attr_prefixes)
+            if len(query_attrs[top_module]) > 0 and len(need_query_modules) > 0:
+                attr_items.append((top_module, list(query_attrs[top_module]), list(need_query_modules)))
+
+        # attributes
+        if len(attr_items) > 0:
+            queries.attributes_by_module_lists(attr_items, query_attrs)
+
+        best_module_lists = {}
+        attr_scores = {}
+        for top_module in found_modules:
+            # transform list to set
+            for module_id in query_attrs[top_module]:
+                query_attrs[top_module][module_id] = set(query_attrs[top_module][module_id])
+
+            score_dict, attr_scores[top_module] = self._score_trees(query_attrs[top_module], forest[top_module]['attrs'])
+            best_module_lists[top_module] = self._expand_trees([key for key,value in score_dict.items() if value==attr_scores[top_module]], trees[top_module])
+        
+        # packages and versions
+        trans_res = queries.packages_and_versions_by_module_lists(best_module_lists)
+        for top_module in found_modules:
+            matches[top_module] = (module_scores[top_module], attr_scores[top_module], trans_res[top_module])
+        return matches
 
 
-    def infer_CRE(self, snippet_path, res_dir):
-        ret = {'python':None, 'install_pairs':None, 'parse':0, 'match':0, 'solving':0, 'has_solution':1}
+    @staticmethod
+    def _submodules_by_trees(queries, module_hops, query_modules):
+        """{(top_module, max_hop): [(module_id, submodule)]} of the module ids in query_modules"""
+        items = [(tuple(query_modules[top_module]), max_hop) for top_module, max_hop in module_hops]
+        submodules = queries.submodules_by_module_ids(items)
+        return {key: submodules[item] for key, item in zip(module_hops, items)}
+
+
+    def infer_CRE(self, snippet_path, res_dir, requirement_hints=None):
         print('Start to infer compatible runtime environment for {} ...'.format(snippet_path))
+        with open(snippet_path, 'r') as f:
+            source = f.read()
+
+        ret = self.infer_snippet(source, requirement_hints, snippet_path)
+        if ret['python'] is None:
+            return ret
+
+        requirement_path = os.path.join(res_dir, 'requirements.txt')
+        dockerfile_path = os.path.join(res_dir, 'Dockerfile')
+        self._generate_requirement(requirement_path, ret['install_pairs'])
+        self._generate_dockerfile(dockerfile_path, snippet_path, ret['python'], ret['install_groups'] if self.grouped_install else None)
+        return ret
+
+
+    def infer_snippet(self, source, requirement_hints=None, label='The snippet'):
+        """
+        Infer the install pairs and Python version of a snippet without writing files.
+        requirement_hints: requirement strings (e.g. "numpy>=1.18") that the environment must satisfy.
+        label: the snippet in the messages, e.g. its path.
+        """
+        ret = {'python':None, 'install_pairs':None, 'install_groups':None, 'parse':0, 'match':0, 'solving':0, 'has_solution':1}
 
         stime = time.time()
-        parse_results = self.parser.parse_pyfile(snippet_path)
+        parse_results = self.parser.parse_source(source)
         ret['parse'] = round(time.time() - stime, 2)
 
         python_version = []
@@ -779,7 +1571,7 @@ class QueryApplication(object):
             python_version.append('Python2')
         
         if len(python_version) == 0:
-            print('{} can not be parsed.'.format(snippet_path))
+            print('{} can not be parsed.'.format(label))
             return ret
         
         print('Optional Python version: {}'.format(python_version))
@@ -793,8 +1585,6 @@ class QueryApplication(object):
                 print('No third modules.')
                 continue
             
-            driver = self.neo4j_driver[py_version]
-            
             # code -> forest
             forest = {}
             possible_modules = parse_results[py_version]['imports'] + parse_results[py_version]['resources']
@@ -823,95 +1613,12 @@ class QueryApplication(object):
             # Query KG
             stime = time.time()
 
-            candidate_libraries = {}   # {top_module: {package_id: version_id_set}}
-            for top_module, parse_info in forest.items():
-                print('--- Query module \"{}\" in KG'.format(top_module))
-                # query top module
-                with driver.session(default_access_mode=neo4j.READ_ACCESS) as session:
-                    query_top_modules = session.read_transaction(self._get_module_info_by_name, top_module)
-                
-                if len(query_top_modules) == 0:
-                    print('There is not module \"{}\" in KG'.format(top_module))
-                    homonymic_package = canonicalize_name(top_module)
-                    print('Try to install package \"{}\"'.format(homonymic_package))
-                    candidate_libraries[top_module] = {canonicalize_name(homonymic_package): set()}
-                    continue
-
-                # handle ImportError
-                # query modules
-                query_modules = {}
-                for item in query_top_modules:
-                    if item[1] == 'True':
-                        query_modules[item[0]] = [top_module]
-                    else:
-                        query_modules[item[0]] = []
-
-                with driver.session(default_access_mode=neo4j.READ_ACCESS) as session:
-                    session.read_transaction(self._get_submodules_by_module, top_module, parse_info['max_hop'], query_modules)
-                
-                # transform list to set
-                for module_id in query_modules:
-                    query_modules[module_id] = set(query_modules[module_id])
-
-                # {module_id: score}
-                score_dict = {}
-                max_query = 0
-                for module_id, submodule_set in query_modules.items():
-                    score = self._calculate_match_degree(submodule_set, parse_info['modules'])
-                    score_dict[module_id] = score
-                    if score > max_query:
-                        max_query = score
-                
-                if max_query > 0:
-                    py_info[py_version]['module_score'] += max_query / len(parse_info['modules'])
-
-                # handle attributes
-                query_attrs = {}
-                need_query_modules = set()
-                for module_id, score in score_dict.items():
-                    if score == max_query:
-                        query_set = set()
-                        for attr in possible_attrs:
-                            split_attr = attr.split('.')
-                            prefix_attr = attr
-                            i = 1
-                            while i < len(split_attr):
-                                prefix_attr = prefix_attr[:-(len(split_attr[-i])+1)]
-                                if prefix_attr in query_modules[module_id]:
-                                    break
-                                i += 1
-                            query_set.add(prefix_attr)
-                        query_attrs[module_id] = list(query_set)
-                        need_query_modules |= query_set
-                
-                if len(query_attrs) > 0 and len(need_query_modules) > 0:
-                    module_id_list = list(query_attrs)
-                    with driver.session(default_access_mode=neo4j.READ_ACCESS) as session:
-                        session.read_transaction(self._get_attributes_by_module_list, module_id_list, list(need_query_modules), query_attrs)
-                
-                # transform list to set
-                for module_id in query_attrs:
-                    query_attrs[module_id] = set(query_attrs[module_id])
-
-                score_dict = {}
-                max_query = 0
-
-                # for module_id, attr_set in candidate_attr_dict.items():
-                for module_id, attr_set in query_attrs.items():
-                    score = self._calculate_match_degree(attr_set, parse_info['attrs'])
-                    score_dict[module_id] = score
-                    if score > max_query:
-                        max_query = score
-                
-                if max_query > 0:
-                    py_info[py_version]['attr_score'] += max_query / len(parse_info['attrs'])
-                
-                best_module_list = [key for key,value in score_dict.items() if value==max_query]
-                with driver.session(default_access_mode=neo4j.READ_ACCESS) as session:
-                    trans_res = session.read_transaction(self._get_packages_and_versions_by_module_list, best_module_list)                
-                candidate_libraries[top_module] = trans_res
-
-                print('Candidate packages for top module \"{}\": {}'.format(top_module, list(trans_res)))
+            # the prefixes of the attributes, once for all module trees
+            attr_prefixes = NamePrefixes(possible_attrs)
+            if self.batch_query:
+                candidate_libraries = self._match_forest_batched(py_version, forest, attr_prefixes, py_info[py_version])
+            else:
+                candidate_libraries = self._match_forest(py_version, forest, attr_prefixes, py_info[py_version])
             
             ret['match'] += round(time.time()-stime, 2)
             print('matching degree of modules: {}\nmatching degree of attrs: {}'.format(py_info[py_version]['module_score'], py_info[py_version]['attr_score']))
@@ -937,6 +1644,12 @@ class QueryApplication(object):
         else:
             ret['python'] = '2.7.18'
         print('Select {}.'.format(py_version))
+
+        # requirement hints: virtual modules that require the packages
+        for item in requirement_hints or []:
+            req = Requirement(item)
+            spec = str(req.specifier)
+            py_info[py_version]['candidates']['<requirement {}>'.format(item)] = {canonicalize_name(req.name): spec if spec != '' else set()}
         
         # Query requireGraph and dependency solving
         print('----- Dependency solving ...')
@@ -947,108 +1660,279 @@ class QueryApplication(object):
         if len(packages_set) > 0:
             stime = time.time()
 
-            driver = self.neo4j_driver[py_version]
+            kg = self.kg[py_version]
             print('Search dependencies for packages: {}'.format(','.join(packages_set)))
-            with driver.session(default_access_mode=neo4j.READ_ACCESS) as session:
-                requires_info = session.read_transaction(self._get_require_subgraph, list(packages_set))
+            if self.bounded_subgraph:
+                requirement_key = self._candidate_requirements(py_info[py_version]['candidates'])
+                requires_info = self._lookup(py_version, 'bounded_require_subgraph', [requirement_key],
+                                             lambda keys: {keys[0]: self._subgraph(kg.read(lambda queries: queries.bounded_require_subgraph(list(keys[0]))))})[requirement_key]
+            else:
+                package_key = tuple(sorted(packages_set))
+                requires_info = self._lookup(py_version, 'require_subgraph', [package_key],
+                                             lambda keys: {keys[0]: self._subgraph(kg.read(lambda queries: queries.require_subgraph(list(keys[0]))))})[package_key]
                 
-            require_graph = RequireGraph(py_info[py_version]['candidates'], requires_info)
+            require_graph = RequireGraph(py_info[py_version]['candidates'], requires_info, self.amo_encoding, self.learn_conflicts, self.backjump, self.incremental_sat,
+                                         self.optimize_sat, self.sat_time_budget, self.preprocess)
             # require_graph.print_graph()
             install_pairs, has_solution = require_graph.infer_install_pairs()
 
             ret['install_pairs'] = install_pairs
+            ret['install_groups'] = require_graph.install_groups
             ret['has_solution'] = has_solution
             ret['solving'] = round(time.time()-stime, 2)
         else:
             ret['install_pairs'] = []
+            ret['install_groups'] = []
         
-        requirement_path = os.path.join(res_dir, 'requirements.txt')
-        dockerfile_path = os.path.join(res_dir, 'Dockerfile')
-        self._generate_requirement(requirement_path, ret['install_pairs'])
-        self._generate_dockerfile(dockerfile_path, snippet_path, ret['python'])
         return ret
     
 
+    def _subgraph(self, records):
+        return CompactSubgraph.from_records(records) if self.compact_subgraph else records
+
+
+    @staticmethod
+    def _candidate_requirements(candidate_libraries):
+        """The requirements of the candidate packages for bounded_require_subgraph:
+        ((package, requirement), ...), sorted to be a key of the cache."""
+        requirements = set()
+        for optional_libraries in candidate_libraries.values():
+            for p_name, vid_set in optional_libraries.items():
+                if isinstance(vid_set, str):
+                    requirements.add((p_name, vid_set))
+                elif len(vid_set) == 0:
+                    requirements.add((p_name, ''))
+                else:
+                    requirements.add((p_name, tuple(sorted(vid_set))))
+        return tuple(sorted(requirements, key=lambda item: (item[0], isinstance(item[1], tuple), item[1])))
+
+
     def _generate_requirement(self, file_path, pv_pairs):
         with open(file_path, 'w') as f:
-            for item in pv_pairs:
-                if item[1] is None:
-                    f.write('{}\n'.format(item[0]))
-                else:
-                    f.write('{}=={}\n'.format(item[0], item[1]))
+            f.write(self.requirement_text(pv_pairs))
     
 
-    def _generate_dockerfile(self, dockerfile_path, snippet_path, python_version):
+    def _generate_dockerfile(self, dockerfile_path, snippet_path, python_version, install_groups=None):
         if python_version is not None:
             with open(dockerfile_path, 'w') as f:
-                f.write('FROM python:{}\n\n'.format(python_version))
-                f.write('RUN pip install --no-cache-dir --upgrade pip\n')
-                f.write('COPY requirements.txt /\n')
-                f.write('RUN pip install -r /requirements.txt\n\n')
-                f.write('COPY {} /snippets/snippet.py\n'.format(snippet_path))
-                f.write('CMD python /snippets/snippet.py')
+                f.write(self.dockerfile_text(snippet_path, python_version, install_groups))
+
+
+    @staticmethod
+    def requirement_text(pv_pairs):
+        lines = []
+        for item in pv_pairs:
+            if item[1] is None:
+                lines.append('{}\n'.format(item[0]))
+            else:
+                lines.append('{}=={}\n'.format(item[0], item[1]))
+        return ''.join(lines)
+
+
+    @staticmethod
+    def dockerfile_text(snippet_path, python_version, install_groups=None):
+        """install_groups: a pip install step per group in order, requirements.txt at once if None."""
+        if install_groups is None:
+            install_steps = ('COPY requirements.txt /\n' +
+                             'RUN pip install -r /requirements.txt\n')
+        else:
+            install_steps = ''.join('RUN pip install --no-cache-dir {}\n'.format(QueryApplication.requirement_text(group).replace('\n', ' ').strip())
+                                    for group in install_groups)
+        return ('FROM python:{}\n\n'.format(python_version) +
+                'RUN pip install --no-cache-dir --upgrade pip\n' +
+                install_steps + '\n' +
+                'COPY {} /snippets/snippet.py\n'.format(snippet_path) +
+                'CMD python /snippets/snippet.py')
 
     
     def close(self):
         self.parser.close()
-        for driver in self.neo4j_driver.values():
-            driver.close()
+        for kg in self.kg.values():
+            kg.close()
+        if self.cache is not None:
+            self.cache.close()
+
+
+def _safe_item_id(name):
+    """A name usable as one directory of results_dir: the name itself if it is a plain file name,
+    else its base name without .py and a short hash of the name."""
+    if name not in ('', '.', '..') and os.sep not in name and (os.altsep is None or os.altsep not in name):
+        return name
+    base_name = os.path.basename(os.path.normpath(name))
+    if base_name.endswith('.py'):
+        base_name = base_name[:-len('.py')]
+    if base_name in ('', '.', '..'):
+        base_name = 'snippet'
+    return '{}-{}'.format(base_name, hashlib.sha1(name.encode()).hexdigest()[:8])
+
+
+def _batch_items(input_path):
+    """
+    Snippets of a dataset: (item_id, snippet_path)
+    - directory: <item_id>/snippet.py or <item_id>.py
+    - manifest: one snippet path or JSON object {"id": ..., "path": ...} per line,
+      the id of a path is the path made safe by _safe_item_id
+    """
+    if os.path.isdir(input_path):
+        for child in sorted(os.listdir(input_path)):
+            child_path = os.path.join(input_path, child)
+            if os.path.isfile(os.path.join(child_path, 'snippet.py')):
+                yield child, os.path.join(child_path, 'snippet.py')
+            elif os.path.isfile(child_path) and child.endswith('.py'):
+                yield child[:-len('.py')], child_path
+        return
+
+    base_dir = os.path.dirname(input_path)
+    with open(input_path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line == '':
+                continue
+            if line.startswith('{'):
+                item = json.loads(line)
+                item_id, snippet_path = str(item['id']), item['path']
+            else:
+                item_id, snippet_path = _safe_item_id(line), line
+            yield item_id, os.path.join(base_dir, snippet_path)
 
 
-'''
-def infer_dataset():
-    gists_dir = os.path.abspath(sys.argv[1])
-    results_dir = os.path.abspath(sys.argv[2])
+def _load_finished_items(jsonl_path):
+    finished = set()
+    if not os.path.exists(jsonl_path):
+        return finished
 
-    if not os.path.isdir(results_dir):
-        os.mkdir(results_dir)
+    with open(jsonl_path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # the last line of an interrupted run
+                continue
+            if 'error' not in record:
+                finished.add(record['id'])
+    return finished
 
-    time_dict = {}
-    time_file = os.path.join(results_dir, 'time.txt')
 
-    count = 0
-    querier = QueryApplication()
-    for child_dir in sorted(os.listdir(gists_dir)):
-        count += 1
+_batch_querier = None
+_batch_results_dir = None
 
-        res_dir = os.path.join(results_dir, child_dir)
-        if not os.path.isdir(res_dir):
-            os.mkdir(res_dir)
-        else:
-            continue
-        
-        print('{}:{}'.format(count, child_dir))
-        
-        snippet_path = os.path.join(os.path.join(gists_dir, child_dir), 'snippet.py')
-        req_path = os.path.join(res_dir, 'requirements.txt')
+def _init_batch_worker(results_dir, parser_backend, kg, parser_workers=1, parser_interpreters=None):
+    # one QueryApplication (KG stores and parser) per worker process
+    global _batch_querier, _batch_results_dir
+    _batch_querier = QueryApplication(parser_backend, kg=kg, parser_workers=parser_workers, parser_interpreters=parser_interpreters)
+    _batch_results_dir = results_dir
+    multiprocessing.util.Finalize(None, _batch_querier.close, exitpriority=10)
 
-        stime = time.time()
-        infer_result = querier.infer_CRE(snippet_path, req_path)
-        with open(os.path.join(res_dir, 'result.json'), 'w') as f:
-            json.dump(infer_result, f)
-        
-        time_dict[child_dir] = format(time.time() - stime, '.2f')
-        with open(time_file, 'a') as f:
-            f.write('{} {}\n'.format(child_dir, time_dict[child_dir]))
 
+def _infer_batch_item(item):
+    item_id, snippet_path = item
+    record = {'id': item_id, 'snippet': snippet_path}
 
-    json_file = os.path.join(results_dir, 'time.json')
-    with open(json_file, 'w') as f:
-        json.dump(time_dict, f)
+    stime = time.time()
+    try:
+        res_dir = os.path.join(_batch_results_dir, _safe_item_id(item_id))
+        if not os.path.isdir(res_dir):
+            os.makedirs(res_dir)
+        log = open(os.path.join(res_dir, 'infer.log'), 'w')
+    except OSError:
+        # an error record of the item, instead of an exception out of the pool
+        record['error'] = traceback.format_exc()
+        record['total'] = round(time.time() - stime, 2)
+        return record
+
+    with log, contextlib.redirect_stdout(log):
+        try:
+            infer_result = _batch_querier.infer_CRE(snippet_path, res_dir)
+        except Exception:
+            record['error'] = traceback.format_exc()
+            log.write(record['error'])
+            infer_result = None
+
+    if infer_result is not None:
+        record['result'] = infer_result
+        record['timings'] = {stage: infer_result[stage] for stage in ('parse', 'match', 'solving')}
+    record['total'] = round(time.time() - stime, 2)
+    return record
+
+
+def infer_batch(input_path, results_dir, workers=1, parser_backend='auto', kg='neo4j', parser_workers=1, parser_interpreters=None):
+    """
+    Infer all snippets of a directory or a manifest, results are appended to <results_dir>/results.jsonl.
+    The snippets that already have a result are skipped, failed ones are retried.
+    Each worker process has parser_workers parse workers per Python version with the 'pool' backend.
+    """
+    if not os.path.isdir(results_dir):
+        os.makedirs(results_dir)
 
-    querier.close()
-'''
+    jsonl_path = os.path.join(results_dir, 'results.jsonl')
+    finished = _load_finished_items(jsonl_path)
+    items = [item for item in _batch_items(input_path) if item[0] not in finished]
+    print('{} snippets to infer, {} finished before.'.format(len(items), len(finished)))
+
+    count = 0
+    pool = multiprocessing.Pool(workers, initializer=_init_batch_worker, initargs=(results_dir, parser_backend, kg, parser_workers, parser_interpreters))
+    try:
+        with open(jsonl_path, 'a') as f:
+            for record in pool.imap_unordered(_infer_batch_item, items):
+                f.write(json.dumps(record) + '\n')
+                f.flush()
+
+                count += 1
+                status = 'error' if 'error' in record else '{}s'.format(record['total'])
+                print('{}/{}: {} ({})'.format(count, len(items), record['id'], status))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def parser_interpreters(args):
+    """{'Python2': path, 'Python3': path} of the local interpreters in the command-line args
+    <python2> <python3>, without the ones left out or '' (the parse images)."""
+    return {py_version: path for py_version, path in zip(('Python2', 'Python3'), args) if path != ''}
+
+
+def batch_main():
+    """
+    python run.py batch <dataset> <results_dir> <workers> <parser_backend> <kg> <parser_workers> <python2> <python3>
+    -----
+    dataset: a directory of snippets or a manifest file.
+    workers (Optional): the number of worker processes, 1 by default.
+    parser_workers (Optional): parse workers per Python version in each worker process of the pool backend, 1 by default.
+    python2, python3 (Optional): local interpreters for the parse workers of the pool backend, the parse images by default.
+    """
+    input_path = os.path.abspath(sys.argv[2])
+    results_dir = os.path.abspath(sys.argv[3])
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+    parser_backend = sys.argv[5] if len(sys.argv) > 5 else 'auto'
+    kg = sys.argv[6] if len(sys.argv) > 6 else 'neo4j'
+    parser_workers = int(sys.argv[7]) if len(sys.argv) > 7 and sys.argv[7] != '' else 1
+
+    infer_batch(input_path, results_dir, workers, parser_backend, kg, parser_workers, parser_interpreters(sys.argv[8:10]))
 
 
 def main():
+    """
+    python run.py <snippet_path> <dependencies_dir> <parser_backend> <kg> <parser_workers> <python2> <python3>
+    -----
+    parser_backend (Optional): auto (default), inprocess, docker or pool.
+    kg (Optional): neo4j (default), or a build_KG data directory to load the CSV files without Neo4j.
+    parser_workers (Optional): parse workers per Python version of the pool backend, 1 by default.
+    python2, python3 (Optional): local interpreters for the parse workers of the pool backend, the parse images by default.
+    """
     snippet_path = os.path.abspath(sys.argv[1])
     res_dir = os.path.abspath(sys.argv[2])
+    parser_backend = sys.argv[3] if len(sys.argv) > 3 else 'auto'
+    kg = sys.argv[4] if len(sys.argv) > 4 else 'neo4j'
+    parser_workers = int(sys.argv[5]) if len(sys.argv) > 5 and sys.argv[5] != '' else 1
 
-    querier = QueryApplication()
+    querier = QueryApplication(parser_backend, kg=kg, parser_workers=parser_workers, parser_interpreters=parser_interpreters(sys.argv[6:8]))
     infer_result = querier.infer_CRE(snippet_path, res_dir)
 
     querier.close()
 
 
 if __name__ == '__main__':
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == 'batch':
+        batch_main()
+    else:
+        main()
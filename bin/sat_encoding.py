@@ -0,0 +1,211 @@
+import math
+import itertools
+
+
+class VariableMap(object):
+    """Map the node ids of a RequireGraph to SAT variables 1..n, and back.
+
+    Variables are numbered in the order the ids are added.
+    """
+    def __init__(self, ids=()):
+        self.var_of = {}        # {id: var}
+        self.ids = [None]       # ids[var], variables start from 1
+        for item in ids:
+            self.add(item)
+
+    def add(self, item):
+        var = self.var_of.get(item)
+        if var is None:
+            var = len(self.ids)
+            self.var_of[item] = var
+            self.ids.append(item)
+        return var
+
+    def var(self, item):
+        return self.var_of[item]
+
+    def id(self, var):
+        return self.ids[var]
+
+    def __contains__(self, item):
+        return item in self.var_of
+
+    def __len__(self):
+        return len(self.ids) - 1
+
+    def new_var(self):
+        """An auxiliary variable of an encoding, without node id."""
+        self.ids.append(None)
+        return len(self.ids) - 1
+
+
+# at-most-one constraints over the literals of the versions of a package, each encoding
+# takes (literals, new_var) and returns the clauses
+def at_most_one_pairwise(literals, new_var):
+    """(not x or not y) for every pair: n(n-1)/2 clauses, no auxiliary variables."""
+    return [[-x, -y] for x, y in itertools.combinations(literals, 2)]
+
+
+def at_most_one_sequential(literals, new_var):
+    """Sequential counter (Sinz, 2005): 3n-4 clauses, n-1 auxiliary variables.
+    s_i is true if one of the first i literals is true."""
+    n = len(literals)
+    if n <= 1:
+        return []
+
+    counters = [new_var() for _ in range(n - 1)]
+    clauses = [[-literals[0], counters[0]]]
+    for i in range(1, n - 1):
+        clauses.append([-literals[i], counters[i]])
+        clauses.append([-counters[i-1], counters[i]])
+        clauses.append([-literals[i], -counters[i-1]])
+    clauses.append([-literals[n-1], -counters[n-2]])
+    return clauses
+
+
+def at_most_one_commander(literals, new_var, group_size=3):
+    """Commander encoding (Klieber and Kwon, 2007): pairwise in groups of group_size, and a
+    commander variable implied by each group, with at most one commander recursively."""
+    if len(literals) <= group_size + 1:
+        return at_most_one_pairwise(literals, new_var)
+
+    clauses = []
+    commanders = []
+    for i in range(0, len(literals), group_size):
+        group = literals[i:i+group_size]
+        commander = new_var()
+        commanders.append(commander)
+        clauses.extend(at_most_one_pairwise(group, new_var))
+        for literal in group:
+            clauses.append([-literal, commander])
+    clauses.extend(at_most_one_commander(commanders, new_var, group_size))
+    return clauses
+
+
+def at_most_one_product(literals, new_var):
+    """Product encoding (Chen, 2010): literals on a p x q grid imply their row and column
+    variables, with at most one row and one column recursively. 2n + o(n) clauses and
+    about 2*sqrt(n) auxiliary variables."""
+    n = len(literals)
+    if n <= 6:
+        return at_most_one_pairwise(literals, new_var)
+
+    p = int(math.ceil(math.sqrt(n)))
+    q = int(math.ceil(n / float(p)))
+    rows = [new_var() for _ in range(p)]
+    columns = [new_var() for _ in range(q)]
+    clauses = []
+    for i, literal in enumerate(literals):
+        clauses.append([-literal, rows[i // q]])
+        clauses.append([-literal, columns[i % q]])
+    clauses.extend(at_most_one_product(rows, new_var))
+    clauses.extend(at_most_one_product(columns, new_var))
+    return clauses
+
+
+AMO_ENCODINGS = {
+    'pairwise': at_most_one_pairwise,
+    'sequential': at_most_one_sequential,
+    'commander': at_most_one_commander,
+    'product': at_most_one_product,
+}
+
+# 'auto': pairwise up to AUTO_PAIRWISE_MAX literals (same clauses as before, no auxiliary
+# variables), sequential up to AUTO_SEQUENTIAL_MAX, product beyond (fewest auxiliary variables)
+AUTO_PAIRWISE_MAX = 6
+AUTO_SEQUENTIAL_MAX = 64
+
+
+def select_amo_encoding(n):
+    if n <= AUTO_PAIRWISE_MAX:
+        return 'pairwise'
+    if n <= AUTO_SEQUENTIAL_MAX:
+        return 'sequential'
+    return 'product'
+
+
+def at_most_one(literals, new_var, encoding='auto'):
+    """Clauses of at most one true literal, by AMO_ENCODINGS or 'auto' by the number of literals."""
+    if encoding == 'auto':
+        encoding = select_amo_encoding(len(literals))
+    if encoding not in AMO_ENCODINGS:
+        raise ValueError('Unknown at-most-one encoding \"{}\"'.format(encoding))
+    return AMO_ENCODINGS[encoding](literals, new_var)
+
+
+
+def _full_adder(x, y, z, new_var):
+    """sum = x xor y xor z, carry = majority(x, y, z), both ways."""
+    total, carry = new_var(), new_var()
+    clauses = [
+        [-x, -y, -z, total], [-x, y, z, total], [x, -y, z, total], [x, y, -z, total],
+        [x, y, z, -total], [x, -y, -z, -total], [-x, y, -z, -total], [-x, -y, z, -total],
+        [-x, -y, carry], [-x, -z, carry], [-y, -z, carry],
+        [x, y, -carry], [x, z, -carry], [y, z, -carry],
+    ]
+    return total, carry, clauses
+
+
+def _half_adder(x, y, new_var):
+    """sum = x xor y, carry = x and y, both ways."""
+    total, carry = new_var(), new_var()
+    clauses = [
+        [-x, y, total], [x, -y, total], [x, y, -total], [-x, -y, -total],
+        [-x, -y, carry], [x, -carry], [y, -carry],
+    ]
+    return total, carry, clauses
+
+
+def weighted_sum(weighted_literals, new_var):
+    """Binary adders (Warners, 1998) over [(literal, weight)] with positive integer weights.
+    Return (bits, clauses): bits[i] is bit i of the sum of the weights of the true literals,
+    O(n log W) clauses for n literals of weights up to W."""
+    buckets = []
+    for literal, weight in weighted_literals:
+        position = 0
+        while weight > 0:
+            if weight & 1:
+                while len(buckets) <= position:
+                    buckets.append([])
+                buckets[position].append(literal)
+            weight >>= 1
+            position += 1
+
+    bits = []
+    clauses = []
+    position = 0
+    while position < len(buckets):
+        bucket = buckets[position]
+        while len(bucket) >= 2:
+            if len(bucket) >= 3:
+                total, carry, adder_clauses = _full_adder(bucket.pop(), bucket.pop(), bucket.pop(), new_var)
+            else:
+                total, carry, adder_clauses = _half_adder(bucket.pop(), bucket.pop(), new_var)
+            clauses.extend(adder_clauses)
+            bucket.append(total)
+            if len(buckets) <= position + 1:
+                buckets.append([])
+            buckets[position + 1].append(carry)
+        if len(bucket) == 1:
+            bits.append(bucket[0])
+        else:
+            # a constant false bit
+            false = new_var()
+            clauses.append([-false])
+            bits.append(false)
+        position += 1
+    return bits, clauses
+
+
+def at_most_value(bits, bound, guard):
+    """Clauses of the binary number bits (least significant first) at most bound when the
+    guard literal is true: for each 0 bit of bound, not a 1 there with the higher bits equal."""
+    clauses = []
+    for i in range(len(bits)):
+        if (bound >> i) & 1:
+            continue
+        clause = [-guard, -bits[i]]
+        for j in range(i + 1, len(bits)):
+            clause.append(-bits[j] if (bound >> j) & 1 else bits[j])
+        clauses.append(clause)
+    return clauses
@@ -0,0 +1,135 @@
+import os
+import sys
+import json
+import time
+import threading
+import contextlib
+import socketserver
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from run import QueryApplication, parser_interpreters
+from kg_cache import KGCache
+
+
+class InferenceService(object):
+    """Keep one QueryApplication (parser backends, KG stores) warm between requests."""
+    def __init__(self, querier, quiet=True):
+        self.querier = querier
+        self.quiet = quiet
+        # the parser backends and the KG sessions are used by one inference at a time
+        self.lock = threading.Lock()
+
+    def infer(self, request):
+        """
+        request: {"snippet": source code, "requirements": ["numpy>=1.18", ...] (Optional)}
+        Return: the result of infer_snippet with the text of requirements.txt and Dockerfile.
+        """
+        if not isinstance(request.get('snippet'), str):
+            raise ValueError('\"snippet\" must be the source code of the snippet')
+        requirement_hints = request.get('requirements') or []
+
+        stime = time.time()
+        with self.lock:
+            if self.quiet:
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    ret = self.querier.infer_snippet(request['snippet'], requirement_hints)
+            else:
+                ret = self.querier.infer_snippet(request['snippet'], requirement_hints)
+        ret['total'] = round(time.time() - stime, 2)
+
+        ret['requirements'] = None
+        ret['dockerfile'] = None
+        if ret['python'] is not None:
+            ret['requirements'] = QueryApplication.requirement_text(ret['install_pairs'])
+            ret['dockerfile'] = QueryApplication.dockerfile_text('snippet.py', ret['python'], ret['install_groups'] if self.querier.grouped_install else None)
+        return ret
+
+    def close(self):
+        self.querier.close()
+
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET  /health   {"status": "ok"}
+    GET  /stats    hit/miss counters of the KG cache
+    POST /infer    {"snippet": ..., "requirements": [...]} -> result of InferenceService.infer
+    """
+    def do_GET(self):
+        if self.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        elif self.path == '/stats':
+            self._send_json(200, {'cache': self.server.service.querier.cache_stats()})
+        else:
+            self._send_json(404, {'error': 'Unknown path {}'.format(self.path)})
+
+    def do_POST(self):
+        if self.path != '/infer':
+            self._send_json(404, {'error': 'Unknown path {}'.format(self.path)})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+            ret = self.server.service.infer(request)
+        except (ValueError, KeyError, AttributeError) as e:
+            self._send_json(400, {'error': str(e)})
+        except Exception as e:
+            self._send_json(500, {'error': repr(e)})
+        else:
+            self._send_json(200, ret)
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class InferenceServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, service):
+        HTTPServer.__init__(self, address, InferenceRequestHandler)
+        self.service = service
+
+
+def main():
+    """
+    python service.py <port> <parser_backend> <cache_path> <kg> <kg_identity> <parser_workers> <python2> <python3>
+    -----
+    port (Optional): 8000 by default.
+    parser_backend (Optional): auto (default), inprocess, docker or pool.
+    cache_path (Optional): sqlite file of the on-disk KG cache, '' for none.
+    kg (Optional): neo4j (default), or a build_KG data directory of CSV files.
+    kg_identity (Optional): name of the loaded Neo4j dumps (e.g. their build date), required to
+                            keep their lookups in cache_path.
+    parser_workers (Optional): parse workers per Python version of the pool backend, 1 by default.
+    python2, python3 (Optional): local interpreters for the parse workers of the pool backend, the parse images by default.
+    """
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    parser_backend = sys.argv[2] if len(sys.argv) > 2 else 'auto'
+    cache_path = sys.argv[3] if len(sys.argv) > 3 and sys.argv[3] != '' else None
+    kg = sys.argv[4] if len(sys.argv) > 4 else 'neo4j'
+    kg_identity = None
+    if len(sys.argv) > 5 and sys.argv[5] != '':
+        kg_identity = {py_version: '{}/{}'.format(sys.argv[5], py_version) for py_version in ('Python2', 'Python3')}
+    elif cache_path is not None and kg == 'neo4j':
+        print('Warning: the lookups of Neo4j are only cached in memory without kg_identity.')
+    parser_workers = int(sys.argv[6]) if len(sys.argv) > 6 and sys.argv[6] != '' else 1
+
+    service = InferenceService(QueryApplication(parser_backend, cache=KGCache(disk_path=cache_path), kg_identity=kg_identity, kg=kg,
+                                                parser_workers=parser_workers, parser_interpreters=parser_interpreters(sys.argv[7:9])))
+    server = InferenceServer(('localhost', port), service)
+    print('Serving inference on http://localhost:{}/infer ...'.format(port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+from packaging.version import parse
+from packaging.specifiers import Specifier, SpecifierSet
+
+
+class VersionIndex(object):
+    """The versions of the packages in a RequireGraph, parsed once.
+
+    The versions of a package are kept newest first, and a requirement specifier is compiled
+    once per package into a bitset over that order: bit i is set if the i-th newest version
+    matches. Filtering versions by requirements is then an intersection of bitsets.
+    """
+    def __init__(self):
+        self.parsed = {}            # {version_id: Version}
+        self.rank = {}              # {version_id: rank}, newer versions first, equal versions share a rank
+        self.package_versions = {}  # {package_id: [version_id]}, newest first
+        self.position = {}          # {version_id: index in the versions of its package}
+        self.specifiers = {}        # {requirement: [clause]}
+        self.bitsets = {}           # {(package_id, requirement): bitset}
+        self.clause_bitsets = {}    # {(package_id, clause): bitset}
+
+    def add_package(self, package_id, versions):
+        """versions: {version_id: version string}"""
+        for version_id, version in versions.items():
+            self.parsed[version_id] = parse(version)
+        # sorted is stable, equal versions keep their order
+        sorted_versions = sorted(versions, key=lambda item: self.parsed[item], reverse=True)
+        self.package_versions[package_id] = sorted_versions
+        for index, version_id in enumerate(sorted_versions):
+            self.position[version_id] = index
+
+    def build(self):
+        """Rank the versions of all packages, after add_package."""
+        self.rank = {}
+        rank = -1
+        previous = None
+        for version_id in sorted(self.parsed, key=lambda item: self.parsed[item], reverse=True):
+            if previous is None or self.parsed[version_id] != previous:
+                rank += 1
+                previous = self.parsed[version_id]
+            self.rank[version_id] = rank
+
+    def all_bits(self, package_id):
+        return (1 << len(self.package_versions.get(package_id, []))) - 1
+
+    def bits(self, package_id, requirement):
+        """Bitset of the versions of package_id in the requirement specifier ('' or None for any version)."""
+        if requirement is None or requirement == '':
+            return self.all_bits(package_id)
+
+        key = (package_id, requirement)
+        bitset = self.bitsets.get(key)
+        if bitset is None:
+            clauses = self.specifiers.get(requirement)
+            if clauses is None:
+                # '>=1.0,<2.0' -> ['>=1.0', '<2.0'], the clauses are shared by the requirements
+                clauses = [str(item) for item in SpecifierSet(requirement)]
+                self.specifiers[requirement] = clauses
+            bitset = self.all_bits(package_id)
+            for clause in clauses:
+                bitset &= self._clause_bits(package_id, clause)
+            self.bitsets[key] = bitset
+        return bitset
+
+    def _clause_bits(self, package_id, clause):
+        key = (package_id, clause)
+        bitset = self.clause_bitsets.get(key)
+        if bitset is None:
+            spec = Specifier(clause, prereleases=True)
+            bitset = 0
+            for index, version_id in enumerate(self.package_versions.get(package_id, [])):
+                if spec.contains(self.parsed[version_id]):
+                    bitset |= 1 << index
+            self.clause_bitsets[key] = bitset
+        return bitset
+
+    def bits_of(self, version_ids):
+        """Bitset of the version_ids, versions of one package."""
+        bitset = 0
+        for version_id in version_ids:
+            bitset |= 1 << self.position[version_id]
+        return bitset
+
+    def contains(self, bitset, version_id):
+        return (bitset >> self.position[version_id]) & 1 == 1
+
+    def filter(self, version_ids, bitset):
+        """The versions in the bitset, in the order of version_ids."""
+        position = self.position
+        return [item for item in version_ids if (bitset >> position[item]) & 1]
@@ -12,9 +12,13 @@ def main():
     """
     Completely automated knowledge acquisition process
     -----
-    python run.py <python_version> <neo4j_home> <packages_file>
+    python run.py <python_version> <neo4j_home> <packages_file> <schema> <csv_mode>
     -----
-    packages_file (Optional): specified Python packages.
+    packages_file (Optional): specified Python packages, all packages of PyPI if not given or ''.
+    schema (Optional): 'full' (default), a Module node for each module of each version, or
+                       'dedup', one Module node shared by the versions with the same module tree.
+    csv_mode (Optional): 'plain' (default), 'stream', csv files written in one pass with buffered
+                         writers, or 'gzip', streamed into gzip-compressed csv files.
     """
 
     python_version = sys.argv[1]
@@ -28,9 +32,11 @@ def main():
         os.mkdir(python_dir)
     
     neo4j_home = sys.argv[2]
+    dedup_modules = len(sys.argv) > 4 and sys.argv[4] == 'dedup'
+    csv_mode = sys.argv[5] if len(sys.argv) > 5 else 'plain'
 
     p_list = []
-    if len(sys.argv) <= 3:
+    if len(sys.argv) <= 3 or sys.argv[3] == '':
         # Get all packages from PyPI
         p_list = get_distributions()
     else:
@@ -87,7 +93,7 @@ def main():
     csv_dir = os.path.join(python_dir, 'csv-data')
 
     print('----- Transfer to csv files ... (saved to {}) -----'.format(csv_dir))
-    transformer = CsvTransformer(csv_dir, neo4j_home)
+    transformer = CsvTransformer(csv_dir, neo4j_home, dedup_modules, streaming=(csv_mode != 'plain'), compress=(csv_mode == 'gzip'))
     unknown_packages = transformer.generate_csv(install_dir)
     print('----- Get {} unknown packages -----'.format(len(unknown_packages)))
 
@@ -110,6 +116,7 @@ def main():
 
     # Supplements: add to csv files
     transformer.add_packages_and_versions(unknown_pv_path)
+    transformer.close()
 
 
 if __name__ == '__main__':
@@ -2,15 +2,130 @@ from packaging.requirements import Requirement, InvalidRequirement
 from packaging.utils import canonicalize_name
 from packaging.version import parse
 import os
+import csv
+import gzip
 import json
+import shutil
+import hashlib
+import sqlite3
+import tempfile
+
+
+NODE_FILES = ['packages', 'versions', 'modules', 'attributes']
+RELATIONSHIP_FILES = ['hasVersion', 'version2Module', 'module2Module', 'hasAttribute', 'requires']
+# pages of the sqlite cache of a DiskMap (1 KiB each)
+DISK_MAP_CACHE_PAGES = 256
+
+
+def tree_hash(name, import_status, attrs, child_hashes):
+    """Fingerprint of a module tree: the name, import status and attributes of the module, and the tree hashes of its submodules."""
+    content = json.dumps([name, str(import_status), sorted(attrs), sorted(child_hashes)])
+    return hashlib.sha1(content.encode()).hexdigest()[:16]
+
+
+class DiskMap(object):
+    """
+    A map of the streaming mode in a temporary sqlite file, so the names and ids of the whole
+    dataset are not kept in memory. Keys are strings or tuples of strings, values are ints.
+    """
+    def __init__(self, tmp_dir):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite', dir=tmp_dir)
+        os.close(fd)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute('PRAGMA journal_mode = OFF')
+        self.conn.execute('PRAGMA synchronous = OFF')
+        self.conn.execute('PRAGMA page_size = 1024')
+        self.conn.execute('PRAGMA cache_size = {}'.format(DISK_MAP_CACHE_PAGES))
+        self.conn.execute('CREATE TABLE map (key TEXT PRIMARY KEY, value INTEGER) WITHOUT ROWID')
+
+    @staticmethod
+    def _key(key):
+        return key if isinstance(key, str) else '\n'.join(key)
+
+    def get(self, key, default=None):
+        row = self.conn.execute('SELECT value FROM map WHERE key = ?', (self._key(key),)).fetchone()
+        return default if row is None else row[0]
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.conn.execute('INSERT OR REPLACE INTO map VALUES (?, ?)', (self._key(key), value))
+
+    def close(self):
+        self.conn.close()
+        os.remove(self.path)
+
+
+def csv_line(row, quoted=()):
+    """A CSV line of the values of row, like csv.writer: a value is in double quotes if its column
+    is in quoted or it has a comma, double quote or newline, double quotes doubled inside."""
+    values = []
+    for i, item in enumerate(row):
+        value = '{}'.format(item)
+        if i in quoted or ',' in value or '\"' in value or '\n' in value or '\r' in value:
+            value = '\"{}\"'.format(value.replace('\"', '\"\"'))
+        values.append(value)
+    return ','.join(values) + '\n'
+
+
+class CsvRows(object):
+    """
+    Rows of a CSV file of the KG. The values of a row are joined by commas as they are (the
+    columns of quoted in double quotes), or escaped by csv_line in the streaming mode.
+    A path ending with .gz is written to a plain file first and compressed by close, so one
+    gzip stream is open at a time, not one per CSV file.
+    """
+    def __init__(self, path, mode='w', streaming=False, quoted=()):
+        self.path = path
+        self.mode = mode
+        self.plain_path = path[:-len('.gz')] + '.part' if path.endswith('.gz') else None
+        self.f = open(self.plain_path if self.plain_path is not None else path, 'w' if self.plain_path is not None else mode)
+        self.streaming = streaming
+        self.quoted = quoted
+
+    def writerow(self, row):
+        if self.streaming:
+            self.f.write(csv_line(row, self.quoted))
+        else:
+            self.f.write(','.join('\"{}\"'.format(item) if i in self.quoted else '{}'.format(item) for i, item in enumerate(row)) + '\n')
+
+    def close(self):
+        self.f.close()
+        if self.plain_path is not None:
+            # appended as another gzip member in mode 'a'
+            with open(self.plain_path, 'rb') as src, gzip.open(self.path, self.mode + 'b') as dst:
+                shutil.copyfileobj(src, dst, 1 << 13)
+            os.remove(self.plain_path)
 
 
 class CsvTransformer(object):
-    def __init__(self, res_dir, neo4j_home):
+    def __init__(self, res_dir, neo4j_home, dedup_modules=False, streaming=False, compress=False):
+        # escaped CSV values, the maps below in DiskMap files instead of dicts, and the requirements resolved
+        # while reading the versions, the ones of packages not read yet spilled to a temporary file;
+        # only the data.json and import_fail.json of one version are in memory at a time
+        self.streaming = streaming
+        # gzip-compressed CSV files (.csv.gz), imported by neo4j-admin as they are
+        self.compress = compress
+        self.res_dir = res_dir
+
+        # all csv files for nodes and relationships
+        if not os.path.isdir(res_dir):
+            os.mkdir(res_dir)
+
         # global info for nodes
-        self.packageInfo_dict = {}      # {name: id}
-        self.attributeInfo_dict = {}    # {name: id}
-        self.version_require = {}       # {vid: requires}
+        self.packageInfo_dict = DiskMap(res_dir) if streaming else {}      # {name: id}
+        self.attributeInfo_dict = DiskMap(res_dir) if streaming else {}    # {name: id}
+        # one Module node per (name, tree hash), shared by the versions with the same module tree
+        self.dedup_modules = dedup_modules
+        self.module_trees = DiskMap(res_dir) if streaming and dedup_modules else {}    # {(name, tree_hash): id}
+        self.version_require = {}       # {vid: requires}, resolved after all versions unless streaming
 
         # generate unique ID
         self.package_id = 0
@@ -28,10 +143,6 @@ class CsvTransformer(object):
         self.label_hasAttribute = 'HAS_ATTRIBUTE'
         self.label_require = 'REQUIRES'
 
-        # all csv files for nodes and relationships
-        if not os.path.isdir(res_dir):
-            os.mkdir(res_dir)
-        
         node_dir = os.path.join(res_dir, 'nodes')
         rel_dir = os.path.join(res_dir, 'relationships')
         if not os.path.isdir(node_dir):
@@ -40,26 +151,27 @@ class CsvTransformer(object):
             os.mkdir(rel_dir)
         
         # shell script: load csv files to neo4j database
+        suffix = '.csv.gz' if compress else '.csv'
         with open(os.path.join(res_dir, 'run.sh'), 'w') as f:
             f.write('#!/bin/bash\n')
             f.write('{}/bin/neo4j-admin import \\\n'.format(os.path.abspath(neo4j_home)))
-            f.write('--nodes nodes/packages_header.csv,nodes/packages.csv \\\n')
-            f.write('--nodes nodes/versions_header.csv,nodes/versions.csv \\\n')
-            f.write('--nodes nodes/modules_header.csv,nodes/modules.csv \\\n')
-            f.write('--nodes nodes/attributes_header.csv,nodes/attributes.csv \\\n')
-            f.write('--relationships relationships/hasVersion_header.csv,relationships/hasVersion.csv \\\n')
-            f.write('--relationships relationships/version2Module_header.csv,relationships/version2Module.csv \\\n')
-            f.write('--relationships relationships/module2Module_header.csv,relationships/module2Module.csv \\\n')
-            f.write('--relationships relationships/hasAttribute_header.csv,relationships/hasAttribute.csv \\\n')
-            f.write('--relationships relationships/requires_header.csv,relationships/requires.csv')
+            f.write(' \\\n'.join(['--nodes nodes/{0}_header.csv,nodes/{0}{1}'.format(name, suffix) for name in NODE_FILES] +
+                                  ['--relationships relationships/{0}_header.csv,relationships/{0}{1}'.format(name, suffix) for name in RELATIONSHIP_FILES]))
         
+        # shell script: build the memory-mapped KG snapshot of bin/kg_snapshot.py from csv files
+        snapshot_script = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'bin', 'kg_snapshot.py')
+        with open(os.path.join(res_dir, 'snapshot.sh'), 'w') as f:
+            f.write('#!/bin/bash\n')
+            f.write('python {} build \"$(dirname \"$0\")\"\n'.format(snapshot_script))
+            f.write('python {} validate \"$(dirname \"$0\")/kg.snapshot\" \"$(dirname \"$0\")\"'.format(snapshot_script))
+
         # csv header
         with open(os.path.join(node_dir, 'packages_header.csv'), 'w') as f:
             f.write(':ID(Package-ID),name,:LABEL')
         with open(os.path.join(node_dir, 'versions_header.csv'), 'w') as f:
             f.write(':ID(Version-ID),version,install_status,:LABEL')
         with open(os.path.join(node_dir, 'modules_header.csv'), 'w') as f:
-            f.write(':ID(Module-ID),name,import_status,:LABEL')
+            f.write(':ID(Module-ID),name,import_status,tree_hash,:LABEL')
         with open(os.path.join(node_dir, 'attributes_header.csv'), 'w') as f:
             f.write(':ID(Attribute-ID),name,:LABEL')
         
@@ -74,16 +186,16 @@ class CsvTransformer(object):
         with open(os.path.join(rel_dir, 'requires_header.csv'), 'w') as f:
             f.write(':START_ID(Version-ID),requirement,:END_ID(Package-ID),:TYPE')
 
-        self.csv_package = os.path.join(node_dir, 'packages.csv')
-        self.csv_version = os.path.join(node_dir, 'versions.csv')
-        self.csv_module = os.path.join(node_dir, 'modules.csv')
-        self.csv_attribute = os.path.join(node_dir, 'attributes.csv')
+        self.csv_package = os.path.join(node_dir, 'packages' + suffix)
+        self.csv_version = os.path.join(node_dir, 'versions' + suffix)
+        self.csv_module = os.path.join(node_dir, 'modules' + suffix)
+        self.csv_attribute = os.path.join(node_dir, 'attributes' + suffix)
         
-        self.csv_hasVersion = os.path.join(rel_dir, 'hasVersion.csv')
-        self.csv_version2Module = os.path.join(rel_dir, 'version2Module.csv')
-        self.csv_module2Module = os.path.join(rel_dir, 'module2Module.csv')
-        self.csv_hasAttribute = os.path.join(rel_dir, 'hasAttribute.csv')
-        self.csv_require = os.path.join(rel_dir, 'requires.csv')
+        self.csv_hasVersion = os.path.join(rel_dir, 'hasVersion' + suffix)
+        self.csv_version2Module = os.path.join(rel_dir, 'version2Module' + suffix)
+        self.csv_module2Module = os.path.join(rel_dir, 'module2Module' + suffix)
+        self.csv_hasAttribute = os.path.join(rel_dir, 'hasAttribute' + suffix)
+        self.csv_require = os.path.join(rel_dir, 'requires' + suffix)
 
 
     def add_packages_and_versions(self, pv_file):
@@ -92,8 +204,8 @@ class CsvTransformer(object):
             pv_data = json.load(f)
         
         # files writer
-        node_version = open(self.csv_version, 'a')
-        rel_version = open(self.csv_hasVersion, 'a')
+        node_version = CsvRows(self.csv_version, 'a', self.streaming)
+        rel_version = CsvRows(self.csv_hasVersion, 'a', self.streaming)
         
         p_num = 0
         v_num = 0
@@ -108,8 +220,8 @@ class CsvTransformer(object):
             pid = self.packageInfo_dict[package]
             version_list.sort(key=lambda x:parse(x))
             for version in version_list:
-                node_version.write('{},{},{},{}\n'.format(self.version_id, version, 'Unknown', self.label_version))
-                rel_version.write('{},{},{}\n'.format(pid, self.version_id, self.label_hasVersion))
+                node_version.writerow((self.version_id, version, 'Unknown', self.label_version))
+                rel_version.writerow((pid, self.version_id, self.label_hasVersion))
                 self.version_id += 1
         
         node_version.close()
@@ -117,20 +229,87 @@ class CsvTransformer(object):
         print('Supplements: {} packages and {} versions'.format(p_num, v_num))
 
     
+    @staticmethod
+    def _parse_requires(requires):
+        """(specifier, package) of the requirements of a version"""
+        for item in requires:
+            # ignore extra requirements
+            if len(item.split(';')) > 1:
+                continue
+
+            try:
+                req = Requirement(item)
+                yield str(req.specifier).replace('\"', '\''), canonicalize_name(req.name)
+            except InvalidRequirement:
+                print('Warning: InvalidRequirement \"{}\"'.format(item))
+
+
+    def _write_modules(self, module_rows, node_module, node_attr, rel_version2module, rel_module2module, rel_attr):
+        """
+        module_rows: the modules of the version, parents first
+        A module whose tree is already in the KG is not written again with dedup_modules, its
+        parent or the version has a HAS_MODULE to the existing one.
+        """
+        # submodules are deeper, so after their parents in module_rows
+        submodules = [[] for _ in module_rows]
+        for index, row in enumerate(module_rows):
+            if row[3] is not None:
+                submodules[row[3]].append(index)
+        hashes = [None] * len(module_rows)
+        for index in reversed(range(len(module_rows))):
+            module, import_status, attrs, _ = module_rows[index]
+            hashes[index] = tree_hash(module, import_status, attrs, [hashes[item] for item in submodules[index]])
+
+        ids = [None] * len(module_rows)
+        shared = [False] * len(module_rows)     # in a tree already in the KG
+        for index, (module, import_status, attrs, parent) in enumerate(module_rows):
+            if parent is not None and shared[parent]:
+                shared[index] = True
+                continue
+
+            key = (module, hashes[index])
+            module_id = self.module_trees.get(key) if self.dedup_modules else None
+            if module_id is not None:
+                ids[index] = module_id
+                shared[index] = True
+            else:
+                ids[index] = self.module_id
+                self.module_id += 1
+                if self.dedup_modules:
+                    self.module_trees[key] = ids[index]
+                node_module.writerow((ids[index], module, import_status, hashes[index], self.label_module))
+                # attrs
+                for attr in attrs:
+                    attr_id = self.attributeInfo_dict.get(attr)
+                    if attr_id is None:
+                        attr_id = self.attribute_id
+                        self.attributeInfo_dict[attr] = attr_id
+                        node_attr.writerow((attr_id, attr, self.label_attribute))
+                        self.attribute_id += 1
+                    rel_attr.writerow((ids[index], attr_id, self.label_hasAttribute))
+
+            if parent is None:
+                rel_version2module.writerow((self.version_id, ids[index], self.label_hasModule))
+            else:
+                rel_module2module.writerow((ids[parent], ids[index], self.label_hasModule))
+
+
     def generate_csv(self, data_dir):
         """
         Return: the packages that need versions
         """        
         # files writer
-        node_package = open(self.csv_package, 'w')
-        node_version = open(self.csv_version, 'w')
-        node_module = open(self.csv_module, 'w')
-        node_attr = open(self.csv_attribute, 'w')
-        rel_version = open(self.csv_hasVersion, 'w')
-        rel_version2module = open(self.csv_version2Module, 'w')
-        rel_module2module = open(self.csv_module2Module, 'w')
-        rel_attr = open(self.csv_hasAttribute, 'w')
-        rel_require = open(self.csv_require, 'w')
+        node_package = CsvRows(self.csv_package, 'w', self.streaming)
+        node_version = CsvRows(self.csv_version, 'w', self.streaming)
+        node_module = CsvRows(self.csv_module, 'w', self.streaming)
+        node_attr = CsvRows(self.csv_attribute, 'w', self.streaming)
+        rel_version = CsvRows(self.csv_hasVersion, 'w', self.streaming)
+        rel_version2module = CsvRows(self.csv_version2Module, 'w', self.streaming)
+        rel_module2module = CsvRows(self.csv_module2Module, 'w', self.streaming)
+        rel_attr = CsvRows(self.csv_hasAttribute, 'w', self.streaming)
+        rel_require = CsvRows(self.csv_require, 'w', self.streaming, quoted=(1,))
+        # requirements of the packages not read yet: (vid, specifier, package)
+        spilled = tempfile.TemporaryFile('w+', dir=self.res_dir) if self.streaming else None
 
         # packages and versions
         for package in os.listdir(data_dir):
@@ -140,7 +319,7 @@ class CsvTransformer(object):
                 continue
             
             self.packageInfo_dict[package] = self.package_id
-            node_package.write('{},{},{}\n'.format(self.package_id, package, self.label_package))
+            node_package.writerow((self.package_id, package, self.label_package))
 
             p_dir = os.path.join(data_dir, package)
             version_list = os.listdir(p_dir)
@@ -148,7 +327,7 @@ class CsvTransformer(object):
 
             version_list.sort(key=lambda x:parse(x))
             for version in version_list:
-                rel_version.write('{},{},{}\n'.format(self.package_id, self.version_id, self.label_hasVersion))
+                rel_version.writerow((self.package_id, self.version_id, self.label_hasVersion))
                 v_dir = os.path.join(p_dir, version)
                 install_status = 'Fail'
                 if os.path.exists(os.path.join(v_dir, 'LABEL')):
@@ -163,7 +342,7 @@ class CsvTransformer(object):
                                     # Due to networkError
                                     install_status = 'Unknown'
                                     break
-                node_version.write('{},{},{},{}\n'.format(self.version_id, version, install_status, self.label_version))
+                node_version.writerow((self.version_id, version, install_status, self.label_version))
                 
                 data_path = os.path.join(v_dir, 'data.json')
                 if not os.path.exists(data_path):
@@ -186,47 +365,44 @@ class CsvTransformer(object):
                     continue
                 
                 if data_json['Requires'] is not None and len(data_json['Requires']) > 0:
-                    self.version_require[self.version_id] = data_json['Requires']
-                # modules
-                module_dict = {}
+                    if self.streaming:
+                        for specifier, require_package in self._parse_requires(data_json['Requires']):
+                            require_id = self.packageInfo_dict.get(require_package)
+                            if require_id is not None:
+                                rel_require.writerow((self.version_id, specifier, require_id, self.label_require))
+                            else:
+                                spilled.write(csv_line((self.version_id, specifier, require_package)))
+                    else:
+                        self.version_require[self.version_id] = data_json['Requires']
+                # modules, written with their tree hashes after the version
+                module_dict = {}    # {module: index in module_rows}
+                module_rows = []    # [(module, import_status, attrs, index of the parent module or None)]
                 module_list = data_json['Modules'] + list(import_json)
                 module_list.sort(key=lambda x:len(x.split('.')))
                 for module in module_list:
-                    module_dict[module] = self.module_id
                     import_status = True
                     if module in import_json:
                         import_status = False
-                    node_module.write('{},{},{},{}\n'.format(self.module_id, module, import_status, self.label_module))
                     
+                    parent = None
                     module_info = module.split('.')
-                    if len(module_info) == 1:
-                        rel_version2module.write('{},{},{}\n'.format(self.version_id, self.module_id, self.label_hasModule))
-                    else:
+                    if len(module_info) > 1:
                         index = 0
-                        has_prefix = False
                         for i in range(1, len(module_info)):
                             index += len(module_info[-i])+1
                             prefix_module = module[:-index]
                             if prefix_module in module_dict:
-                                has_prefix = True
-                                rel_module2module.write('{},{},{}\n'.format(module_dict[prefix_module], self.module_id, self.label_hasModule))
+                                parent = module_dict[prefix_module]
                                 if i != 1:
                                     print('Warning: module \"{}\" --> \"{}\" ({} {})'.format(prefix_module, module, package, version))
                                 break
                         
-                        if not has_prefix:
+                        if parent is None:
                             print('Warning: module \"{}\" has no parent module ({} {})'.format(module, package, version))
-                            rel_version2module.write('{},{},{}\n'.format(self.version_id, self.module_id, self.label_hasModule))
-                    # attrs
-                    if module in data_json['Attrs']:
-                        for attr in data_json['Attrs'][module]:
-                            if attr not in self.attributeInfo_dict:
-                                self.attributeInfo_dict[attr] = self.attribute_id
-                                node_attr.write('{},{},{}\n'.format(self.attribute_id, attr, self.label_attribute))
-                                self.attribute_id += 1
-                            rel_attr.write('{},{},{}\n'.format(self.module_id, self.attributeInfo_dict[attr], self.label_hasAttribute))
-                            
-                    self.module_id += 1
+                    module_dict[module] = len(module_rows)
+                    module_rows.append((module, import_status, data_json['Attrs'].get(module, []), parent))
+
+                self._write_modules(module_rows, node_module, node_attr, rel_version2module, rel_module2module, rel_attr)
                 
                 self.version_id += 1
             
@@ -235,24 +411,22 @@ class CsvTransformer(object):
         # require
         print('Handle on requirements ...')
         unknown_packages = []
-        for vid, requires in self.version_require.items():
-            for item in requires:
-                # ignore extra requirements
-                if len(item.split(';')) > 1:
-                    continue
-
-                try:
-                    req = Requirement(item)
-
-                    require_package = canonicalize_name(req.name)
-                    if require_package not in self.packageInfo_dict:
-                        unknown_packages.append(require_package)
-                        self.packageInfo_dict[require_package] = self.package_id
-                        node_package.write('{},{},{}\n'.format(self.package_id, require_package, self.label_package))
-                        self.package_id += 1
-                    rel_require.write('{},\"{}\",{},{}\n'.format(vid, str(req.specifier).replace('\"', '\''), self.packageInfo_dict[require_package], self.label_require))
-                except InvalidRequirement:
-                    print('Warning: InvalidRequirement \"{}\"'.format(item))
+        if self.streaming:
+            spilled.seek(0)
+            requires = ((int(vid), specifier, require_package) for vid, specifier, require_package in csv.reader(spilled))
+        else:
+            requires = ((vid, specifier, require_package) for vid, items in self.version_require.items() for specifier, require_package in self._parse_requires(items))
+        for vid, specifier, require_package in requires:
+            require_id = self.packageInfo_dict.get(require_package)
+            if require_id is None:
+                unknown_packages.append(require_package)
+                require_id = self.package_id
+                self.packageInfo_dict[require_package] = require_id
+                node_package.writerow((require_id, require_package, self.label_package))
+                self.package_id += 1
+            rel_require.writerow((vid, specifier, require_id, self.label_require))
+        if spilled is not None:
+            spilled.close()
 
         # close
         node_package.close()
@@ -265,9 +439,26 @@ class CsvTransformer(object):
         rel_attr.close()
         rel_require.close()
 
+        # only the packages are needed by add_packages_and_versions
+        for info in (self.attributeInfo_dict, self.module_trees):
+            if isinstance(info, DiskMap):
+                info.close()
+        self.attributeInfo_dict = {}
+        self.module_trees = {}
+
         return unknown_packages
 
 
+    def close(self):
+        """Remove the DiskMap files of the streaming mode."""
+        for info in (self.packageInfo_dict, self.attributeInfo_dict, self.module_trees):
+            if isinstance(info, DiskMap):
+                info.close()
+        self.packageInfo_dict = {}
+        self.attributeInfo_dict = {}
+        self.module_trees = {}
+
+
 def main():
     pass
 
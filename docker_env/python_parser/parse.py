@@ -21,16 +21,65 @@ def parse_file(filename):
     """
 
     with open(filename, 'r') as py_file:
-        try:
-            # Parse python snippet into an AST
-            tree = ast.parse(py_file.read())
+        return parse_source(py_file.read())
+
+
+def parse_source(source, visitor=None):
+    """Parse the source code of a snippet.
+    Parameters
+    ----------
+    source : string
+        Source code of the snippet.
+    visitor : ParserVisitor, optional
+        Visitor used to walk the AST, a fresh ParserVisitor by default.
+    Returns
+    -------
+    dict
+        Same as parse_file, None if the snippet can't be parsed.
+    """
 
-            # Get imports and resources from AST
-            visitor = ParserVisitor()
-            visitor.visit(tree)
-            return {'imports':list(visitor.import_libraries), 'resources':list(visitor.resources), 'attrs':list(visitor.attrs)}
-        except SyntaxError:
-            return None
+    try:
+        # Parse python snippet into an AST
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None
+
+    # Get imports and resources from AST
+    if visitor is None:
+        visitor = ParserVisitor()
+    visitor.visit(tree)
+    return {'imports':list(visitor.import_libraries), 'resources':list(visitor.resources), 'attrs':list(visitor.attrs)}
+
+
+def serve():
+    """Parse snippets until the end of stdin.
+    Each request is a JSON line {"id": ..., "source": ...}, answered by a JSON line
+    {"id": ..., "result": ...} where result is the dict of parse_file or null.
+    """
+
+    # the responses are the only output on stdout, anything printed goes to stderr
+    out = sys.stdout
+    sys.stdout = sys.stderr
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            break
+        if not line.strip():
+            continue
+
+        request = json.loads(line)
+        source = request['source']
+        if sys.version_info[0] == 2:
+            # ast of Python 2 rejects unicode source with an encoding declaration
+            source = source.encode('utf-8')
+
+        response = {'id': request.get('id'), 'result': None}
+        try:
+            response['result'] = parse_source(source)
+        except Exception as e:
+            response['error'] = repr(e)
+        out.write(json.dumps(response) + '\n')
+        out.flush()
 
 
 def main():
@@ -38,8 +87,13 @@ def main():
     Usage
     -----
     python parse.py <filepath>
+    python parse.py --serve
     """
 
+    if sys.argv[1] == '--serve':
+        serve()
+        return
+
     file_path = os.path.abspath(sys.argv[1])
     if os.path.isfile(file_path) and os.path.splitext(file_path)[1] == '.py':
         ret = parse_file(file_path)
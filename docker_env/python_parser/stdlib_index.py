@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import pkgutil
+import sysconfig
+import subprocess
+
+
+# Versioned index of the top-level modules in the standard library
+INDEX_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stdlib_index.json')
+
+
+def list_stdlib_modules():
+    """List the top-level standard library modules of the running interpreter.
+    Returns
+    -------
+    list
+        Sorted names of builtin modules, and modules or packages in the stdlib directories.
+    """
+
+    names = set(sys.builtin_module_names)
+    names.update(getattr(sys, 'stdlib_module_names', ()))
+
+    # Python 2 also keeps modules in lib-tk, lib-old and plat-* under the stdlib dir
+    stdlib_dir = sysconfig.get_paths()['stdlib']
+    search_path = [stdlib_dir, os.path.join(stdlib_dir, 'lib-dynload')]
+    search_path.extend(path for path in sys.path if path.startswith(stdlib_dir) and 'site-packages' not in path)
+    for _, name, _ in pkgutil.iter_modules(search_path):
+        names.add(name)
+    return sorted(names)
+
+
+_stdlib_modules = {}   # {python_version: frozenset}
+
+
+def _select_version(versions, python_version):
+    """The indexed version for python_version: itself, else the newest older minor, else the oldest minor."""
+    if python_version in versions:
+        return python_version
+
+    major, minor = [int(item) for item in python_version.split('.')[:2]]
+    same_major = sorted((int(item.split('.')[1]), item) for item in versions if int(item.split('.')[0]) == major)
+    if len(same_major) == 0:
+        raise ValueError('No standard library index for Python {}'.format(python_version))
+    older = [item for item in same_major if item[0] <= minor]
+    return older[-1][1] if len(older) > 0 else same_major[0][1]
+
+
+def load_stdlib_modules(python_version=None):
+    """Load the top-level standard library modules of a Python version.
+    Parameters
+    ----------
+    python_version : string, optional
+        'major.minor', the running interpreter by default.
+    Returns
+    -------
+    frozenset
+        Names of the top-level modules.
+    """
+
+    if python_version is None:
+        python_version = '{}.{}'.format(*sys.version_info[:2])
+
+    if python_version not in _stdlib_modules:
+        with open(INDEX_FILE, 'r') as f:
+            index = json.load(f)
+        _stdlib_modules[python_version] = frozenset(index[_select_version(index, python_version)])
+    return _stdlib_modules[python_version]
+
+
+def build_index(interpreters):
+    """Run list_stdlib_modules in each interpreter.
+    Parameters
+    ----------
+    interpreters : list
+        Paths of the interpreters, one per supported Python version.
+    Returns
+    -------
+    dict
+        {'major.minor': [module, ...]}
+    """
+
+    index = {}
+    for interpreter in interpreters:
+        output = subprocess.check_output([interpreter, os.path.abspath(__file__), '--list'])
+        info = json.loads(output.decode())
+        index[info['version']] = info['modules']
+    return index
+
+
+def main():
+    """Generate stdlib_index.json.
+    Usage
+    -----
+    python stdlib_index.py <interpreter> ...
+    """
+
+    if sys.argv[1] == '--list':
+        info = {'version': '{}.{}'.format(*sys.version_info[:2]), 'modules': list_stdlib_modules()}
+        print(json.dumps(info))
+        return
+
+    index = build_index(sys.argv[1:])
+    with open(INDEX_FILE, 'w') as f:
+        json.dump(index, f, indent=0, sort_keys=True)
+    print('Index of Python {} saved to {}'.format(', '.join(sorted(index)), INDEX_FILE))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,6 @@
 import ast
-import imp
 import sys
-import importlib
+from stdlib_index import load_stdlib_modules
 
 
 # Up the recursion limit
@@ -9,12 +8,17 @@ sys.setrecursionlimit(10000)
 
 
 class ParserVisitor(ast.NodeVisitor):
-    def __init__(self):
+    def __init__(self, python_version=None):
         self.import_libraries = set()   # imported modules that aren't in standard library
-        self.import_names = []          # used name
+        self.import_trie = {}           # used names: {part: {part: ..., None: import order}}
+        self.import_count = 0           # the number of used names
         self.mappings = {}              # {used_name: full_name}
         self.resources = set()          # uncertain resources: from ... import xxx
         self.attrs = set()              # the attributes of those modules used in the code
+        self.attr_trie = {}             # self.attrs: {part: {part: ...}}
+
+        self.stdlib_modules = load_stdlib_modules(python_version)  # top-level modules of the standard library
+        self.stdlib_cache = {}          # {name: True/False}
 
     def is_standard_library(self, name):
         """Determine if a module name refers to a module in the python standard library.
@@ -32,19 +36,11 @@ class ParserVisitor(ast.NodeVisitor):
         if name is None:
             raise Exception('Name cannot be none')
 
-        # Attempt to use python import tools to discover facts about the module.
-        # If we get an import error, it was definitely not part of the standard library, so return false.
-        # If we do find the module, check to make sure it's not not a builtin or part of python extras or site-packages.
-        
-        # get top_module name
-        try:
-            importlib.import_module(name)
-            
-            name = name.split('.')[0]
-            path = imp.find_module(name)[1]
-            return bool(imp.is_builtin(name) or ('site-packages' not in path and 'Extras' not in path))
-        except ImportError:
-            return False
+        # Look up the top module in the standard library index of the Python version,
+        # the snippet's modules are never imported.
+        if name not in self.stdlib_cache:
+            self.stdlib_cache[name] = name.split('.')[0] in self.stdlib_modules
+        return self.stdlib_cache[name]
 
     def visit_Import(self, node):
         # Import(alias* names)
@@ -54,9 +50,9 @@ class ParserVisitor(ast.NodeVisitor):
                 self.import_libraries.add(alias.name)
                 if alias.asname is not None:
                     self.mappings[alias.asname] = alias.name
-                    self.import_names.insert(0, alias.asname)
+                    self.add_import_name(alias.asname)
                 else:
-                    self.import_names.insert(0, alias.name)
+                    self.add_import_name(alias.name)
 
         # Call generic visit to visit all child nodes
         self.generic_visit(node)
@@ -73,10 +69,10 @@ class ParserVisitor(ast.NodeVisitor):
 
                     if alias.asname is not None:
                         self.mappings[alias.asname] = possible_module
-                        self.import_names.insert(0, alias.asname)
+                        self.add_import_name(alias.asname)
                     else:
                         self.mappings[alias.name] = possible_module
-                        self.import_names.insert(0, alias.name)
+                        self.add_import_name(alias.name)
 
         # Call generic visit to visit all child nodes
         self.generic_visit(node)
@@ -94,44 +90,78 @@ class ParserVisitor(ast.NodeVisitor):
     def visit_Attribute(self, node):
         # Attribute(expr value, identifier attr, expr_context ctx)
         # xx.xx must be an attribute
-        attr_name = self.get_variable_name(node)
-        if attr_name != '':
-            for name in self.import_names:
-                if attr_name.startswith('{}.'.format(name)):
-                    # should add it to self.attrs
-                    if name in self.mappings:
-                        resource_name = '{}{}'.format(self.mappings[name], attr_name[len(name):])
-                    else:
-                        resource_name = attr_name
-                    
-                    # check if already exists
-                    has_exist = False
-                    for exist_res in self.attrs:
-                        if exist_res.startswith('{}.'.format(resource_name)):
-                            has_exist = True
-                            break
-                    
-                    if not has_exist:
-                        self.attrs.add(resource_name)
+        # resolve the whole chain at the outermost node, from the longest prefix to the shortest
+        parts, value = self.get_variable_parts(node)
+        if parts is not None:
+            self.add_attrs(parts)
+
+        # Call generic visit to visit the child nodes out of the chain
+        self.visit(value)
+
+    def add_import_name(self, name):
+        """Save a used name, the latest import of a name takes precedence."""
+        trie_node = self.import_trie
+        for part in name.split('.'):
+            trie_node = trie_node.setdefault(part, {})
+        self.import_count += 1
+        trie_node[None] = self.import_count
+
+    def add_attrs(self, parts):
+        """Add the attributes of all prefixes of a chain of names, like a.b.c and a.b for a.b.c."""
+
+        # latest[k-2]: (import order, j) of the latest used name parts[:j] for the prefix parts[:k], j < k
+        latest = []
+        current = None
+        trie_node = self.import_trie
+        for j in range(1, len(parts)):
+            if trie_node is not None:
+                trie_node = trie_node.get(parts[j-1])
+                if trie_node is not None and None in trie_node and (current is None or trie_node[None] > current[0]):
+                    current = (trie_node[None], j)
+            latest.append(current)
+
+        for k in range(len(parts), 1, -1):
+            if latest[k-2] is None:
+                continue
+
+            j = latest[k-2][1]
+            name = '.'.join(parts[:j])
+            # should add it to self.attrs
+            if name in self.mappings:
+                resource_parts = self.mappings[name].split('.') + parts[j:k]
+            else:
+                resource_parts = parts[:k]
+
+            # check if already exists: an attribute starts with resource_name.
+            trie_node = self.attr_trie
+            for part in resource_parts:
+                trie_node = trie_node.get(part)
+                if trie_node is None:
                     break
-        
-        # Call generic visit to visit all child nodes
-        self.generic_visit(node)
-    
+            if trie_node is not None and len(trie_node) > 0:
+                continue
 
-    def get_variable_name(self, node):
-        """Get full name of variable node(Name or Attribute)."""
+            self.attrs.add('.'.join(resource_parts))
+            trie_node = self.attr_trie
+            for part in resource_parts:
+                trie_node = trie_node.setdefault(part, {})
 
-        # Get type
-        t = type(node)
+    def get_variable_parts(self, node):
+        """Get the names of variable node(Name or Attribute), and the innermost value node.
+        Returns
+        -------
+        tuple
+            (['a', 'b', 'c'], Name node a) for a.b.c, (None, value node) if the chain doesn't start with a Name.
+        """
 
-        if t is ast.Name:
-            return node.id
-        elif t is ast.Attribute:
-            value = self.get_variable_name(node.value)
-            if value == '':
-                return value
-            else:
-                return '{}.{}'.format(value, node.attr)
-        else:
-            return ''
\ No newline at end of file
+        parts = []
+        while type(node) is ast.Attribute:
+            parts.append(node.attr)
+            node = node.value
+
+        if type(node) is not ast.Name:
+            return None, node
+
+        parts.append(node.id)
+        parts.reverse()
+        return parts, node
@@ -0,0 +1,142 @@
+import io
+import os
+import sys
+import copy
+import random
+import contextlib
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+from run import QueryApplication, RequireGraph
+from test_csv_transformer import write_data, build_kg
+
+
+PACKAGES = {
+    'app': {
+        '1.0': (True, ['lib>=2.0', 'legacy>=5.0'], ['app'], [], {}),
+        '2.0': (False, ['broken'], ['app'], [], {}),
+    },
+    'lib': {
+        '1.0': (True, ['unused'], ['lib'], [], {}),
+        '2.0': (True, ['base<2.0'], ['lib'], [], {}),
+        '3.0': (True, ['base>=2.0'], ['lib'], [], {}),
+    },
+    'base': {
+        '1.0': (True, [], ['base'], [], {}),
+        '2.0': (True, [], ['base'], [], {}),
+    },
+    'legacy': {
+        '1.0': (True, ['other'], ['legacy'], [], {}),
+        '2.0': (True, [], ['legacy'], [], {}),
+    },
+    'broken': {'1.0': (True, [], ['broken'], [], {})},
+    'unused': {'1.0': (True, [], ['unused'], [], {})},
+    'other': {'1.0': (True, [], ['other'], [], {})},
+}
+
+
+def random_packages(rng):
+    """Packages with random versions, install status and requirements on each other or on
+    versions out of the KG."""
+    n_packages = rng.randint(2, 7)
+    packages = {}
+    for i in range(n_packages):
+        packages['p{}'.format(i)] = {}
+        for v in range(rng.randint(1, 5)):
+            requires = ['p{}{}'.format(j, rng.choice(['', '>=1.0', '<2.0', '==0.0', '>=2.0', '!=1.0', '<1.0,>=0.0', '>=9.0']))
+                        for j in range(n_packages) if j != i and rng.random() < 0.3]
+            if rng.random() < 0.1:
+                requires.append('unknown')
+            packages['p{}'.format(i)]['{}.0'.format(v)] = (rng.random() < 0.8, requires, ['p{}'.format(i)], [], {})
+    return packages
+
+
+def random_candidates(rng, kg, packages):
+    """Module candidates of versions or of any version, and requirement hints."""
+    versions = {}
+    for name, nodes in kg.packages_by_names(list(packages)).items():
+        versions[name] = [node.id for node in kg.versions_by_packages([nodes[0].id])[nodes[0].id]]
+    candidates = {}
+    for m in range(rng.randint(1, 3)):
+        module = {}
+        for name in rng.sample(sorted(packages), rng.randint(1, 2)):
+            if rng.random() < 0.5:
+                module[name] = set()
+            else:
+                module[name] = set(rng.sample(versions[name], rng.randint(1, len(versions[name]))))
+        candidates['m{}'.format(m)] = module
+    if rng.random() < 0.3:
+        candidates['<requirement hint>'] = {rng.choice(sorted(packages)): rng.choice(['>=1.0', '<1.0', '>=9.0'])}
+    return candidates
+
+
+def subgraphs(kg, candidates):
+    requirements = QueryApplication._candidate_requirements(candidates)
+    packages = sorted(set(name for module in candidates.values() for name in module))
+    return kg.bounded_require_subgraph(list(requirements), page_size=2), kg.require_subgraph(packages)
+
+
+def edges(records):
+    return set((rel.start_node.id, rel.type, rel.end_node.id, rel.get('requirement')) for _, relationships in records for rel in relationships)
+
+
+def nodes(records):
+    return set(node.id for record in records for node in record[0])
+
+
+def solve(candidates, records):
+    with contextlib.redirect_stdout(io.StringIO()):
+        graph = RequireGraph(copy.deepcopy(candidates), records)
+        return graph.infer_install_pairs()
+
+
+@pytest.fixture(scope='module')
+def kg(tmp_path_factory):
+    work_dir = tmp_path_factory.mktemp('bounded_subgraph')
+    write_data(str(work_dir / 'data'), PACKAGES)
+    return build_kg(str(work_dir / 'data'), str(work_dir / 'kg'))
+
+
+def test_bounded_subgraph(kg):
+    ids = {}
+    for name, package_nodes in kg.packages_by_names(list(PACKAGES)).items():
+        ids[(name,)] = package_nodes[0].id
+        for node in kg.versions_by_packages([package_nodes[0].id])[package_nodes[0].id]:
+            ids[(name, node['version'])] = node.id
+    names = {node_id: key for key, node_id in ids.items()}
+    candidates = {'app': {'app': set()}}
+    bounded, full = subgraphs(kg, candidates)
+    assert nodes(bounded) <= nodes(full) and edges(bounded) <= edges(full)
+    assert sorted(names[node_id] for node_id in nodes(bounded)) == [
+        # app 2.0 failed to install, so broken is not read
+        ('app',), ('app', '1.0'), ('app', '2.0'), ('base',), ('base', '1.0'), ('base', '2.0'),
+        # no legacy version >=5.0, the newest one is kept without its requirements
+        ('legacy',), ('legacy', '2.0'),
+        # lib 1.0 is out of lib>=2.0
+        ('lib',), ('lib', '2.0'), ('lib', '3.0')]
+    assert ('broken',) in [names[node_id] for node_id in nodes(full)]
+
+    bounded_pairs, bounded_solution = solve(candidates, bounded)
+    full_pairs, full_solution = solve(candidates, full)
+    assert bounded_solution == full_solution
+    assert bounded_pairs == full_pairs
+
+
+@pytest.mark.parametrize('seed', range(100))
+def test_random_bounded_subgraph(tmp_path, seed):
+    rng = random.Random(seed)
+    packages = random_packages(rng)
+    write_data(str(tmp_path / 'data'), packages)
+    kg = build_kg(str(tmp_path / 'data'), str(tmp_path / 'kg'))
+    for _ in range(3):
+        candidates = random_candidates(rng, kg, packages)
+        bounded, full = subgraphs(kg, candidates)
+        assert nodes(bounded) <= nodes(full)
+        assert edges(bounded) <= edges(full)
+        bounded_pairs, bounded_solution = solve(candidates, bounded)
+        full_pairs, full_solution = solve(candidates, full)
+        assert bounded_solution == full_solution
+        if full_solution == 1:
+            # the heuristic algorithm
+            assert bounded_pairs == full_pairs
@@ -0,0 +1,175 @@
+import io
+import os
+import csv
+import sys
+import json
+import shutil
+import contextlib
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'build_KG'))
+from kg_store import EmbeddedKG
+from transfer_csv.knowledge2csv import CsvTransformer
+
+
+# {package: {version: (installed, requires, modules, import fails, attrs)}}, None for a version without data.json
+PACKAGES = {
+    'alpha': {
+        '1.0': (True, ['zeta>=1.0', 'missing-pkg<2.0,>=0.5', 'extra_pkg; python_version<"3"'],
+                ['alpha', 'alpha.core', 'alpha.core.utils'], ['alpha.broken'],
+                {'alpha': ['run', 'VERSION'], 'alpha.core': ['Engine'], 'alpha.core.utils': ['helper']}),
+        '2.0': (True, ['zeta', 'Missing_Pkg!=1.1'],
+                ['alpha', 'alpha.core'], [],
+                {'alpha': ['run', 'VERSION', 'stop'], 'alpha.core': ['Engine']}),
+        '3.0': (False, ['zeta>=1.0'], ['alpha'], [], {'alpha': ['run']}),
+    },
+    'zeta': {
+        '0.1': (True, [], ['zeta'], [], {'zeta': ['z']}),
+        '1.0': (True, ['alpha!=2.0', 'beta', 'other>=1.0'], ['zeta', 'zeta.io'], [], {'zeta': ['z'], 'zeta.io': ['read', 'write']}),
+    },
+    'beta': {
+        '1.0': None,
+    },
+}
+
+
+def write_data(data_dir, packages=PACKAGES):
+    """The installation data of packages, in the layout read by CsvTransformer.generate_csv."""
+    for package, versions in packages.items():
+        p_dir = os.path.join(data_dir, package)
+        os.makedirs(p_dir)
+        with open(os.path.join(p_dir, 'exit_status.json'), 'w') as f:
+            json.dump({}, f)
+        for version, data in versions.items():
+            v_dir = os.path.join(p_dir, version)
+            os.makedirs(v_dir)
+            if data is None:
+                with open(os.path.join(v_dir, 'LABEL'), 'w') as f:
+                    f.write('')
+                continue
+            installed, requires, modules, import_fails, attrs = data
+            if installed:
+                with open(os.path.join(v_dir, 'LABEL'), 'w') as f:
+                    f.write('')
+            with open(os.path.join(v_dir, 'data.json'), 'w') as f:
+                json.dump({'Requires': requires, 'Modules': modules, 'Attrs': attrs}, f)
+            with open(os.path.join(v_dir, 'import_fail.json'), 'w') as f:
+                json.dump({module: 'ImportError' for module in import_fails}, f)
+
+
+def build_kg(data_dir, csv_dir, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        transformer = CsvTransformer(csv_dir, '/neo4j', **kwargs)
+        transformer.generate_csv(data_dir)
+        transformer.close()
+        return EmbeddedKG(csv_dir)
+
+
+def node_key(node):
+    return (node.id, sorted(node.labels), sorted(node.properties.items()))
+
+
+def kg_answers(kg):
+    """The answers of every query of KGQueries, with edges in an order of their own."""
+    module_names = sorted(set(kg.strings[index] for index in kg.properties['Module']['name']))
+    package_names = sorted(set(kg.strings[index] for index in kg.properties['Package']['name'])) + ['nothing']
+    module_info = kg.module_info_by_names(module_names + ['nothing'])
+    module_ids = {name: [item[0] for item in module_info[name]] for name in module_names}
+    attrs = {name: {module_id: [] for module_id in ids} for name, ids in module_ids.items()}
+    kg.attributes_by_module_lists([(name, ids, module_names) for name, ids in module_ids.items()], attrs)
+    packages = kg.packages_by_names(package_names)
+    package_ids = [node.id for name in packages for node in packages[name]]
+    versions = kg.versions_by_packages(package_ids)
+    version_ids = [node.id for nodes in versions.values() for node in nodes]
+    return {
+        'counts': kg.counts,
+        'module_info': module_info,
+        'submodules': {key: sorted(value) for key, value in kg.submodules_by_modules([(name, hop) for name in module_names for hop in (1, 2)]).items()},
+        'submodule_ids': {key: sorted(value) for key, value in kg.submodules_by_module_ids([(tuple(ids), 3) for ids in module_ids.values()]).items()},
+        'attrs': {name: {module_id: sorted(value) for module_id, value in items.items()} for name, items in attrs.items()},
+        'packages_and_versions': kg.packages_and_versions_by_module_lists(module_ids),
+        'packages': {name: [node_key(node) for node in nodes] for name, nodes in packages.items()},
+        'versions': {package_id: [node_key(node) for node in nodes] for package_id, nodes in versions.items()},
+        'requires': {version_id: sorted((node_key(node), requirement) for node, requirement in items)
+                     for version_id, items in kg.requires_by_versions(version_ids).items()},
+        'require_subgraph': [(sorted(node_key(node) for node in nodes),
+                              sorted((rel.start_node.id, rel.type, rel.end_node.id, sorted(rel.properties.items())) for rel in rels))
+                             for nodes, rels in kg.require_subgraph(package_names)],
+        'bounded_require_subgraph': [(sorted(node_key(node) for node in nodes),
+                                      sorted((rel.start_node.id, rel.type, rel.end_node.id, sorted(rel.properties.items())) for rel in rels))
+                                     for nodes, rels in kg.bounded_require_subgraph([(name, '') for name in package_names], page_size=2)],
+    }
+
+
+def requires_rows(csv_dir):
+    with open(os.path.join(csv_dir, 'relationships', 'requires.csv'), newline='') as f:
+        return list(csv.reader(f))
+
+
+def quote_requires(csv_dir):
+    """Quote every string of requires.csv, like csv.writer with QUOTE_NONNUMERIC."""
+    rows = requires_rows(csv_dir)
+    with open(os.path.join(csv_dir, 'relationships', 'requires.csv'), 'w', newline='') as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_NONNUMERIC)
+        for vid, requirement, pid, label in rows:
+            writer.writerow((int(vid), requirement, int(pid), label))
+
+
+@pytest.fixture(scope='module')
+def kgs(tmp_path_factory):
+    work_dir = tmp_path_factory.mktemp('csv_transformer')
+    data_dir = str(work_dir / 'data')
+    write_data(data_dir)
+    ret = {
+        'legacy': build_kg(data_dir, str(work_dir / 'legacy')),
+        'streaming': build_kg(data_dir, str(work_dir / 'streaming'), streaming=True),
+        'gzip': build_kg(data_dir, str(work_dir / 'gzip'), streaming=True, compress=True),
+    }
+    shutil.copytree(str(work_dir / 'streaming'), str(work_dir / 'quoted'))
+    quote_requires(str(work_dir / 'quoted'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        ret['quoted'] = EmbeddedKG(str(work_dir / 'quoted'))
+    return ret
+
+
+@pytest.mark.parametrize('mode', ['streaming', 'gzip', 'quoted'])
+def test_same_kg_as_legacy(kgs, mode):
+    assert kg_answers(kgs[mode]) == kg_answers(kgs['legacy'])
+
+
+def test_streaming_requires(kgs):
+    rows = requires_rows(kgs['streaming'].csv_dir)
+    # requirements of packages read later are written after the ones resolved at once
+    assert [int(row[0]) for row in rows] != sorted(int(row[0]) for row in rows)
+    assert sorted(rows) == sorted(requires_rows(kgs['legacy'].csv_dir))
+    assert ['<2.0,>=0.5', 'REQUIRES'] in [[row[1], row[3]] for row in rows]
+    with open(os.path.join(kgs['quoted'].csv_dir, 'relationships', 'requires.csv')) as f:
+        assert '"REQUIRES"' in f.read()
+
+
+def test_requires_answers(kgs):
+    kg = kgs['streaming']
+    packages = {node.id: node['name'] for nodes in kg.packages_by_names(['alpha', 'zeta', 'beta', 'missing-pkg', 'other']).values() for node in nodes}
+    assert sorted(packages.values()) == ['alpha', 'beta', 'missing-pkg', 'other', 'zeta']
+    versions = {}
+    for package_id, nodes in kg.versions_by_packages(list(packages)).items():
+        for node in nodes:
+            versions[(packages[package_id], node['version'])] = (node.id, node['install_status'])
+    assert sorted(versions) == [('alpha', '1.0'), ('alpha', '2.0'), ('alpha', '3.0'), ('beta', '1.0'), ('zeta', '0.1'), ('zeta', '1.0')]
+    assert versions[('alpha', '3.0')][1] == 'Fail'
+    requires = kg.requires_by_versions([version_id for version_id, _ in versions.values()])
+    named = {key: sorted((node['name'], requirement) for node, requirement in requires[versions[key][0]]) for key in versions}
+    # the extra requirement is left out, names are canonicalized
+    assert named[('alpha', '1.0')] == [('missing-pkg', '<2.0,>=0.5'), ('zeta', '>=1.0')]
+    assert named[('alpha', '2.0')] == [('missing-pkg', '!=1.1'), ('zeta', '')]
+    assert named[('zeta', '1.0')] == [('alpha', '!=2.0'), ('beta', ''), ('other', '>=1.0')]
+    assert named[('beta', '1.0')] == []
+
+
+def test_no_temporary_files(kgs):
+    for mode in ('streaming', 'gzip'):
+        for root, _, files in os.walk(kgs[mode].csv_dir):
+            assert [name for name in files if name.endswith(('.part', '.sqlite'))] == []
+    assert os.path.exists(os.path.join(kgs['gzip'].csv_dir, 'relationships', 'requires.csv.gz'))
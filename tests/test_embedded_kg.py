@@ -0,0 +1,149 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+from test_csv_transformer import write_data, build_kg
+
+
+PACKAGES = {
+    'demo': {
+        '0.1': (False, [], ['demo'], [], {'demo': ['old']}),
+        '1.0': (True, ['helper>=1.0', 'ghost'], ['demo', 'demo.core', 'demo.core.utils'], ['demo.broken'],
+                {'demo': ['run'], 'demo.core': ['Engine'], 'demo.core.utils': ['helper_fn']}),
+        '2.0': (True, ['helper<3'], ['demo', 'demo.core', 'demo.core.utils'], ['demo.broken'],
+                {'demo': ['run'], 'demo.core': ['Engine'], 'demo.core.utils': ['helper_fn']}),
+    },
+    'helper': {
+        '1.0': (True, [], ['helper'], [], {'helper': ['run']}),
+        '2.0': (True, ['demo'], ['helper'], [], {'helper': ['run']}),
+    },
+}
+
+
+@pytest.fixture(scope='module')
+def kg(tmp_path_factory):
+    work_dir = tmp_path_factory.mktemp('embedded_kg')
+    write_data(str(work_dir / 'data'), PACKAGES)
+    return build_kg(str(work_dir / 'data'), str(work_dir / 'kg'))
+
+
+def version_names(kg):
+    """{version_id: (package, version)}"""
+    ret = {}
+    packages = kg.packages_by_names(['demo', 'helper'])
+    for name, nodes in packages.items():
+        for package_id, versions in kg.versions_by_packages([node.id for node in nodes]).items():
+            for node in versions:
+                ret[node.id] = (name, node['version'])
+    return ret
+
+
+def module_versions(kg, module_ids):
+    names = version_names(kg)
+    return {module_id: names[version_id] for module_id, version_id in zip(module_ids, [min(versions) for versions in
+            (kg.packages_and_versions_by_module_list([module_id])['demo'] for module_id in module_ids)])}
+
+
+def test_counts(kg):
+    # attribute 'run' of demo and helper is one node, the unknown requirement 'ghost' a package
+    assert kg.counts == {'Package': 3, 'Version': 5, 'Module': 11, 'Attribute': 4}
+
+
+def test_unique_ids(kg):
+    ids = []
+    for label in kg.labels:
+        ids.extend(kg.offsets[label] + index for index in range(kg.counts[label]))
+    assert sorted(ids) == list(range(sum(kg.counts.values())))
+    packages = [node.id for nodes in kg.packages_by_names(['demo', 'helper', 'ghost']).values() for node in nodes]
+    versions = list(version_names(kg))
+    modules = [item[0] for items in kg.module_info_by_names(['demo', 'demo.core', 'demo.core.utils', 'demo.broken', 'helper']).values() for item in items]
+    assert len(set(packages + versions + modules)) == 3 + 5 + 11
+
+
+def test_module_info(kg):
+    info = kg.module_info_by_name('demo')
+    versions = module_versions(kg, [item[0] for item in info])
+    assert sorted(versions.values()) == [('demo', '0.1'), ('demo', '1.0'), ('demo', '2.0')]
+    assert all(item[1] == 'True' for item in info)
+    hashes = {versions[item[0]][1]: item[2] for item in info}
+    # the same module tree in 1.0 and 2.0, requirements are not part of it
+    assert hashes['1.0'] == hashes['2.0'] != hashes['0.1']
+
+    info = kg.module_info_by_names(['demo.broken', 'demo.core', 'nothing'])
+    assert [item[1] for item in info['demo.broken']] == ['False', 'False']
+    assert len(info['demo.core']) == 2 and info['demo.core'][0][2] == info['demo.core'][1][2]
+    assert info['nothing'] == []
+    assert kg.module_info_by_name('nothing') == []
+
+
+def test_submodules(kg):
+    info = kg.module_info_by_name('demo')
+    versions = module_versions(kg, [item[0] for item in info])
+    by_version = lambda ret: sorted((versions[module_id][1], name) for module_id, name in ret)
+    # demo.broken failed to import
+    assert by_version(kg.submodules_by_module('demo', 1)) == [('1.0', 'demo.core'), ('2.0', 'demo.core')]
+    assert by_version(kg.submodules_by_module('demo', 2)) == [('1.0', 'demo.core'), ('1.0', 'demo.core.utils'),
+                                                              ('2.0', 'demo.core'), ('2.0', 'demo.core.utils')]
+    assert kg.submodules_by_module('demo', 0) == []
+    assert kg.submodules_by_module('nothing', 2) == []
+    module_ids = tuple(item[0] for item in info)
+    assert sorted(kg.submodules_by_module_ids([(module_ids, 2)])[(module_ids, 2)]) == sorted(kg.submodules_by_module('demo', 2))
+
+
+def test_attributes(kg):
+    info = kg.module_info_by_name('demo')
+    versions = module_versions(kg, [item[0] for item in info])
+    ret = {item[0]: [] for item in info}
+    kg.attributes_by_module_list([item[0] for item in info], ['demo', 'demo.core.utils'], ret)
+    assert {versions[module_id][1]: sorted(attrs) for module_id, attrs in ret.items()} == {
+        '0.1': ['demo.old'],
+        '1.0': ['demo.core.utils.helper_fn', 'demo.run'],
+        '2.0': ['demo.core.utils.helper_fn', 'demo.run'],
+    }
+    ret = {item[0]: [] for item in info}
+    kg.attributes_by_module_list([item[0] for item in info], ['demo.core'], ret)
+    assert sorted(attr for attrs in ret.values() for attr in attrs) == ['demo.core.Engine', 'demo.core.Engine']
+
+
+def test_packages_and_versions(kg):
+    names = version_names(kg)
+    module_ids = [item[0] for item in kg.module_info_by_name('demo')]
+    ret = kg.packages_and_versions_by_module_list(module_ids)
+    assert sorted(names[version_id] for version_id in ret['demo']) == [('demo', '0.1'), ('demo', '1.0'), ('demo', '2.0')]
+    # only top modules have versions
+    assert kg.packages_and_versions_by_module_list([item[0] for item in kg.module_info_by_name('demo.core')]) == {}
+    ret = kg.packages_and_versions_by_module_lists({'helper': [item[0] for item in kg.module_info_by_name('helper')], 'none': []})
+    assert sorted(names[version_id] for version_id in ret['helper']['helper']) == [('helper', '1.0'), ('helper', '2.0')]
+    assert ret['none'] == {}
+
+    package = kg.packages_by_names(['demo'])['demo'][0]
+    versions = kg.versions_by_packages([package.id])[package.id]
+    assert [(node['version'], node['install_status']) for node in versions] == [('0.1', 'Fail'), ('1.0', 'Success'), ('2.0', 'Success')]
+    assert kg.packages_by_names(['nothing']) == {}
+
+
+def test_require_subgraph(kg):
+    names = version_names(kg)
+    nodes, relationships = kg.require_subgraph(['demo'])[0]
+    node_names = lambda nodes: sorted(names[node.id] if 'Version' in node.labels else (node['name'],) for node in nodes)
+    assert node_names(nodes) == [('demo',), ('demo', '0.1'), ('demo', '1.0'), ('demo', '2.0'),
+                                 ('ghost',), ('helper',), ('helper', '1.0'), ('helper', '2.0')]
+    edge = lambda node: names[node.id] if 'Version' in node.labels else (node['name'],)
+    assert sorted((edge(rel.start_node), rel.type, edge(rel.end_node), rel.get('requirement')) for rel in relationships) == sorted([
+        (('demo',), 'HAS_VERSION', ('demo', '0.1'), None),
+        (('demo',), 'HAS_VERSION', ('demo', '1.0'), None),
+        (('demo',), 'HAS_VERSION', ('demo', '2.0'), None),
+        (('helper',), 'HAS_VERSION', ('helper', '1.0'), None),
+        (('helper',), 'HAS_VERSION', ('helper', '2.0'), None),
+        (('demo', '1.0'), 'REQUIRES', ('ghost',), ''),
+        (('demo', '1.0'), 'REQUIRES', ('helper',), '>=1.0'),
+        (('demo', '2.0'), 'REQUIRES', ('helper',), '<3'),
+        (('helper', '2.0'), 'REQUIRES', ('demo',), ''),
+    ])
+    # the requirement cycle leads back to the same nodes
+    assert node_names(kg.require_subgraph(['helper'])[0][0]) == node_names(nodes)
+    ghost_nodes, ghost_relationships = kg.require_subgraph(['ghost'])[0]
+    assert node_names(ghost_nodes) == [('ghost',)] and ghost_relationships == []
+    assert kg.require_subgraph(['nothing']) == []
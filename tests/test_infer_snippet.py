@@ -0,0 +1,32 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+from run import QueryApplication
+from service import InferenceService
+
+
+def test_unparseable_snippet(capsys):
+    querier = QueryApplication('inprocess', kg={}, cache=None)
+    try:
+        ret = querier.infer_snippet('x = (\n')
+        assert ret['python'] is None and ret['install_pairs'] is None
+        assert 'The snippet can not be parsed.' in capsys.readouterr().out
+
+        ret = InferenceService(querier).infer({'snippet': 'x = (\n'})
+        assert ret['python'] is None and ret['dockerfile'] is None
+    finally:
+        querier.close()
+
+
+def test_unparseable_snippet_file(tmp_path, capsys):
+    snippet_path = tmp_path / 'snippet.py'
+    snippet_path.write_text('def f(:\n')
+    querier = QueryApplication('inprocess', kg={}, cache=None)
+    try:
+        ret = querier.infer_CRE(str(snippet_path), str(tmp_path))
+        assert ret['python'] is None
+        assert '{} can not be parsed.'.format(snippet_path) in capsys.readouterr().out
+        assert not os.path.exists(tmp_path / 'Dockerfile')
+    finally:
+        querier.close()
@@ -0,0 +1,71 @@
+import os
+import sys
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+from run import QueryApplication, pvGraph
+
+
+def install_graph(edges, nodes, install=()):
+    """pvGraph of the packages nodes, in this order, with edges (package, required package)."""
+    graph = pvGraph()
+    for key in nodes:
+        graph.degree_table[key] = set()
+        graph.in_table[key] = set()
+        graph.node_dict[key] = (key, '1.0')
+    for key, pid in edges:
+        graph.degree_table[key].add(pid)
+        graph.in_table[pid].add(key)
+    graph.install_set.update(install)
+    return graph
+
+
+def baseline_order(graph):
+    """The former topo_sort: the first node without requirements in degree_table, repeatedly."""
+    degree_table = dict((key, set(value)) for key, value in graph.degree_table.items())
+    install_set = set(graph.install_set) | set(key for key, value in graph.in_table.items() if len(value) == 0)
+    order = []
+    while len(degree_table) > 0:
+        key = next(key for key, value in degree_table.items() if len(value) == 0)
+        if key in install_set:
+            order.append(graph.node_dict[key])
+        for in_node in graph.in_table[key]:
+            degree_table[in_node].discard(key)
+        degree_table.pop(key)
+    return order
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_acyclic_order(seed):
+    rng = random.Random(seed)
+    nodes = ['p{}'.format(i) for i in range(rng.randint(1, 12))]
+    rank = dict((key, rng.random()) for key in nodes)
+    # edges from a higher rank to a lower one only
+    edges = [(key, pid) for key in nodes for pid in nodes if rank[key] > rank[pid] and rng.random() < 0.3]
+    install = rng.sample(nodes, rng.randint(0, len(nodes)))
+    graph = install_graph(edges, rng.sample(nodes, len(nodes)), install)
+    expected = baseline_order(graph)
+    assert graph.topo_sort()
+    assert graph.install_pair == expected
+    assert graph.install_groups == [[item] for item in expected]
+
+
+def test_cycle_in_one_group():
+    # a and b require each other, and both require c; d requires a
+    graph = install_graph([('a', 'b'), ('b', 'a'), ('a', 'c'), ('b', 'c'), ('d', 'a')], ['d', 'b', 'a', 'c'], ['a', 'b', 'c'])
+    assert not graph.topo_sort()
+    assert graph.install_groups == [[('c', '1.0')], [('b', '1.0'), ('a', '1.0')], [('d', '1.0')]]
+    assert graph.install_pair == [('c', '1.0'), ('b', '1.0'), ('a', '1.0'), ('d', '1.0')]
+
+
+def test_grouped_dockerfile():
+    groups = [[('c', '1.0')], [('b', '1.0'), ('a', None)]]
+    text = QueryApplication.dockerfile_text('snippet.py', '3.8', groups)
+    assert ('RUN pip install --no-cache-dir --upgrade pip\n'
+            'RUN pip install --no-cache-dir c==1.0\n'
+            'RUN pip install --no-cache-dir b==1.0 a\n\n'
+            'COPY snippet.py /snippets/snippet.py\n') in text
+    assert 'requirements.txt' not in text
+    assert 'RUN pip install -r /requirements.txt\n' in QueryApplication.dockerfile_text('snippet.py', '3.8')
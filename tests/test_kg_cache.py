@@ -0,0 +1,48 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+from run import QueryApplication
+from kg_cache import KGCache
+from kg_store import KGStore
+
+
+class DumpKG(KGStore):
+    def __init__(self, dump_identity):
+        self.dump_identity = dump_identity
+
+    def identity(self):
+        return self.dump_identity
+
+
+def lookup(cache_path, kg, kg_identity=None):
+    loaded = []
+    def loader(keys):
+        loaded.extend(keys)
+        return {key: key.upper() for key in keys}
+
+    querier = QueryApplication(parser=object(), kg={'Python3': kg}, cache=KGCache(disk_path=cache_path), kg_identity=kg_identity)
+    try:
+        assert querier._lookup('Python3', 'module', ['a', 'b'], loader) == {'a': 'A', 'b': 'B'}
+        assert querier._lookup('Python3', 'module', ['a'], loader) == {'a': 'A'}
+    finally:
+        querier.cache.close()
+    return loaded
+
+
+def test_kg_without_identity_is_not_persistent(tmp_path):
+    cache_path = str(tmp_path / 'cache.sqlite')
+    # cached in memory, never shared through the sqlite file
+    assert lookup(cache_path, DumpKG(None)) == ['a', 'b']
+    assert lookup(cache_path, DumpKG(None)) == ['a', 'b']
+    # an explicit identity of the dump is kept in the sqlite file
+    assert lookup(cache_path, DumpKG(None), {'Python3': 'dump-1'}) == ['a', 'b']
+    assert lookup(cache_path, DumpKG(None), {'Python3': 'dump-1'}) == []
+    assert lookup(cache_path, DumpKG(None), {'Python3': 'dump-2'}) == ['a', 'b']
+
+
+def test_kg_with_identity_is_persistent(tmp_path):
+    cache_path = str(tmp_path / 'cache.sqlite')
+    assert lookup(cache_path, DumpKG('csv-1')) == ['a', 'b']
+    assert lookup(cache_path, DumpKG('csv-1')) == []
+    assert lookup(cache_path, DumpKG('csv-2')) == ['a', 'b']
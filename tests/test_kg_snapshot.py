@@ -0,0 +1,105 @@
+import io
+import os
+import sys
+import shutil
+import contextlib
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+from kg_store import EmbeddedKG, create_kg_stores
+from kg_snapshot import HEADER, MAGIC, FORMAT_VERSION, SNAPSHOT_FILE, SnapshotKG, write_snapshot, validate_snapshot
+from test_csv_transformer import write_data, build_kg, kg_answers
+
+
+@pytest.fixture(scope='module')
+def csv_kg(tmp_path_factory):
+    work_dir = tmp_path_factory.mktemp('kg_snapshot')
+    write_data(str(work_dir / 'data'))
+    csv_kg = build_kg(str(work_dir / 'data'), str(work_dir / 'csv'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        write_snapshot(csv_kg, os.path.join(csv_kg.csv_dir, SNAPSHOT_FILE))
+    return csv_kg
+
+
+def open_snapshot(path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return SnapshotKG(path)
+
+
+def test_round_trip(csv_kg):
+    path = os.path.join(csv_kg.csv_dir, SNAPSHOT_FILE)
+    snapshot = open_snapshot(path)
+    try:
+        assert kg_answers(snapshot) == kg_answers(csv_kg)
+        assert snapshot.identity() == EmbeddedKG.csv_identity(csv_kg.csv_dir)
+    finally:
+        snapshot.close()
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert validate_snapshot(path, csv_kg.csv_dir) == []
+    assert not os.path.exists('{}.tmp'.format(path))
+
+
+def broken_snapshot(csv_kg, tmp_path, change):
+    with open(os.path.join(csv_kg.csv_dir, SNAPSHOT_FILE), 'rb') as f:
+        data = f.read()
+    path = str(tmp_path / SNAPSHOT_FILE)
+    with open(path, 'wb') as f:
+        f.write(change(data))
+    return path
+
+
+@pytest.mark.parametrize('size', [0, HEADER.size - 1, HEADER.size, 0.5, -8])
+def test_truncated(csv_kg, tmp_path, size):
+    path = broken_snapshot(csv_kg, tmp_path, lambda data: data[:int(len(data) * size) if isinstance(size, float) else size])
+    errors = validate_snapshot(path)
+    assert len(errors) == 1 and errors[0].startswith('Can\'t open')
+
+
+@pytest.mark.parametrize('header, message', [
+    (HEADER.pack(b'PYCREKG\x01', FORMAT_VERSION, 0, 0)[:12], 'bad magic'),
+    (HEADER.pack(MAGIC, FORMAT_VERSION + 1, 0, 0)[:12], 'format version'),
+])
+def test_bad_header(csv_kg, tmp_path, header, message):
+    path = broken_snapshot(csv_kg, tmp_path, lambda data: header + data[len(header):])
+    errors = validate_snapshot(path)
+    assert len(errors) == 1 and message in errors[0]
+
+
+def test_other_csv_files(csv_kg, tmp_path):
+    # a valid snapshot of another KG
+    other_dir = str(tmp_path / 'other')
+    shutil.copytree(csv_kg.csv_dir, other_dir)
+    with open(os.path.join(other_dir, 'nodes', 'attributes.csv'), 'a') as f:
+        f.write('{},added,Attribute\n'.format(csv_kg.counts['Attribute']))
+    with contextlib.redirect_stdout(io.StringIO()):
+        errors = validate_snapshot(os.path.join(csv_kg.csv_dir, SNAPSHOT_FILE), other_dir)
+    assert len(errors) == 1 and errors[0].startswith('counts')
+
+
+def test_create_kg_stores(csv_kg, tmp_path):
+    kg_dir = str(tmp_path / 'kg')
+    for py_version in ('Python2', 'Python3'):
+        shutil.copytree(csv_kg.csv_dir, os.path.join(kg_dir, py_version, 'csv-data'))
+        csv_dir = os.path.join(kg_dir, py_version, 'csv-data')
+        with contextlib.redirect_stdout(io.StringIO()):
+            write_snapshot(EmbeddedKG(csv_dir), os.path.join(csv_dir, SNAPSHOT_FILE))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        stores = create_kg_stores(kg_dir)
+    assert all(isinstance(stores[py_version], SnapshotKG) for py_version in ('Python2', 'Python3'))
+    assert stores['Python3'].counts == csv_kg.counts
+    for store in stores.values():
+        store.close()
+
+    # the CSV files changed after the snapshot was built
+    with open(os.path.join(kg_dir, 'Python3', 'csv-data', 'nodes', 'attributes.csv'), 'a') as f:
+        f.write('{},added,Attribute\n'.format(csv_kg.counts['Attribute']))
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        stores = create_kg_stores(kg_dir)
+    assert isinstance(stores['Python2'], SnapshotKG)
+    assert type(stores['Python3']) is EmbeddedKG
+    assert stores['Python3'].counts['Attribute'] == csv_kg.counts['Attribute'] + 1
+    assert 'is older than the CSV files' in output.getvalue()
+    stores['Python2'].close()
@@ -0,0 +1,160 @@
+import io
+import os
+import csv
+import sys
+import random
+import shutil
+import contextlib
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'build_KG'))
+from kg_store import EmbeddedKG
+from run import QueryApplication
+from name_prefixes import NamePrefixes
+from transfer_csv.knowledge2csv import CsvTransformer, tree_hash
+from test_csv_transformer import write_data
+
+
+class BaselineTransformer(CsvTransformer):
+    """The former module writing: Module nodes of every module of every version."""
+    def _write_modules(self, module_rows, node_module, node_attr, rel_version2module, rel_module2module, rel_attr):
+        ids = []
+        submodules = {}     # {module_id: [module_id]}
+        for module, import_status, attrs, parent in module_rows:
+            ids.append(self.module_id)
+            if parent is None:
+                rel_version2module.writerow((self.version_id, self.module_id, self.label_hasModule))
+            else:
+                rel_module2module.writerow((ids[parent], self.module_id, self.label_hasModule))
+                submodules.setdefault(ids[parent], []).append(self.module_id)
+            for attr in attrs:
+                if attr not in self.attributeInfo_dict:
+                    self.attributeInfo_dict[attr] = self.attribute_id
+                    node_attr.writerow((self.attribute_id, attr, self.label_attribute))
+                    self.attribute_id += 1
+                rel_attr.writerow((self.module_id, self.attributeInfo_dict[attr], self.label_hasAttribute))
+            self.module_id += 1
+
+        hashes = {}
+        for module_id, (module, import_status, attrs, _) in reversed(list(zip(ids, module_rows))):
+            hashes[module_id] = tree_hash(module, import_status, attrs, [hashes[item] for item in submodules.get(module_id, [])])
+        for module_id, (module, import_status, _, _) in zip(ids, module_rows):
+            node_module.writerow((module_id, module, import_status, hashes[module_id], self.label_module))
+
+
+def random_packages(rng, n_versions, n_trees):
+    """Packages 'top' and 'other' whose versions share a few module trees, with failed
+    imports and modules without their parent module."""
+    names = ['top'] + ['top.m{}'.format(i) for i in range(4)]
+    while len(names) < 20:
+        names.append('{}.s{}'.format(rng.choice(names), len(names)))
+    trees = []
+    for _ in range(n_trees):
+        modules = sorted(set(['top'] + rng.sample(names[1:], 8)), key=lambda x: len(x.split('.')))
+        import_fails = [module for module in modules[1:] if rng.random() < 0.1]
+        modules = [module for module in modules if module not in import_fails]
+        attrs = {module: ['f{}'.format(i) for i in rng.sample(range(10), 3)] for module in modules}
+        trees.append((modules, import_fails, attrs))
+
+    packages = {'top': {}, 'other': {}}
+    for v in range(n_versions):
+        modules, import_fails, attrs = rng.choice(trees)
+        packages['top']['{}.{}'.format(v // 10, v % 10)] = (True, ['other'], modules, import_fails, attrs)
+        # another package with the same top module
+        modules, import_fails, attrs = rng.choice(trees)
+        packages['other']['{}.{}'.format(v // 10, v % 10)] = (rng.random() < 0.8, [], modules, import_fails, attrs)
+    return packages, names
+
+
+def build(data_dir, csv_dir, transformer=CsvTransformer, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        transformer(csv_dir, '/neo4j', **kwargs).generate_csv(data_dir)
+
+
+def drop_tree_hashes(csv_dir):
+    """The KG of the CSV files before the tree_hash column."""
+    path = os.path.join(csv_dir, 'nodes', 'modules.csv')
+    with open(path, 'r', newline='') as f:
+        rows = list(csv.reader(f))
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows(row[:3] + row[4:] for row in rows)
+    with open(os.path.join(csv_dir, 'nodes', 'modules_header.csv'), 'w') as f:
+        f.write(':ID(Module-ID),name,import_status,:LABEL')
+
+
+def csv_files(csv_dir):
+    ret = {}
+    for root, _, names in os.walk(csv_dir):
+        for name in names:
+            with open(os.path.join(root, name), 'rb') as f:
+                ret[os.path.relpath(os.path.join(root, name), csv_dir)] = f.read()
+    return ret
+
+
+@pytest.fixture(scope='module', params=range(3))
+def dataset(request, tmp_path_factory):
+    rng = random.Random(request.param)
+    work_dir = tmp_path_factory.mktemp('module_trees')
+    data_dir = str(work_dir / 'data')
+    packages, names = random_packages(rng, 30, 4)
+    write_data(data_dir, packages)
+    csv_dirs = {mode: str(work_dir / mode) for mode in ('baseline', 'full', 'dedup', 'no_hash')}
+    build(data_dir, csv_dirs['baseline'], BaselineTransformer)
+    build(data_dir, csv_dirs['full'])
+    build(data_dir, csv_dirs['dedup'], dedup_modules=True)
+    shutil.copytree(csv_dirs['full'], csv_dirs['no_hash'])
+    drop_tree_hashes(csv_dirs['no_hash'])
+    return rng, names, csv_dirs
+
+
+def test_tree_hashes(dataset):
+    _, _, csv_dirs = dataset
+    with contextlib.redirect_stdout(io.StringIO()):
+        kg = EmbeddedKG(csv_dirs['full'])
+    # 60 versions of 4 module trees
+    info = kg.module_info_by_name('top')
+    assert len(info) == 60
+    assert len(set(item[2] for item in info)) <= 4
+
+
+def test_default_csv_as_baseline(dataset):
+    _, _, csv_dirs = dataset
+    assert csv_files(csv_dirs['full']) == csv_files(csv_dirs['baseline'])
+
+
+def test_dedup_module_nodes(dataset):
+    _, _, csv_dirs = dataset
+    with contextlib.redirect_stdout(io.StringIO()):
+        full = EmbeddedKG(csv_dirs['full'])
+        dedup = EmbeddedKG(csv_dirs['dedup'])
+    assert dedup.counts['Module'] < full.counts['Module']
+    assert {key: value for key, value in dedup.counts.items() if key != 'Module'} == {key: value for key, value in full.counts.items() if key != 'Module'}
+    # one module per (name, tree hash)
+    info = dedup.module_info_by_name('top')
+    assert len(info) == len(set(item[2] for item in info))
+    assert set(item[2] for item in info) == set(item[2] for item in full.module_info_by_name('top'))
+
+
+@pytest.mark.parametrize('batched', [False, True])
+def test_same_matches(dataset, batched):
+    rng, names, csv_dirs = dataset
+    with contextlib.redirect_stdout(io.StringIO()):
+        kgs = {mode: EmbeddedKG(csv_dirs[mode]) for mode in ('full', 'dedup', 'no_hash')}
+    assert kgs['no_hash'].module_info_by_name('top')[0][2] is None
+    for _ in range(5):
+        modules = rng.sample(names, 4)
+        attrs = ['{}.f{}'.format(rng.choice(names), rng.randrange(12)) for _ in range(8)]
+        forest = {'top': {'modules': modules, 'attrs': attrs, 'max_hop': max(len(item.split('.')) for item in modules + attrs) - 1},
+                  'missing': {'modules': ['missing'], 'attrs': [], 'max_hop': 0}}
+        results = {}
+        for mode, kg in kgs.items():
+            querier = QueryApplication(parser=object(), kg={'Python3': kg}, cache=None)
+            info = {'module_score': 0, 'attr_score': 0}
+            match = querier._match_forest_batched if batched else querier._match_forest
+            with contextlib.redirect_stdout(io.StringIO()):
+                candidates = match('Python3', forest, NamePrefixes(attrs), info)
+            results[mode] = (candidates, info)
+        assert results['dedup'] == results['full']
+        assert results['no_hash'] == results['full']
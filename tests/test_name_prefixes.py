@@ -0,0 +1,58 @@
+import os
+import sys
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+from name_prefixes import NamePrefixes
+
+
+def baseline_match_degree(tree_set, name_set):
+    """The former _calculate_match_degree, slicing the names for each tree."""
+    if len(tree_set) == 0 or len(name_set) == 0:
+        return 0.0
+
+    ret = 0.0
+    for name in name_set:
+        if name in tree_set:
+            ret += 1
+        else:
+            split_info = name.split('.')
+            length = len(split_info)
+            prefix_name = name
+            i = 1
+            while i < length:
+                prefix_name = prefix_name[:-(len(split_info[-i])+1)]
+                if prefix_name in tree_set:
+                    break
+                i += 1
+            ret += 1 - i/length
+    return ret
+
+
+def random_names(rng, count):
+    return ['.'.join(rng.choice('abc') for _ in range(rng.randint(1, 5))) for _ in range(count)]
+
+
+def tree_of(rng, names):
+    """The prefixes of some names, and unrelated modules."""
+    tree = set()
+    for name in rng.sample(names, rng.randint(0, len(names))):
+        parts = name.split('.')
+        for i in range(1, rng.randint(1, len(parts)) + 1):
+            tree.add('.'.join(parts[:i]))
+    tree.update(random_names(rng, rng.randint(0, 3)))
+    return tree
+
+
+@pytest.mark.parametrize('seed', range(100))
+def test_match_degree_as_baseline(seed):
+    rng = random.Random(seed)
+    names = random_names(rng, rng.randint(0, 8))
+    prefixes = NamePrefixes(names)
+    for _ in range(5):
+        tree = tree_of(rng, names) if len(names) > 0 else set(random_names(rng, 2))
+        # scored again from the cache of the same prefixes
+        for _ in range(2):
+            assert prefixes.match_degree(tree) == pytest.approx(baseline_match_degree(tree, names))
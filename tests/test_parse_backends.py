@@ -0,0 +1,52 @@
+import os
+import sys
+import warnings
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+from parse_backends import Lib2to3Backend
+
+
+@pytest.fixture(scope='module')
+def lib2to3_backend():
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        try:
+            return Lib2to3Backend()
+        except ImportError:
+            pytest.skip('lib2to3 is removed in this Python version')
+
+
+@pytest.mark.parametrize('source', [
+    'import numpy\nx = f"{numpy.pi}"\n',
+    'import numpy\nx = rb"a" + Rf"{numpy}"\n',
+    'async def f():\n    await g()\n',
+    'import numpy\nif (n := numpy.pi):\n    pass\n',
+    'x: int = 1\n',
+    'def f(a: int):\n    pass\n',
+    'def f(a) -> int:\n    pass\n',
+    'def f(a, *, b):\n    pass\n',
+    'def f():\n    yield from g()\n',
+    'def f():\n    x = 1\n    def g():\n        nonlocal x\n',
+    'a, *b = c\n',
+    'raise ValueError() from e\n',
+    'x = a @ b\n',
+    'print("a", end="")\n',
+])
+def test_python3_only_syntax(lib2to3_backend, source, capsys):
+    assert lib2to3_backend.parse(source) is None
+    assert 'can\'t be parsed by Python 2 grammar' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('source', [
+    'import numpy\nprint numpy.pi\n',
+    'import numpy\nexec "x = 1"\nx = 0777 + 10L\n',
+    'import numpy\ntry:\n    numpy.pi\nexcept ValueError, e:\n    print `e`\n',
+    'import numpy\nx = b"a" + u"b" + "{}".format(numpy.pi)\n',
+    'import numpy\n@numpy.vectorize\ndef f((a, b)):\n    raise ValueError, "c"\n',
+    'import numpy\ndef f(*args, **kwargs):\n    yield numpy.pi\n',
+])
+def test_python2_syntax(lib2to3_backend, source):
+    ret = lib2to3_backend.parse(source)
+    assert ret is not None and ret['imports'] == ['numpy']
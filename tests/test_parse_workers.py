@@ -0,0 +1,171 @@
+import io
+import os
+import sys
+import json
+import time
+import subprocess
+import contextlib
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+from parse_backends import PARSER_DIR, ParseWorker, WorkerPoolBackend, worker_command
+from run import QueryApplication, infer_batch, parser_interpreters
+from test_service import PACKAGES
+from test_csv_transformer import write_data, build_kg
+
+
+SERVE_COMMAND = worker_command(interpreter=sys.executable)
+
+# answers the request after other output and the responses of other requests
+NOISY_WORKER = '''
+import sys, json
+for line in sys.stdin:
+    request = json.loads(line)
+    print('loading parser ...')
+    print(json.dumps({'id': request['id'] + 1, 'result': {'imports': ['other']}}))
+    print(json.dumps([request['id']]))
+    print(json.dumps({'id': request['id'], 'result': {'imports': ['numpy'], 'resources': [], 'attrs': []}}))
+    sys.stdout.flush()
+'''
+
+# never answers a warm request, but answers once its stdin is closed (a one-shot parse)
+HANGING_WORKER = '''
+import sys, json
+request = json.loads(sys.stdin.readline())
+sys.stdin.read()
+print(json.dumps({'id': request['id'], 'result': {'imports': ['numpy'], 'resources': [], 'attrs': []}}))
+'''
+
+EXITING_WORKER = '''
+import sys
+sys.stdin.readline()
+sys.exit(3)
+'''
+
+
+def stub_command(tmp_path, source):
+    path = tmp_path / 'worker.py'
+    path.write_text(source)
+    return [sys.executable, str(path)]
+
+
+def test_serve_protocol():
+    requests = [{'id': 7, 'source': 'import numpy\nnumpy.pi\n'}, {'id': 8, 'source': 'x = (\n'}, {'source': 'import os\n'}]
+    output = subprocess.run(SERVE_COMMAND, input=json.dumps(requests[0]) + '\n\n' + '\n'.join(json.dumps(item) for item in requests[1:]) + '\n',
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=60).stdout
+    # one response per request in order, and nothing else on stdout
+    responses = [json.loads(line) for line in output.splitlines()]
+    assert [item['id'] for item in responses] == [7, 8, None]
+    assert responses[0]['result']['imports'] == ['numpy'] and 'numpy.pi' in responses[0]['result']['attrs']
+    assert responses[1]['result'] is None
+    assert responses[2]['result']['imports'] == []
+
+
+def test_parse_worker():
+    worker = ParseWorker(SERVE_COMMAND)
+    try:
+        worker.start()
+        process = worker.process
+        assert worker.request('import numpy\nnumpy.array\n')['imports'] == ['numpy']
+        assert worker.request('x = (\n') is None
+        # the same warm process
+        assert worker.process is process
+        assert worker.request_once('import numpy\n')['imports'] == ['numpy']
+    finally:
+        worker.close()
+    assert process.poll() == 0
+
+
+def test_noisy_worker(tmp_path, capsys):
+    worker = ParseWorker(stub_command(tmp_path, NOISY_WORKER), timeout=30)
+    try:
+        assert worker.request('import numpy\n')['imports'] == ['numpy']
+        assert worker.request('import numpy\n')['imports'] == ['numpy']
+    finally:
+        worker.close()
+    out = capsys.readouterr().out
+    assert out.count('Unexpected output of parse worker: loading parser ...') == 2
+    assert 'Unexpected output of parse worker: [1]' in out
+
+
+def test_worker_timeout(tmp_path):
+    worker = ParseWorker(stub_command(tmp_path, HANGING_WORKER), timeout=1)
+    worker.start()
+    process = worker.process
+    stime = time.time()
+    with pytest.raises(RuntimeError, match='timed out after 1s'):
+        worker.request('import numpy\n')
+    assert time.time() - stime < 10
+    # killed
+    assert worker.process is None and process.poll() is not None
+    assert worker.request_once('import numpy\n')['imports'] == ['numpy']
+    worker.close()
+
+
+def test_pool_one_shot_fallback(tmp_path, capsys):
+    backend = WorkerPoolBackend(stub_command(tmp_path, HANGING_WORKER), 'stub', workers=2, timeout=1)
+    try:
+        assert backend.parse('import numpy\n')['imports'] == ['numpy']
+        out = capsys.readouterr().out
+        assert 'Restart parse worker: Parse worker timed out after 1s' in out
+        # the killed worker is started again by its next request
+        assert backend.parse('import numpy\n')['imports'] == ['numpy']
+    finally:
+        backend.close()
+
+
+def test_pool_failed_worker(tmp_path, capsys):
+    backend = WorkerPoolBackend(stub_command(tmp_path, EXITING_WORKER), 'stub', timeout=5)
+    try:
+        assert backend.parse('import numpy\n') is None
+        out = capsys.readouterr().out
+        assert 'Restart parse worker: Parse worker exited with code 3' in out
+        assert 'One-shot parse failed: No response of one-shot parse' in out
+        assert 'The snippet can\'t be parsed by stub.' in out
+    finally:
+        backend.close()
+
+
+def test_parser_interpreters():
+    assert parser_interpreters([]) == {}
+    assert parser_interpreters(['', '/usr/bin/python3']) == {'Python3': '/usr/bin/python3'}
+    assert parser_interpreters(['/usr/bin/python2', '/usr/bin/python3']) == {'Python2': '/usr/bin/python2', 'Python3': '/usr/bin/python3'}
+
+
+def test_query_application_workers():
+    with contextlib.redirect_stdout(io.StringIO()):
+        querier = QueryApplication('pool', kg={}, cache=None, parser_workers=2,
+                                   parser_interpreters={'Python2': sys.executable, 'Python3': sys.executable})
+    try:
+        for py_version in ('Python2', 'Python3'):
+            backend = querier.parser.backends[py_version]
+            assert isinstance(backend, WorkerPoolBackend) and len(backend.workers) == 2
+            assert all(worker.command == [sys.executable, os.path.join(PARSER_DIR, 'parse.py'), '--serve'] for worker in backend.workers)
+        with contextlib.redirect_stdout(io.StringIO()):
+            ret = querier.parser.parse_source('import numpy\n')
+        assert ret['Python2']['imports'] == ret['Python3']['imports'] == ['numpy']
+    finally:
+        querier.close()
+
+
+def test_batch_parse_workers(tmp_path):
+    write_data(str(tmp_path / 'data'), PACKAGES)
+    for py_version in ('Python2', 'Python3'):
+        os.makedirs(str(tmp_path / 'kg' / py_version))
+        build_kg(str(tmp_path / 'data'), str(tmp_path / 'kg' / py_version / 'csv-data'))
+    dataset = tmp_path / 'snippets'
+    dataset.mkdir()
+    (dataset / 'stop.py').write_text('import fakepkg\nfakepkg.core.stop()\n')
+    (dataset / 'run.py').write_text('import fakepkg\nfakepkg.core.run()\n')
+
+    results_dir = str(tmp_path / 'results')
+    with contextlib.redirect_stdout(io.StringIO()):
+        infer_batch(str(dataset), results_dir, 1, 'pool', str(tmp_path / 'kg'), 2, {'Python2': sys.executable, 'Python3': sys.executable})
+    with open(os.path.join(results_dir, 'results.jsonl')) as f:
+        records = {record['id']: record for record in map(json.loads, f)}
+    assert sorted(records) == ['run', 'stop']
+    assert all('error' not in record for record in records.values())
+    assert records['stop']['result']['install_pairs'] == [['fakepkg', '2.0']]
+    with open(os.path.join(results_dir, 'stop', 'infer.log')) as f:
+        assert 'Python3 ({})'.format(sys.executable) in f.read()
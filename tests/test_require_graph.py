@@ -0,0 +1,106 @@
+import io
+import os
+import sys
+import copy
+import random
+import contextlib
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+from run import RequireGraph, subGraph
+from kg_records import KGNode, KGRelationship
+
+
+SPECIFIERS = ['', '>=1.0', '<2.0', '==0.0', '>=2.0', '!=1.0', '<1.0,>=0.0']
+
+
+def random_graph(seed):
+    """Candidates and require subgraph of a few packages with random versions, install status
+    and requirements, some modules with candidate versions and an unknown package."""
+    rng = random.Random(seed)
+    nodes = []
+    relationships = []
+    packages = []
+    versions = []
+    for i in range(rng.randint(2, 7)):
+        package = KGNode(len(nodes), ['Package'], {'name': 'p{}'.format(i)})
+        nodes.append(package)
+        packages.append(package)
+        versions.append([])
+        for v in range(rng.randint(1, 5)):
+            status = rng.choice(['Success', 'Success', 'Unknown', 'Fail'])
+            version = KGNode(len(nodes), ['Version'], {'version': '{}.0'.format(v), 'install_status': status})
+            nodes.append(version)
+            versions[i].append(version)
+            relationships.append(KGRelationship(package, version, 'HAS_VERSION', {}))
+    for i in range(len(packages)):
+        for version in versions[i]:
+            for j in range(len(packages)):
+                if j != i and rng.random() < 0.3:
+                    relationships.append(KGRelationship(version, packages[j], 'REQUIRES', {'requirement': rng.choice(SPECIFIERS)}))
+
+    candidates = {}
+    for m in range(rng.randint(1, 3)):
+        module = {}
+        for j in rng.sample(range(len(packages)), rng.randint(1, 2)):
+            if rng.random() < 0.5:
+                module['p{}'.format(j)] = set()
+            else:
+                module['p{}'.format(j)] = set(item.id for item in rng.sample(versions[j], rng.randint(1, len(versions[j]))))
+        if rng.random() < 0.1:
+            module['unknown'] = set()
+        candidates['m{}'.format(m)] = module
+    return candidates, [[nodes, relationships]]
+
+
+def solve(seed, **kwargs):
+    candidates, requires_info = random_graph(seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        graph = RequireGraph(copy.deepcopy(candidates), requires_info, **kwargs)
+        return graph.infer_install_pairs()
+
+
+def solve_unpruned(seed):
+    return solve(seed, preprocess=False)
+
+
+@pytest.mark.parametrize('seed', list(range(150)) + [271, 586, 688, 743])
+def test_preprocess_keeps_results(seed):
+    install_pairs, has_solution = solve_unpruned(seed)
+    for kwargs in ({}, {'incremental_sat': True}, {'optimize_sat': True}):
+        pruned_pairs, pruned_solution = solve(seed, preprocess=True, **kwargs)
+        assert pruned_solution == has_solution
+        if has_solution != 0:
+            # the heuristic algorithm on the unpruned tables, or the best versions without solution
+            assert pruned_pairs == install_pairs
+
+
+@pytest.mark.parametrize('seed', list(range(150)) + [187, 392])
+def test_conflict_learning_keeps_results(seed):
+    install_pairs, has_solution = solve_unpruned(seed)
+    for kwargs in ({'learn_conflicts': True}, {'learn_conflicts': True, 'backjump': True}, {'backjump': True}):
+        learned_pairs, learned_solution = solve(seed, **kwargs)
+        assert learned_solution == has_solution
+        if has_solution != 0:
+            assert learned_pairs == install_pairs
+
+
+def test_subgraph_default_tables():
+    graph = subGraph()
+    graph.add_node(1)
+    graph.add_node(2)
+    graph.add_edge(1, 2)
+    assert subGraph().degree_table == {} and subGraph().in_table == {}
+
+
+@pytest.mark.parametrize('seed, loops', [(187, True), (236, True), (392, False)])
+def test_heuristic_failure_turns_to_sat(seed, loops):
+    # the heuristic algorithm replaces versions in a requirement cycle without end on 187 and 236,
+    # and reports a conflict under a deleted version on 392
+    candidates, requires_info = random_graph(seed)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        install_pairs, has_solution = RequireGraph(candidates, requires_info).infer_install_pairs()
+    assert has_solution == 0 and len(install_pairs) > 0
+    assert ('does not terminate' in output.getvalue()) == loops
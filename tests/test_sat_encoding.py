@@ -0,0 +1,118 @@
+import io
+import os
+import sys
+import random
+import itertools
+import contextlib
+
+import pytest
+import pycryptosat
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+from run import RequireGraph, VERSION_TYPE
+from kg_records import KGNode, KGRelationship
+from sat_encoding import AMO_ENCODINGS, VariableMap, at_most_one, weighted_sum, at_most_value
+
+
+def solver_of(clauses, literals=()):
+    solver = pycryptosat.Solver()
+    for clause in clauses:
+        solver.add_clause(clause)
+    # the solver takes assumptions on the variables of its clauses only
+    for literal in literals:
+        solver.add_clause([literal, -literal])
+    return solver
+
+
+def assignments(literals):
+    """Assumptions of every assignment of the literals."""
+    for values in itertools.product([False, True], repeat=len(literals)):
+        yield values, [literal if value else -literal for literal, value in zip(literals, values)]
+
+
+@pytest.mark.parametrize('encoding', ['auto'] + sorted(AMO_ENCODINGS))
+@pytest.mark.parametrize('n', range(1, 9))
+def test_at_most_one_models(encoding, n):
+    variables = VariableMap(range(n))
+    literals = [variables.var(item) for item in range(n)]
+    solver = solver_of(at_most_one(literals, variables.new_var, encoding), literals)
+    for values, assumptions in assignments(literals):
+        sat, _ = solver.solve(assumptions)
+        assert sat == (sum(values) <= 1)
+
+
+def test_unknown_at_most_one_encoding():
+    with pytest.raises(ValueError):
+        at_most_one([1, 2], VariableMap().new_var, 'unknown')
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_weighted_sum_at_most_value(seed):
+    rng = random.Random(seed)
+    n = rng.randint(1, 6)
+    variables = VariableMap(range(n))
+    weighted_literals = [(variables.var(item), rng.randint(1, 9)) for item in range(n)]
+    bits, clauses = weighted_sum(weighted_literals, variables.new_var)
+    literals = [literal for literal, _ in weighted_literals]
+    total = sum(weight for _, weight in weighted_literals)
+    for bound in range(total + 1):
+        guard = variables.new_var()
+        solver = solver_of(clauses + at_most_value(bits, bound, guard), literals + [guard])
+        for values, assumptions in assignments(literals):
+            value = sum(weight for (_, weight), chosen in zip(weighted_literals, values) if chosen)
+            # the comparator holds under the guard only
+            sat, model = solver.solve(assumptions + [guard])
+            assert sat == (value <= bound)
+            sat, model = solver.solve(assumptions)
+            assert sat and sum(1 << i for i, bit in enumerate(bits) if model[bit]) == value
+
+
+def optimum_graph(**kwargs):
+    """A 3.0, 2.0 and 1.0: 3.0 requires C >=1.0 which has no such version, 2.0 requires B and
+    1.0 requires B <1.0. The optimum is A 2.0 (rank 1) and B 1.0 (rank 0), cost 3."""
+    nodes = []
+    relationships = []
+    def package(name, versions):
+        node = KGNode(len(nodes), ['Package'], {'name': name})
+        nodes.append(node)
+        ret = [node]
+        for version in versions:
+            ret.append(KGNode(len(nodes), ['Version'], {'version': version, 'install_status': 'Success'}))
+            nodes.append(ret[-1])
+            relationships.append(KGRelationship(node, ret[-1], 'HAS_VERSION', {}))
+        return ret
+    a, a3, a2, a1 = package('A', ['3.0', '2.0', '1.0'])
+    b, _, _ = package('B', ['1.0', '0.0'])
+    c, _ = package('C', ['0.0'])
+    relationships.append(KGRelationship(a3, c, 'REQUIRES', {'requirement': '>=1.0'}))
+    relationships.append(KGRelationship(a2, b, 'REQUIRES', {'requirement': ''}))
+    relationships.append(KGRelationship(a1, b, 'REQUIRES', {'requirement': '<1.0'}))
+    return RequireGraph({'a': {'A': set()}}, [[nodes, relationships]], **kwargs)
+
+
+def brute_force_optimum(graph):
+    """The least objective over the assignments of the node variables of the CNF."""
+    variables = VariableMap(graph.degree_table)
+    clauses = [[variables.var(-1)]]
+    graph._get_cnf_clauses(variables, clauses, -1)
+    node_vars = list(range(1, len(graph.degree_table) + 1))
+    solver = solver_of(clauses, node_vars)
+    graph.variables = variables
+    best = None
+    for _, assumptions in assignments(node_vars):
+        sat, model = solver.solve(assumptions)
+        if sat:
+            cost = graph._objective(model)
+            best = cost if best is None else min(best, cost)
+    return best
+
+
+def test_optimize_sat_optimum():
+    assert brute_force_optimum(optimum_graph()) == 3
+    graph = optimum_graph(optimize_sat=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        sat_graph = graph._sat_solver()
+    assert graph.sat_stats['status'] == 'optimal' and graph.sat_stats['cost'] == 3
+    versions = dict((graph._get_node_name(list(sat_graph.in_table[nid])[0]), graph._get_node_name(nid))
+                    for nid in sat_graph.degree_table if graph.node_type[nid] == VERSION_TYPE)
+    assert versions == {'A': '2.0', 'B': '1.0'}
@@ -0,0 +1,113 @@
+import os
+import sys
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bin'))
+from run import QueryApplication
+from kg_cache import KGCache
+from service import InferenceService, InferenceServer
+from test_csv_transformer import write_data, build_kg
+
+
+PACKAGES = {
+    'fakepkg': {
+        '1.0': (True, ['helperpkg<2.0'], ['fakepkg', 'fakepkg.core'], [], {'fakepkg': ['VERSION'], 'fakepkg.core': ['run']}),
+        '2.0': (True, ['helperpkg>=2.0'], ['fakepkg', 'fakepkg.core'], [], {'fakepkg': ['VERSION'], 'fakepkg.core': ['run', 'stop']}),
+    },
+    'helperpkg': {
+        '1.0': (True, [], ['helperpkg'], [], {}),
+        '1.5': (True, [], ['helperpkg'], [], {}),
+        '2.0': (True, [], ['helperpkg'], [], {}),
+    },
+}
+
+DOCKERFILE = ('FROM python:3.8.11\n\n'
+              'RUN pip install --no-cache-dir --upgrade pip\n'
+              'COPY requirements.txt /\n'
+              'RUN pip install -r /requirements.txt\n\n'
+              'COPY snippet.py /snippets/snippet.py\n'
+              'CMD python /snippets/snippet.py')
+
+
+@pytest.fixture(scope='module')
+def service(tmp_path_factory):
+    work_dir = tmp_path_factory.mktemp('service')
+    write_data(str(work_dir / 'data'), PACKAGES)
+    for py_version in ('Python2', 'Python3'):
+        os.makedirs(str(work_dir / 'kg' / py_version))
+        build_kg(str(work_dir / 'data'), str(work_dir / 'kg' / py_version / 'csv-data'))
+    service = InferenceService(QueryApplication('inprocess', kg=str(work_dir / 'kg'), cache=KGCache()))
+    yield service
+    service.close()
+
+
+@pytest.fixture(scope='module')
+def server(service):
+    server = InferenceServer(('localhost', 0), service)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield 'http://localhost:{}'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def request(url, data=None):
+    """(status, JSON body) of a GET, or of a POST of data"""
+    try:
+        with urllib.request.urlopen(url, data=data, timeout=30) as response:
+            return response.status, json.loads(response.read().decode('utf-8'))
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read().decode('utf-8'))
+
+
+def test_infer(service):
+    # only fakepkg 2.0 has fakepkg.core.stop, pip picks helperpkg>=2.0 for it
+    ret = service.infer({'snippet': 'import fakepkg\nfakepkg.core.stop()\n'})
+    assert ret['python'] == '3.8.11'
+    assert ret['install_pairs'] == [('fakepkg', '2.0')]
+    assert ret['has_solution'] == 1
+    assert ret['requirements'] == 'fakepkg==2.0\n'
+    assert ret['dockerfile'] == DOCKERFILE
+
+
+def test_requirement_hint(service):
+    # helperpkg 1.0 is not the newest one of fakepkg 1.0's helperpkg<2.0, so it is installed explicitly
+    ret = service.infer({'snippet': 'import fakepkg\nfakepkg.core.run()\n', 'requirements': ['helperpkg==1.0']})
+    assert sorted(ret['install_pairs']) == [('fakepkg', '1.0'), ('helperpkg', '1.0')]
+    assert sorted(ret['requirements'].splitlines()) == ['fakepkg==1.0', 'helperpkg==1.0']
+    assert ret['dockerfile'] == DOCKERFILE
+
+
+@pytest.mark.parametrize('body', [{}, {'snippet': 1}, {'snippet': 'import fakepkg\n', 'requirements': ['not a requirement!']}])
+def test_bad_request(service, body):
+    with pytest.raises(ValueError):
+        service.infer(body)
+
+
+def test_server(server):
+    assert request(server + '/health') == (200, {'status': 'ok'})
+    status, ret = request(server + '/infer', json.dumps({'snippet': 'import fakepkg\nfakepkg.core.stop()\n'}).encode('utf-8'))
+    assert status == 200 and ret['requirements'] == 'fakepkg==2.0\n'
+    # the same lookups again, from the cache
+    status, ret = request(server + '/infer', json.dumps({'snippet': 'import fakepkg\nfakepkg.core.stop()\n'}).encode('utf-8'))
+    assert status == 200 and ret['install_pairs'] == [['fakepkg', '2.0']]
+    status, ret = request(server + '/stats')
+    assert status == 200 and ret['cache']['memory']['hits'] > 0 and ret['cache']['memory']['misses'] > 0
+
+
+@pytest.mark.parametrize('data', [b'{"snippet": ', b'[]', json.dumps({'snippet': None}).encode('utf-8'),
+                                  json.dumps({'snippet': 'import fakepkg\n', 'requirements': ['not a requirement!']}).encode('utf-8')])
+def test_server_bad_request(server, data):
+    status, ret = request(server + '/infer', data)
+    assert status == 400 and 'error' in ret
+
+
+def test_server_unknown_path(server):
+    assert request(server + '/nothing')[0] == 404
+    assert request(server + '/nothing', b'{}')[0] == 404
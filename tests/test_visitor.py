@@ -0,0 +1,111 @@
+import os
+import ast
+import sys
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'docker_env', 'python_parser'))
+from stdlib_index import load_stdlib_modules
+from visitor import ParserVisitor
+
+
+@pytest.mark.parametrize('python_version, name, expected', [
+    ('2.7', 'os', True),
+    ('2.7', 'os.path', True),
+    ('2.7', 'urllib2', True),
+    ('2.7', 'asyncio', False),
+    ('2.7', 'numpy', False),
+    ('3.6', 'asyncio', True),
+    ('3.8', 'os', True),
+    ('3.8', 'asyncio.tasks', True),
+    ('3.8', 'urllib2', False),
+    ('3.8', 'urllib.request', True),
+    ('3.8', 'numpy', False),
+    ('3.8', 'requests', False),
+    ('3.12', 'asyncio', True),
+    ('3.12', 'distutils', False),
+    ('3.12', 'numpy', False),
+])
+def test_standard_library(python_version, name, expected):
+    assert ParserVisitor(python_version).is_standard_library(name) == expected
+
+
+def test_stdlib_index_versions():
+    # a missing minor takes the newest older one, or the oldest one of the major version
+    assert load_stdlib_modules('3.99') == load_stdlib_modules('3.12')
+    assert load_stdlib_modules('3.0') == load_stdlib_modules('3.6')
+    assert 'distutils' in load_stdlib_modules('3.11')
+    with pytest.raises(ValueError):
+        load_stdlib_modules('4.0')
+
+
+class BaselineVisitor(ParserVisitor):
+    """The former attribute collection: a list of the used names, the latest first, scanned
+    for each chain of names."""
+    def __init__(self):
+        ParserVisitor.__init__(self, '3.8')
+        self.import_names = []
+
+    def add_import_name(self, name):
+        self.import_names.insert(0, name)
+
+    def visit_Attribute(self, node):
+        attr_name = self.get_variable_name(node)
+        if attr_name != '':
+            for name in self.import_names:
+                if attr_name.startswith('{}.'.format(name)):
+                    if name in self.mappings:
+                        resource_name = '{}{}'.format(self.mappings[name], attr_name[len(name):])
+                    else:
+                        resource_name = attr_name
+                    if not any(item.startswith('{}.'.format(resource_name)) for item in self.attrs):
+                        self.attrs.add(resource_name)
+                    break
+        self.generic_visit(node)
+
+    def get_variable_name(self, node):
+        parts, _ = self.get_variable_parts(node)
+        return '' if parts is None else '.'.join(parts)
+
+
+def collected_attrs(visitor, source):
+    visitor.visit(ast.parse(source))
+    return visitor.attrs
+
+
+SNIPPETS = [
+    # shadowed imports: the latest import of a name takes precedence
+    'import a\na.b.c\nimport x as a\na.b.c\nfrom p import q as a\na.r.s\n',
+    'import a.b\nimport a\na.b.c.d\na.e\n',
+    'from a import b\nimport b\nb.c.d\nfrom b import c\nc.d.e\n',
+    # long chains, and chains out of calls and subscripts
+    'import a\na.b.c.d.e.f.g.h\na.b.c\na.b.x().y.z\nf(a.b)[0].c.d\n',
+    'import a as z, b\nz.y.x.w.v.u.t.s.r.q.p.o.n.m.l.k.j.i.h.g.f.e.d.c.b.a\nb.a.z()\n',
+    'from a.b import c as d\nd.e.f.g\nd.e\n',
+]
+
+
+@pytest.mark.parametrize('source', SNIPPETS)
+def test_attrs_as_baseline(source):
+    assert collected_attrs(ParserVisitor('3.8'), source) == collected_attrs(BaselineVisitor(), source)
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_random_attrs_as_baseline(seed):
+    rng = random.Random(seed)
+    names = ['a', 'b', 'c', 'd']
+    lines = []
+    for _ in range(rng.randint(1, 20)):
+        chain = '.'.join(rng.choice(names) for _ in range(rng.randint(1, 6)))
+        kind = rng.random()
+        if kind < 0.2:
+            lines.append('import {}'.format(chain))
+        elif kind < 0.3:
+            lines.append('import {} as {}'.format(chain, rng.choice(names)))
+        elif kind < 0.4:
+            lines.append('from {} import {}'.format(chain, rng.choice(names)))
+        else:
+            lines.append(chain)
+    source = '\n'.join(lines) + '\n'
+    assert collected_attrs(ParserVisitor('3.8'), source) == collected_attrs(BaselineVisitor(), source)